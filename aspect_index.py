@@ -0,0 +1,122 @@
+import difflib
+import re
+import threading
+
+# The common aspects named in the analysis prompts, with the other names reviews use for them
+ASPECT_ALIASES = {
+    'display': ('screen', 'screens', 'resolution', 'visuals', 'visual quality', 'image quality', 'picture quality',
+                'micro oled', 'oled', 'display quality', 'graphics', 'clarity', 'brightness'),
+    'comfort': ('fit', 'ergonomics', 'strap', 'head strap', 'band', 'light seal', 'wearability',
+                'wearing comfort', 'face pressure'),
+    'price': ('cost', 'pricing', 'value for money', 'affordability', 'price point', 'price tag'),
+    'battery': ('battery life', 'battery pack', 'charging'),
+    'software': ('visionos', 'vision os', 'os', 'operating system', 'ui', 'user interface', 'interface',
+                 'updates', 'bugs', 'ios'),
+    'design': ('build quality', 'build', 'look', 'looks', 'aesthetics', 'materials', 'style', 'industrial design'),
+    'weight': ('heaviness', 'weight distribution', 'heft'),
+    'apps': ('app', 'applications', 'application', 'app store', 'app selection', 'app ecosystem'),
+    'performance': ('speed', 'responsiveness', 'lag', 'latency', 'processor', 'chip', 'm2 chip', 'smoothness'),
+    'field of view': ('fov', 'viewing angle'),
+}
+
+# Folded names at least this similar to a common aspect's name or alias are treated as a misspelling of it;
+# shorter names are only matched exactly, as one letter changes too much of them
+FUZZY_CUTOFF = 0.85
+FUZZY_MIN_LENGTH = 5
+
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+
+
+def _lemma(word):
+    """Crude plural folding: batteries -> battery, apps -> app, glasses -> glass"""
+    if len(word) <= 3:
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('sses'):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def fold(name):
+    """Lowercase, strip punctuation and fold plurals so spelling variants compare equal"""
+    words = _NON_WORD.sub(' ', str(name).lower().replace('-', ' ').replace('_', ' ')).split()
+    return ' '.join(_lemma(word) for word in words)
+
+
+class AspectIndex:
+    """Maps free-text aspect names to compact integer ids of canonical aspects.
+
+    Names are folded (case, punctuation, plurals) and looked up among the alias table
+    and the aspects seen so far; failing that, names of five or more letters are
+    fuzzy-matched against the common aspects and their aliases only. Anything still
+    unmatched becomes a new canonical aspect, shown under the name it was first seen
+    with, lowercased. Every raw name's id is memoized, so after the first sighting
+    normalizing a name is a single dict lookup. A name with no letters or digits has
+    no id and is dropped from aspect lists.
+    """
+
+    def __init__(self, aliases=ASPECT_ALIASES):
+        self.lock = threading.Lock()
+        self.names = []
+        # folded name -> aspect id, for canonical names and aliases
+        self.folded = {}
+        # raw name -> aspect id
+        self.memo = {}
+        for canonical, alias_names in aliases.items():
+            aspect_id = self._add(canonical)
+            for alias in alias_names:
+                self.folded.setdefault(fold(alias), aspect_id)
+        # Only the common aspects are fuzzy-matched; names first seen in reviews must match exactly
+        self.seeded = list(self.folded)
+
+    def _add(self, canonical):
+        aspect_id = len(self.names)
+        # Shown as written, lowercased; folding is only for matching ("macos", not "maco")
+        self.names.append(' '.join(canonical.lower().split()))
+        self.folded[fold(canonical)] = aspect_id
+        return aspect_id
+
+    def id_for(self, name):
+        if not isinstance(name, str):
+            name = str(name)
+        aspect_id = self.memo.get(name)
+        if aspect_id is not None:
+            return aspect_id
+        with self.lock:
+            key = fold(name)
+            if not key:
+                return None
+            aspect_id = self.folded.get(key)
+            if aspect_id is None:
+                close = []
+                if len(key) >= FUZZY_MIN_LENGTH:
+                    close = difflib.get_close_matches(key, self.seeded, n=1, cutoff=FUZZY_CUTOFF)
+                aspect_id = self.folded[close[0]] if close else self._add(name)
+                self.folded[key] = aspect_id
+            self.memo[name] = aspect_id
+            return aspect_id
+
+    def name(self, aspect_id):
+        return self.names[aspect_id]
+
+    def canonical(self, name):
+        """The canonical name for a free-text aspect name, or None for a blank one"""
+        aspect_id = self.id_for(name)
+        return None if aspect_id is None else self.names[aspect_id]
+
+    def normalize(self, aspects):
+        """A result's aspect list with canonical names, keeping the first mention of each aspect and sentiment"""
+        normalized = []
+        seen = set()
+        for a in aspects or []:
+            if not isinstance(a, dict):
+                continue
+            aspect = self.canonical(a.get('aspect', ''))
+            sentiment = str(a.get('sentiment', 'neutral')).lower()
+            if aspect is not None and (aspect, sentiment) not in seen:
+                seen.add((aspect, sentiment))
+                normalized.append({'aspect': aspect, 'sentiment': sentiment})
+        return normalized
@@ -0,0 +1,121 @@
+import json
+import threading
+
+from request_scheduler import estimate_tokens
+from response_parsing import recover_json, validate_fused_item, validate_sentiment_item
+
+BATCH_SENTIMENT_PROMPT = """You are a sentiment analysis expert. You will receive a JSON list of Apple Vision Pro reviews, each with an "id" and a "text". Classify the overall sentiment of every review.
+
+Return ONLY a valid JSON object keyed by review id with this exact format:
+{"12": {"sentiment": "POSITIVE", "confidence": 0.9}, "13": {"sentiment": "NEGATIVE", "confidence": 0.7}}
+
+sentiment must be POSITIVE, NEGATIVE or NEUTRAL and confidence a number between 0 and 1. Include every id exactly once."""
+
+BATCH_FUSED_PROMPT = """You are a sentiment analysis expert. You will receive a JSON list of Apple Vision Pro reviews, each with an "id" and a "text". For every review determine the overall sentiment and extract the key aspects/features it mentions, indicating if each is mentioned positively, negatively or neutrally.
+
+Return ONLY a valid JSON object keyed by review id with this exact format:
+{"12": {"sentiment": "POSITIVE", "confidence": 0.9, "aspects": [{"aspect": "display", "sentiment": "positive"}, {"aspect": "price", "sentiment": "negative"}]}}
+
+sentiment must be POSITIVE, NEGATIVE or NEUTRAL and confidence a number between 0 and 1. Include every id exactly once.
+Common aspects: display, comfort, price, battery, software, design, weight, apps, performance, field of view"""
+
+# Completion tokens reserved per review in a batch response
+OUTPUT_TOKENS_PER_REVIEW = {'sentiment': 20, 'fused': 90}
+
+
+class BatchClassifier:
+    """Packs several reviews into one request and parses back a JSON object keyed by review id.
+
+    complete(messages, max_tokens) sends one request and returns the response text;
+    fallback(review_text) analyzes a single review the normal way and returns None
+    if that failed too, which is passed on as that review's result. Batches with
+    missing or malformed items are split in half and retried, down to single reviews.
+    on_parsed(review_text, result), if given, is called for every item validated
+    from a batch response, and on_invalid(count) for every response with count
+    missing or malformed items, from the thread that made the request.
+    """
+
+    def __init__(self, complete, fallback, with_aspects=True, token_budget=2000, max_batch_size=40,
+                 max_output_tokens=4000, on_parsed=None, on_invalid=None):
+        self.complete = complete
+        self.fallback = fallback
+        self.on_parsed = on_parsed
+        self.on_invalid = on_invalid
+        self.with_aspects = with_aspects
+        self.token_budget = token_budget
+        self.max_batch_size = max(1, max_batch_size)
+        self.kind = 'fused' if with_aspects else 'sentiment'
+        self.prompt = BATCH_FUSED_PROMPT if with_aspects else BATCH_SENTIMENT_PROMPT
+        self.output_per_review = OUTPUT_TOKENS_PER_REVIEW[self.kind]
+        # Keep the response budget within what the model can return
+        self.max_batch_size = min(self.max_batch_size, max(1, max_output_tokens // self.output_per_review))
+        self.lock = threading.Lock()
+        self.stats = {'batches': 0, 'splits': 0, 'single_fallbacks': 0}
+
+    def iter_batches(self, reviews):
+        """Group an iterable of (review_id, text) pairs so each batch's review text fits the token budget"""
+        batch, batch_tokens = [], 0
+        for review_id, text in reviews:
+            tokens = estimate_tokens(text) + 8
+            if batch and (batch_tokens + tokens > self.token_budget or len(batch) >= self.max_batch_size):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append((review_id, text))
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def make_batches(self, reviews):
+        return list(self.iter_batches(reviews))
+
+    def build_messages(self, batch):
+        payload = json.dumps([{"id": str(review_id), "text": text} for review_id, text in batch],
+                             ensure_ascii=False)
+        return [
+            {"role": "system", "content": self.prompt},
+            {"role": "user", "content": payload}
+        ]
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def classify_batch(self, batch):
+        """Return one result tuple per (review_id, text) in batch, in batch order"""
+        if len(batch) == 1:
+            self._count('single_fallbacks')
+            return [self.fallback(batch[0][1])]
+
+        self._count('batches')
+        content = None
+        try:
+            content = self.complete(self.build_messages(batch), self.output_per_review * len(batch) + 20)
+            # Items completed before a cut-off are kept; only the missing ones are retried
+            parsed = recover_json(content)
+            if not isinstance(parsed, dict):
+                parsed = {}
+        except Exception:
+            parsed = {}
+
+        validate = validate_fused_item if self.with_aspects else validate_sentiment_item
+        results = {}
+        failed = []
+        for review_id, text in batch:
+            try:
+                results[review_id] = validate(parsed[str(review_id)])
+            except (KeyError, ValueError):
+                failed.append((review_id, text))
+                continue
+            if self.on_parsed:
+                self.on_parsed(text, results[review_id])
+
+        if failed:
+            self._count('splits')
+            if self.on_invalid and content is not None:
+                self.on_invalid(len(failed))
+            half = (len(failed) + 1) // 2
+            for part in (failed[:half], failed[half:]):
+                if part:
+                    for (review_id, _), result in zip(part, self.classify_batch(part)):
+                        results[review_id] = result
+        return [results[review_id] for review_id, _ in batch]
@@ -0,0 +1,98 @@
+"""View refresh time as the result count grows: rescanning every result versus the running aggregates.
+
+A refresh is what the Results and Visualizations tabs do: the summary, the three
+chart datasets and the recommendations report.
+
+Usage: python benchmarks/bench_aggregation.py [--sizes 1000 10000 100000 1000000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from result_aggregates import ResultAggregates
+from sentiment_engine import build_summary, build_recommendations
+
+ASPECTS = ("display comfort price battery software design weight apps performance field-of-view "
+           "sound setup passthrough eye-tracking hand-tracking").split()
+SENTIMENTS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL')
+ASPECT_SENTIMENTS = ('positive', 'negative', 'neutral')
+
+
+def make_results(count, seed=7):
+    rng = random.Random(seed)
+    return [{
+        'review_id': i,
+        'sentiment': rng.choice(SENTIMENTS),
+        'confidence': rng.random(),
+        'aspects': [{'aspect': rng.choice(ASPECTS), 'sentiment': rng.choice(ASPECT_SENTIMENTS)}
+                    for _ in range(rng.randint(0, 4))]
+    } for i in range(count)]
+
+
+def rescan_refresh(results):
+    """The previous approach: every view rebuilds its own Counters from the full result list"""
+    # update_summary
+    sentiment_counts = Counter(r['sentiment'] for r in results)
+    all_aspects = [a.get('aspect', '') for r in results for a in r.get('aspects', [])]
+    Counter(all_aspects).most_common(5)
+    # plot_sentiment_distribution
+    Counter(r['sentiment'] for r in results)
+    # plot_aspect_frequency
+    Counter(a.get('aspect', '') for r in results for a in r.get('aspects', [])).most_common(10)
+    # plot_aspect_sentiment
+    aspect_sentiments = {}
+    for r in results:
+        for a in r.get('aspects', []):
+            counts = aspect_sentiments.setdefault(a.get('aspect', ''), {})
+            counts[a.get('sentiment', 'neutral')] = counts.get(a.get('sentiment', 'neutral'), 0) + 1
+    sorted(aspect_sentiments.items(), key=lambda x: sum(x[1].values()), reverse=True)[:10]
+    # generate_recommendations
+    positive = Counter(a['aspect'] for r in results for a in r['aspects'] if a['sentiment'] == 'positive')
+    negative = Counter(a['aspect'] for r in results for a in r['aspects'] if a['sentiment'] == 'negative')
+    positive.most_common(5), negative.most_common(5), sentiment_counts
+
+
+def aggregate_refresh(aggregates):
+    build_summary(aggregates)
+    aggregates.sentiment_counts()
+    aggregates.top_aspects(10)
+    aggregates.top_aspect_sentiments(10)
+    build_recommendations(aggregates)
+
+
+def best_of(repeat, func, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'results':>10} {'rescan ms':>11} {'aggregates ms':>14} {'update us':>10}")
+    for size in args.sizes:
+        results = make_results(size)
+        aggregates = ResultAggregates()
+        start = time.perf_counter()
+        for r in results:
+            aggregates.update(r['review_id'], r['sentiment'], r['confidence'], r['aspects'])
+        per_update = (time.perf_counter() - start) / size
+
+        rescan = best_of(args.repeat, rescan_refresh, results)
+        incremental = best_of(args.repeat, aggregate_refresh, aggregates)
+        print(f"{size:>10,} {rescan * 1000:>11.2f} {incremental * 1000:>14.3f} {per_update * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
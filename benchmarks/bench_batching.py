@@ -0,0 +1,127 @@
+"""Cost and wall-clock per 1,000 reviews at different batch sizes, against a simulated model.
+
+The simulated model answers batch prompts with keyed JSON, drops or garbles a
+configurable fraction of items (exercising split-and-retry) and sleeps for a
+latency that grows with the number of output tokens.
+
+Usage: python benchmarks/bench_batching.py [--db feedback.db] [--concurrency 8] [--malformed-rate 0.02]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from batch_classifier import BatchClassifier, BATCH_FUSED_PROMPT
+from request_scheduler import RequestScheduler, estimate_tokens
+
+# gpt-3.5-turbo list prices in USD per 1M tokens
+INPUT_PRICE = 0.50
+OUTPUT_PRICE = 1.50
+
+SAMPLE_REVIEWS = [
+    "The display is stunning and the apps are fun, but the price is far too high.",
+    "Comfortable for the first hour, then the weight on my face becomes a problem.",
+    "Battery life is short. I need the cable plugged in for anything longer than a movie.",
+    "Best media device I own. Field of view could be wider, but I love it.",
+]
+
+
+def load_reviews(db_path, count):
+    texts = []
+    if db_path and os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        texts = [row[0] for row in conn.execute("SELECT review_text FROM reviews")]
+        conn.close()
+    texts = texts or SAMPLE_REVIEWS
+    return [(i + 1, texts[i % len(texts)]) for i in range(count)]
+
+
+class SimulatedModel:
+    def __init__(self, base_latency, per_token_latency, malformed_rate, time_scale):
+        self.base_latency = base_latency
+        self.per_token_latency = per_token_latency
+        self.malformed_rate = malformed_rate
+        self.time_scale = time_scale
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def _charge(self, messages, content):
+        input_tokens = estimate_tokens(*(m["content"] for m in messages))
+        output_tokens = estimate_tokens(content)
+        with self.lock:
+            self.requests += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+        time.sleep((self.base_latency + output_tokens * self.per_token_latency) * self.time_scale)
+
+    def _item(self):
+        return {"sentiment": random.choice(["POSITIVE", "NEGATIVE", "NEUTRAL"]),
+                "confidence": round(random.uniform(0.5, 1.0), 2),
+                "aspects": [{"aspect": "display", "sentiment": "positive"},
+                            {"aspect": "price", "sentiment": "negative"}]}
+
+    def complete(self, messages, max_tokens):
+        result = {}
+        for review in json.loads(messages[-1]["content"]):
+            roll = random.random()
+            if roll < self.malformed_rate / 2:
+                continue
+            result[review["id"]] = {"sentiment": "MAYBE"} if roll < self.malformed_rate else self._item()
+        content = json.dumps(result)
+        self._charge(messages, content)
+        return content
+
+    def single(self, review_text):
+        messages = [{"role": "system", "content": BATCH_FUSED_PROMPT},
+                    {"role": "user", "content": review_text}]
+        item = self._item()
+        self._charge(messages, json.dumps(item))
+        return item["sentiment"], item["confidence"], item["aspects"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='feedback.db')
+    parser.add_argument('--reviews', type=int, default=1000)
+    parser.add_argument('--sizes', default="1,5,10,20,40")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--malformed-rate', type=float, default=0.02)
+    parser.add_argument('--base-latency', type=float, default=0.4, help="seconds per request")
+    parser.add_argument('--per-token-latency', type=float, default=0.01, help="seconds per output token")
+    parser.add_argument('--time-scale', type=float, default=0.05, help="shrink simulated sleeps to keep the run short")
+    args = parser.parse_args()
+
+    reviews = load_reviews(args.db, args.reviews)
+    model = SimulatedModel(args.base_latency, args.per_token_latency, args.malformed_rate, args.time_scale)
+    per_1000 = 1000.0 / len(reviews)
+
+    print(f"{len(reviews)} reviews, concurrency {args.concurrency}, {args.malformed_rate:.0%} malformed items")
+    print(f"{'max batch':>9} {'requests':>9} {'in tok':>9} {'out tok':>9} {'$/1k':>8} {'sec/1k':>8}")
+    for size in [int(x) for x in args.sizes.split(',')]:
+        model.reset()
+        scheduler = RequestScheduler(concurrency=args.concurrency, requests_per_minute=None, tokens_per_minute=None)
+        classifier = BatchClassifier(model.complete, model.single, with_aspects=True, max_batch_size=size)
+        start = time.perf_counter()
+        if size <= 1:
+            scheduler.map(model.single, [text for _, text in reviews])
+        else:
+            scheduler.map(classifier.classify_batch, classifier.make_batches(reviews))
+        elapsed = (time.perf_counter() - start) / args.time_scale
+        cost = (model.input_tokens * INPUT_PRICE + model.output_tokens * OUTPUT_PRICE) / 1e6
+        print(f"{size:>9} {model.requests:>9} {model.input_tokens:>9} {model.output_tokens:>9} "
+              f"{cost * per_1000:>8.4f} {elapsed * per_1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
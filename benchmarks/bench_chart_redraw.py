@@ -0,0 +1,120 @@
+"""Redraw latency and memory growth of the Visualizations charts over repeated redraws.
+
+Fills running aggregates with synthetic results, then redraws each chart many times
+while the counts change, as a live-updating run would: once the old way (a new pyplot
+figure and canvas per redraw, never closed) and once with ChartManager updating one
+figure in place. Renders off-screen with the Agg canvas, so no display is needed.
+
+Usage: python benchmarks/bench_chart_redraw.py [--redraws 100] [--reviews 5000]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import matplotlib
+matplotlib.use('Agg')
+# The figure count column shows the pyplot leak; its warning would only repeat it
+matplotlib.rcParams['figure.max_open_warning'] = 0
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from chart_manager import CHART_KINDS, ChartManager, chart_data
+from result_aggregates import ResultAggregates
+
+ASPECTS = ['display', 'comfort', 'price', 'battery', 'software', 'design', 'weight', 'apps', 'performance',
+           'field of view', 'audio', 'passthrough', 'eye tracking', 'setup', 'movies']
+SENTIMENTS = ['POSITIVE', 'NEGATIVE', 'NEUTRAL']
+
+
+def add_results(aggregates, rng, start, count):
+    for review_id in range(start, start + count):
+        aspects = [{"aspect": aspect, "sentiment": rng.choice(SENTIMENTS).lower()}
+                   for aspect in rng.sample(ASPECTS, rng.randint(1, 4))]
+        aggregates.update(review_id, rng.choice(SENTIMENTS), rng.random(), aspects)
+
+
+def old_redraw(kind, aggregates):
+    """What the Visualizations tab used to do per chart: a fresh pyplot figure every time"""
+    data = chart_data(kind, aggregates)
+    fig, ax = plt.subplots(figsize=(10, 6))
+    if kind == 'sentiment':
+        bars = ax.bar([label for label, _ in data], [count for _, count in data], edgecolor='black', linewidth=1.5)
+        for bar in bars:
+            ax.text(bar.get_x() + bar.get_width() / 2., bar.get_height(), f'{int(bar.get_height())}',
+                    ha='center', va='bottom', fontweight='bold')
+    elif kind == 'aspect_frequency':
+        ax.barh([aspect for aspect, _ in data], [count for _, count in data], color='#2196F3')
+        ax.invert_yaxis()
+    else:
+        positions = range(len(data))
+        for offset, column in ((-0.25, 1), (0, 2), (0.25, 3)):
+            ax.bar([i + offset for i in positions], [row[column] for row in data], 0.25)
+        ax.set_xticks(positions)
+        ax.set_xticklabels([row[0] for row in data], rotation=45, ha='right')
+        ax.legend(['Positive', 'Negative', 'Neutral'])
+    plt.tight_layout()
+    FigureCanvasAgg(fig).draw()
+
+
+def redraw_all(redraws, step, redraw):
+    rng = random.Random(20)
+    aggregates = ResultAggregates()
+    add_results(aggregates, rng, 0, step)
+    redraw(0, aggregates)
+    times = []
+    for i in range(redraws):
+        add_results(aggregates, rng, (i + 1) * step, step)
+        start = time.perf_counter()
+        redraw(i, aggregates)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def measure(label, redraws, step, redraw, reset):
+    # Timed without tracemalloc, which slows every allocation; memory is traced on a second pass
+    times = sorted(redraw_all(redraws, step, redraw))
+    figures = len(plt.get_fignums())
+    reset()
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    redraw_all(redraws, step, redraw)
+    gc.collect()
+    grown = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    reset()
+    print(f"{label:>13} {sum(times) / len(times) * 1000:>9.1f} {times[len(times) // 2] * 1000:>9.1f} "
+          f"{times[int(len(times) * 0.95)] * 1000:>9.1f} {grown / 1024 / 1024:>11.1f} {figures:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--redraws', type=int, default=100)
+    parser.add_argument('--reviews', type=int, default=5000, help="results added between redraws, in total")
+    args = parser.parse_args()
+    step = max(1, args.reviews // args.redraws)
+
+    print(f"{args.redraws} redraws cycling {', '.join(CHART_KINDS)} charts, {step} results added before each\n")
+    print(f"{'approach':>13} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'grown MB':>11} {'figures':>8}")
+
+    figure = Figure(figsize=(10, 6))
+    charts = ChartManager(figure, FigureCanvasAgg(figure).draw, min_interval=0)
+    close_all = lambda: plt.close('all')
+    # Same chart each redraw, as the live refresh does during a run
+    measure('new figure', args.redraws, step, lambda i, aggregates: old_redraw('sentiment', aggregates), close_all)
+    measure('in place', args.redraws, step, lambda i, aggregates: charts.show('sentiment', aggregates), charts.close)
+    # Switching to another chart on every redraw
+    measure('new, switch', args.redraws, step,
+            lambda i, aggregates: old_redraw(CHART_KINDS[i % len(CHART_KINDS)], aggregates), close_all)
+    measure('reuse, switch', args.redraws, step,
+            lambda i, aggregates: charts.show(CHART_KINDS[i % len(CHART_KINDS)], aggregates), charts.close)
+
+if __name__ == '__main__':
+    main()
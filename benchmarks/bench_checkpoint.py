@@ -0,0 +1,102 @@
+"""Cost of checkpointing results to the store: per-review write time and throughput at high concurrency.
+
+Part 1 times ResultsStore.save_results per review for several checkpoint sizes,
+with the rollback journal and with WAL. Part 2 runs a sentiment analysis through
+the engine against the mock backend with fixed latency, once with checkpointing and
+once with saving switched off, and compares reviews per second.
+
+Usage: python benchmarks/bench_checkpoint.py [--reviews 5000] [--concurrency 64] [--latency 0.05]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import sentiment_engine
+from model_backends import MockBackend
+from results_store import ResultsStore
+from review_source import ReviewSource
+
+WORDS = "the display is great but the headset is heavy and the price is too high for most people".split()
+
+
+def make_database(path, count, seed=5):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE reviews (id INTEGER PRIMARY KEY AUTOINCREMENT, review_text TEXT NOT NULL)")
+    conn.executemany("INSERT INTO reviews (review_text) VALUES (?)",
+                     [(' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))),) for _ in range(count)])
+    conn.commit()
+    conn.close()
+
+
+def time_saves(path, count, batch_size, journal_mode):
+    source = ReviewSource(path, 'reviews', 'review_text')
+    store = ResultsStore(source)
+    store.conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    run_id = store.start_run('sentiment', count, {})
+    reviews = [review for chunk in source.iter_chunks() for review in chunk][:count]
+    rows = [(review_id, text, 'POSITIVE', 0.9, None, 'api') for review_id, text in reviews]
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        store.save_results(rows[i:i + batch_size], run_id)
+    elapsed = time.perf_counter() - start
+    store.close()
+    return elapsed / len(rows)
+
+
+def run_throughput(path, concurrency, latency, checkpoint):
+    engine = sentiment_engine.AnalysisEngine(backend=MockBackend(latency=latency, latency_distribution='fixed'))
+    engine.configure(concurrency=concurrency, requests_per_minute=0, tokens_per_minute=0, incremental=False)
+    engine.open_database(path, use_cache=False)
+    if not checkpoint:
+        engine.save_results = lambda rows: None
+    start = time.perf_counter()
+    analyzed = engine.run_sentiment_analysis()
+    elapsed = time.perf_counter() - start
+    engine.close()
+    return analyzed / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reviews', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per mock API call")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        template = os.path.join(workdir, 'template.db')
+        make_database(template, args.reviews)
+
+        print(f"{'journal':>8} {'batch':>6} {'us/review':>10}")
+        for journal_mode in ('delete', 'wal'):
+            for batch_size in (1, 10, sentiment_engine.CHECKPOINT_ROWS, 200):
+                path = os.path.join(workdir, f'{journal_mode}_{batch_size}.db')
+                shutil.copy(template, path)
+                per_review = time_saves(path, args.reviews, batch_size, journal_mode)
+                print(f"{journal_mode:>8} {batch_size:>6} {per_review * 1e6:>10.1f}")
+
+        budget = args.latency / args.concurrency
+        print(f"\nAt concurrency {args.concurrency} and {args.latency * 1000:.0f} ms per call a review "
+              f"completes every {budget * 1e6:.0f} us")
+        rates = {}
+        for checkpoint in (False, True):
+            path = os.path.join(workdir, f'run_{checkpoint}.db')
+            shutil.copy(template, path)
+            rates[checkpoint] = run_throughput(path, args.concurrency, args.latency, checkpoint)
+        print(f"Without saving: {rates[False]:.0f} reviews/s")
+        print(f"Checkpointing:  {rates[True]:.0f} reviews/s ({rates[True] / rates[False] - 1:+.1%})")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
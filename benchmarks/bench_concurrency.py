@@ -0,0 +1,93 @@
+"""Throughput of the request scheduler against a local fake chat-completions server.
+
+Usage: python benchmarks/bench_concurrency.py [--requests 200] [--latency 0.05] [--error-rate 0.05]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from request_scheduler import RequestScheduler
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def make_handler(latency, error_rate):
+    class FakeCompletionsHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(random.uniform(latency * 0.5, latency * 1.5))
+            roll = random.random()
+            if roll < error_rate:
+                self.send_response(429 if roll < error_rate / 2 else 503)
+                self.end_headers()
+                return
+            body = json.dumps({
+                "choices": [{"message": {"role": "assistant", "content": "POSITIVE 0.9"}}],
+                "usage": {"prompt_tokens": 60, "completion_tokens": 3, "total_tokens": 63}
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return FakeCompletionsHandler
+
+
+def post_completion(url, review_text):
+    payload = json.dumps({"model": "gpt-3.5-turbo",
+                          "messages": [{"role": "user", "content": review_text}]}).encode()
+    request = urllib.request.Request(url, data=payload, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise FakeAPIError(e.code)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help="mean server latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.05, help="fraction of 429/503 responses")
+    parser.add_argument('--levels', default="1,2,4,8,16,32")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(args.latency, args.error_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+    reviews = [f"review {i}: the display is great but the price is high" for i in range(args.requests)]
+    print(f"{args.requests} requests, ~{args.latency * 1000:.0f} ms latency, {args.error_rate:.0%} errors")
+    print(f"{'concurrency':>12} {'seconds':>9} {'req/s':>9}")
+    for level in [int(x) for x in args.levels.split(',')]:
+        scheduler = RequestScheduler(concurrency=level, requests_per_minute=None,
+                                     tokens_per_minute=None, base_delay=0.05, max_delay=1.0)
+        start = time.perf_counter()
+        results = scheduler.map(lambda text: scheduler.call(lambda: post_completion(url, text)), reviews)
+        elapsed = time.perf_counter() - start
+        assert len(results) == len(reviews)
+        print(f"{level:>12} {elapsed:>9.2f} {len(reviews) / elapsed:>9.1f}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
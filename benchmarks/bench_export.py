@@ -0,0 +1,127 @@
+"""Export throughput and peak memory: one pretty-printed JSON document versus the streaming exporters.
+
+Builds a synthetic reviews database with a stored result for every review, then
+exports all results in each format in its own subprocess, so peak RSS is measured
+independently: the previous export (a list of every result, json.dump with indent=2),
+streamed JSON, JSON Lines, Parquet (when pyarrow is installed), a table in a new
+SQLite database, and a write-back into the reviews database.
+
+Usage: python benchmarks/bench_export.py [--rows 1000000] [--db /tmp/bench_export.db]
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from result_exporters import parquet_available, write_json, write_jsonl, write_parquet, write_sqlite
+from results_store import ResultsStore
+from review_source import ReviewSource
+
+MODES = ('json-indent', 'json', 'jsonl', 'parquet', 'sqlite', 'write-back')
+EXTENSIONS = {'json-indent': '.json', 'json': '.json', 'jsonl': '.jsonl', 'parquet': '.parquet', 'sqlite': '.db'}
+WORDS = ("display comfort price battery software design weight apps performance field of view "
+         "amazing terrible heavy sharp immersive expensive great poor love hate the is a and but").split()
+ASPECTS = "display comfort price battery software design weight apps performance".split()
+SENTIMENTS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL')
+
+
+def build_database(path, rows):
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+        try:
+            existing = conn.execute("SELECT COUNT(*) FROM analysis_results").fetchone()[0]
+        except sqlite3.OperationalError:
+            existing = None
+        conn.close()
+        if existing == rows:
+            return
+        os.remove(path)
+    print(f"Building {rows:,} synthetic reviews and results in {path}...")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE reviews (id INTEGER PRIMARY KEY AUTOINCREMENT, review_text TEXT NOT NULL)")
+    rng = random.Random(22)
+    for start in range(0, rows, 10000):
+        conn.executemany("INSERT INTO reviews (review_text) VALUES (?)",
+                         [(" ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 45))),)
+                          for _ in range(min(10000, rows - start))])
+    conn.commit()
+    conn.close()
+    store = ResultsStore(ReviewSource(path, 'reviews', 'review_text'))
+    for start in range(0, rows, 10000):
+        store.save_results([
+            (review_id, "", rng.choice(SENTIMENTS), round(rng.random(), 2),
+             [{"aspect": rng.choice(ASPECTS), "sentiment": rng.choice(SENTIMENTS).lower()}
+              for _ in range(rng.randint(0, 5))], 'api')
+            for review_id in range(start + 1, min(start + 10000, rows) + 1)])
+    store.close()
+
+
+def run_export(mode, db_path, output):
+    store = ResultsStore(ReviewSource(db_path, 'reviews', 'review_text'))
+    try:
+        results = store.iter_results_with_text(raw_aspects=mode not in ('json-indent', 'parquet'))
+        if mode == 'json-indent':
+            everything = list(results)
+            with open(output, 'w') as f:
+                json.dump(everything, f, indent=2)
+            return len(everything)
+        if mode == 'json':
+            return write_json(results, output)
+        if mode == 'jsonl':
+            return write_jsonl(results, output)
+        if mode == 'parquet':
+            return write_parquet(results, output)
+        if mode == 'sqlite':
+            return write_sqlite(results, output, 'sentiment_results')
+        return write_sqlite(results, db_path, 'sentiment_results', with_text=False)
+    finally:
+        store.close()
+
+
+def child(mode, db_path):
+    workdir = tempfile.mkdtemp()
+    output = os.path.join(workdir, 'results' + EXTENSIONS.get(mode, ''))
+    try:
+        start = time.perf_counter()
+        count = run_export(mode, db_path, output)
+        elapsed = time.perf_counter() - start
+        size_mb = os.path.getsize(output) / 1024 / 1024 if os.path.exists(output) else 0
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{mode:>11} {count:>10,} {elapsed:>9.1f} {count / elapsed:>10,.0f} {size_mb:>9.1f} {peak_mb:>12.1f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--db', default=os.path.join('/tmp', 'bench_export.db'))
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.db)
+        return
+
+    build_database(args.db, args.rows)
+    print(f"{'mode':>11} {'results':>10} {'seconds':>9} {'results/s':>10} {'output MB':>9} {'peak RSS MB':>12}")
+    sys.stdout.flush()
+    for mode in args.modes:
+        if mode == 'parquet' and not parquet_available():
+            print(f"{mode:>11} skipped: pyarrow is not installed")
+            continue
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, '--db', args.db], check=True)
+
+
+if __name__ == '__main__':
+    main()
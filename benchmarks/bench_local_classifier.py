@@ -0,0 +1,98 @@
+"""Local pre-classifier report: agreement with the API, API calls avoided and end-to-end speedup.
+
+Uses the sentiments the API has already stored in a reviews database (run a
+sentiment or full analysis first). Each review is scored by a model trained on
+the other folds, so agreement is measured on reviews the model has not seen.
+The speedup compares the measured local scoring time plus API time for escalated
+reviews against sending every review to the API. The last line is the threshold
+training calibrates, which the 'calibrated' setting uses.
+
+Usage: python benchmarks/bench_local_classifier.py [--db feedback.db] [--folds 5] [--api-seconds 0.1]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from local_classifier import CALIBRATION_AGREEMENT, LocalClassifier, calibrate_threshold
+from sentiment_engine import find_review_table
+from review_source import ReviewSource
+from results_store import ResultsStore
+
+THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95)
+
+
+def load_labels(db_path):
+    table_name, columns = find_review_table(db_path)
+    store = ResultsStore(ReviewSource(db_path, table_name, columns[-1]))
+    try:
+        return [(r['review_text'], r['sentiment']) for r in store.iter_results_with_text() if r['labeled_by'] == 'api']
+    finally:
+        store.close()
+
+
+def cross_validate(examples, folds, seed=3):
+    """[(api label, predicted label, confidence)] with each review scored by a model that never saw it"""
+    examples = list(examples)
+    random.Random(seed).shuffle(examples)
+    scored = []
+    train_seconds = predict_seconds = 0.0
+    for fold in range(folds):
+        held_out = examples[fold::folds]
+        training = [example for i, example in enumerate(examples) if i % folds != fold]
+        model = LocalClassifier()
+        start = time.perf_counter()
+        model.train([text for text, _ in training], [label for _, label in training])
+        train_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        predictions = model.predict_batch([text for text, _ in held_out])
+        predict_seconds += time.perf_counter() - start
+        scored.extend((label, predicted, confidence) for (_, label), (predicted, confidence) in zip(held_out, predictions))
+    return scored, train_seconds / folds, predict_seconds / len(examples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='feedback.db')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--api-seconds', type=float, default=0.1,
+                        help="wall-clock API time per review at your concurrency (latency / concurrent requests)")
+    args = parser.parse_args()
+
+    examples = load_labels(args.db)
+    if len(examples) < args.folds * 2:
+        sys.exit(f"Only {len(examples)} API-labeled reviews in {args.db}; run a sentiment analysis first")
+
+    scored, train_seconds, local_seconds = cross_validate(examples, args.folds)
+    total = len(scored)
+    overall = sum(1 for label, predicted, _ in scored if label == predicted) / total
+    print(f"{total} API-labeled reviews, {args.folds}-fold cross-validation")
+    print(f"Training: {train_seconds * 1000:.1f} ms per model; scoring: {local_seconds * 1e6:.0f} us per review")
+    print(f"Agreement with the API on all reviews: {overall:.1%}\n")
+
+    api_only = total * args.api_seconds
+    print(f"{'threshold':>9} {'answered locally':>17} {'agreement':>10} {'final agreement':>16} {'speedup':>8}")
+    for threshold in THRESHOLDS:
+        local = [(label, predicted) for label, predicted, confidence in scored if confidence >= threshold]
+        agreement = (f"{sum(1 for label, predicted in local if label == predicted) / len(local):.1%}"
+                     if local else "-")
+        # Escalated reviews get the API's own label, so only local mistakes reduce final agreement
+        final = 1 - sum(1 for label, predicted in local if label != predicted) / total
+        tiered = total * local_seconds + (total - len(local)) * args.api_seconds
+        print(f"{threshold:>9.2f} {len(local) / total:>16.1%} {agreement:>10} {final:>16.1%} "
+              f"{api_only / tiered:>7.1f}x")
+
+    texts, labels = [text for text, _ in examples], [label for _, label in examples]
+    threshold, coverage, agreement = calibrate_threshold(texts, labels)
+    if threshold is None:
+        print(f"\nCalibrated: no threshold keeps {CALIBRATION_AGREEMENT:.0%} agreement; every review goes to the API")
+    else:
+        print(f"\nCalibrated: threshold {threshold:.2f} answers {coverage:.1%} locally "
+              f"with {agreement:.1%} agreement")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Offline load test of the full pipeline against the mock backend: scheduler, retries, parsing and the cache.
+
+Builds a synthetic reviews database, then runs a single-pass analysis through the
+engine twice against a MockBackend with the given latency distribution, 5xx, 429
+and malformed-output rates: a cold run that sends every review, and a warm rerun
+(non-incremental) that should be answered from the result cache. Reports
+throughput, latency percentiles, retries, parse failures, reviews marked failed,
+and what the mock saw.
+
+Usage: python benchmarks/bench_mock_backend.py [--reviews 100000] [--concurrency 64] [--latency 0.02]
+                                               [--error-rate 0.01] [--rate-limit-rate 0.02] [--malformed-rate 0.02]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from model_backends import LATENCY_DISTRIBUTIONS, MockBackend
+from sentiment_engine import AnalysisEngine
+
+PHRASES = ["the display is stunning", "the headset is heavy", "the price is too high", "battery life is short",
+           "apps are great", "comfortable for an hour", "movies look amazing", "I returned it",
+           "the strap gives me a headache", "field of view is narrow", "visionOS has bugs", "best device I own",
+           "design feels premium", "not worth it", "performance is smooth", "I love it"]
+
+
+def make_database(path, count, seed=19):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE reviews (id INTEGER PRIMARY KEY AUTOINCREMENT, review_text TEXT NOT NULL)")
+    conn.executemany("INSERT INTO reviews (review_text) VALUES (?)",
+                     [(f"Review {i}: " + ', '.join(rng.sample(PHRASES, rng.randint(2, 6))) + '.',)
+                      for i in range(count)])
+    conn.commit()
+    conn.close()
+
+
+def run(engine, label):
+    start = time.perf_counter()
+    analyzed = engine.run_fused_analysis()
+    elapsed = time.perf_counter() - start
+    snapshot = engine.call_stats.snapshot()
+    p50 = f"{snapshot['p50'] * 1000:.0f}" if snapshot['p50'] is not None else "-"
+    p99 = f"{snapshot['p99'] * 1000:.0f}" if snapshot['p99'] is not None else "-"
+    print(f"{label:>5} {analyzed:>9,} {elapsed:>8.1f} {analyzed / elapsed:>10.0f} {snapshot['calls']:>8,} "
+          f"{p50:>7} {p99:>7} {snapshot['retries']:>8,} {snapshot['parse_failures']:>7,} "
+          f"{engine.store.failure_count():>7,} {snapshot['cache_hits']:>8,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reviews', type=int, default=100000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--latency', type=float, default=0.02, help="median seconds per mock request")
+    parser.add_argument('--distribution', choices=LATENCY_DISTRIBUTIONS, default='lognormal')
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.02)
+    parser.add_argument('--malformed-rate', type=float, default=0.02)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'reviews.db')
+        make_database(path, args.reviews)
+        backend = MockBackend(latency=args.latency, latency_distribution=args.distribution,
+                              error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                              malformed_rate=args.malformed_rate, retry_after=0.05, seed=args.seed)
+        engine = AnalysisEngine(backend=backend)
+        engine.configure(concurrency=args.concurrency, requests_per_minute=0, tokens_per_minute=0,
+                         batch_size=args.batch_size, incremental=False)
+        engine.scheduler.base_delay = args.latency
+        engine.open_database(path)
+
+        print(f"{args.reviews:,} reviews, concurrency {args.concurrency}, {args.distribution} latency "
+              f"(median {args.latency * 1000:.0f} ms), {args.error_rate:.0%} 5xx, {args.rate_limit_rate:.0%} 429, "
+              f"{args.malformed_rate:.0%} malformed\n")
+        print(f"{'run':>5} {'analyzed':>9} {'seconds':>8} {'reviews/s':>10} {'calls':>8} {'p50 ms':>7} "
+              f"{'p99 ms':>7} {'retries':>8} {'parse':>7} {'failed':>7} {'cache':>8}")
+        run(engine, 'cold')
+        run(engine, 'warm')
+        engine.close()
+        stats = backend.stats
+        print(f"\nMock saw {stats['requests']:,} requests: {stats['errors']:,} 5xx, {stats['rate_limited']:,} 429, "
+              f"{stats['malformed']:,} malformed, {stats['truncated']:,} cut off at max_tokens")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
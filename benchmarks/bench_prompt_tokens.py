@@ -0,0 +1,93 @@
+"""Prompt tokens and reserved completion tokens per 1,000 reviews for each prompt version.
+
+Every single-review request kind is compiled for the same reviews with each
+prompt version. Prompt tokens are counted with tiktoken when it is installed,
+otherwise with the word-piece approximation in prompts.py, plus the chat
+format's few tokens of overhead per message. Reserved tokens are the max_tokens
+sent with each request, which the scheduler charges against the tokens per
+minute budget until the response arrives.
+
+Usage: python benchmarks/bench_prompt_tokens.py [--db feedback.db] [--reviews 1000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from call_metrics import MODEL_PRICES
+from prompts import PROMPTS, SHARED_PREFIX, count_tokens
+
+# Tokens the chat format adds around each message and to prime the reply
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+SAMPLE_REVIEWS = [
+    "The display is stunning and the apps are fun, but the price is far too high.",
+    "Comfortable for the first hour, then the weight on my face becomes a problem.",
+    "Battery life is short. I need the cable plugged in for anything longer than a movie.",
+    "Best media device I own. Field of view could be wider, but I love it.",
+]
+
+
+def load_reviews(db_path, count):
+    texts = []
+    if db_path and os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        texts = [row[0] for row in conn.execute("SELECT review_text FROM reviews LIMIT ?", (count,))]
+        conn.close()
+    texts = texts or SAMPLE_REVIEWS
+    return [texts[i % len(texts)] for i in range(count)]
+
+
+def measure(template, reviews):
+    """(prompt tokens, reserved completion tokens, reviews truncated) summed over reviews"""
+    prompt_tokens = reserved = truncated = 0
+    for review_text in reviews:
+        messages, max_tokens = template.compile(review_text)
+        prompt_tokens += sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+        reserved += max_tokens
+        truncated += template.review_text(review_text) != review_text
+    return prompt_tokens, reserved, truncated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='feedback.db')
+    parser.add_argument('--reviews', type=int, default=1000)
+    parser.add_argument('--model', default='gpt-3.5-turbo', choices=sorted(MODEL_PRICES))
+    args = parser.parse_args()
+
+    reviews = load_reviews(args.db, args.reviews)
+    scale = 1000 / len(reviews)
+    prompt_price = MODEL_PRICES[args.model][0]
+    review_tokens = sum(count_tokens(text) for text in reviews) * scale
+    print(f"{len(reviews):,} reviews, {review_tokens:,.0f} review tokens per 1,000; "
+          f"shared v2 prefix is {count_tokens(SHARED_PREFIX)} tokens")
+
+    results = {version: {kind: measure(template, reviews) for kind, template in templates.items()}
+               for version, templates in PROMPTS.items()}
+    # Two-pass is a sentiment request plus an aspect request for every review
+    for by_kind in results.values():
+        by_kind['two-pass'] = tuple(a + b for a, b in zip(by_kind['sentiment'], by_kind['aspects']))
+
+    print(f"\nPer 1,000 reviews ({args.model} prompt price ${prompt_price}/1K tokens)")
+    print(f"{'kind':>9} {'version':>7} {'prompt tokens':>13} {'reserved':>9} {'prompt cost':>11} {'truncated':>9}")
+    for kind in ('sentiment', 'aspects', 'fused', 'two-pass'):
+        for version, by_kind in results.items():
+            prompt_tokens, reserved, truncated = by_kind[kind]
+            print(f"{kind:>9} {version:>7} {prompt_tokens * scale:>13,.0f} {reserved * scale:>9,.0f} "
+                  f"${prompt_tokens * scale * prompt_price / 1000:>10.4f} {truncated:>9}")
+
+    baseline, compact = results['v1'], results['v2']
+    print("\nv2 against v1")
+    for kind in ('sentiment', 'aspects', 'fused', 'two-pass'):
+        saved = (baseline[kind][0] - compact[kind][0]) * scale
+        reserved = (baseline[kind][1] - compact[kind][1]) * scale
+        print(f"{kind:>9}: {saved:,.0f} prompt tokens saved ({saved / (baseline[kind][0] * scale):.0%}), "
+              f"{reserved:,.0f} fewer reserved completion tokens per 1,000 reviews")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Memory held by in-memory analysis results: lists of dicts versus the columnar CompactResults.
+
+Builds the same synthetic results three ways, each in its own subprocess: the
+original list of result dicts (each with a copy of the review text), the per-review
+tuples ResultAggregates kept before, and CompactResults. Reports memory traced
+after building, bytes per review, build time, and the time to read every result
+back as a dict, as an export does.
+
+Usage: python benchmarks/bench_result_memory.py [--reviews 1000000] [--aspects 3]
+"""
+import argparse
+import gc
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from aspect_index import AspectIndex
+from compact_results import CompactResults
+
+MODES = ('dicts', 'tuples', 'compact')
+WORDS = ("display comfort price battery software design weight apps performance field of view "
+         "amazing terrible heavy sharp immersive expensive great poor love hate the is a and but").split()
+ASPECTS = ("display comfort price battery software design weight apps performance field-of-view "
+           "sound setup passthrough eye-tracking hand-tracking").split()
+SENTIMENTS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL')
+ASPECT_SENTIMENTS = ('positive', 'negative', 'neutral')
+
+
+def make_rows(count, aspects, seed=21):
+    """(review_id, text, sentiment, confidence, aspects) rows, generated lazily"""
+    rng = random.Random(seed)
+    for review_id in range(1, count + 1):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 45)))
+        yield (review_id, text, rng.choice(SENTIMENTS), round(rng.random(), 2),
+               [{'aspect': rng.choice(ASPECTS), 'sentiment': rng.choice(ASPECT_SENTIMENTS)}
+                for _ in range(rng.randint(0, aspects * 2))])
+
+
+def build(mode, rows, index):
+    if mode == 'dicts':
+        return [{'review_id': review_id, 'review_text': str(text), 'sentiment': sentiment,
+                 'confidence': confidence, 'aspects': aspects}
+                for review_id, text, sentiment, confidence, aspects in rows]
+    if mode == 'tuples':
+        entries = {}
+        for review_id, _, sentiment, confidence, aspects in rows:
+            entries[review_id] = (sys.intern(sentiment), int(confidence * 10),
+                                  tuple((index.id_for(a['aspect']), sys.intern(a['sentiment'])) for a in aspects))
+        return entries
+    results = CompactResults(index)
+    for review_id, _, sentiment, confidence, aspects in rows:
+        results.put(review_id, sentiment, confidence,
+                    tuple((index.id_for(a['aspect']), a['sentiment']) for a in aspects))
+    return results
+
+
+def read_all(mode, results):
+    if mode == 'dicts':
+        return sum(len(result['aspects']) for result in results)
+    if mode == 'tuples':
+        return sum(len(entry[2]) for entry in results.values())
+    return sum(len(result['aspects']) for result in results.values())
+
+
+def child(mode, count, aspects):
+    index = AspectIndex()
+    rows = make_rows(count, aspects)
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    results = build(mode, rows, index)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    start = time.perf_counter()
+    read_all(mode, results)
+    read = time.perf_counter() - start
+    print(f"{mode:>8} {len(results):>10,} {held / 1024 / 1024:>9.1f} {held / len(results):>12.0f} "
+          f"{elapsed:>8.2f} {read:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reviews', type=int, default=1000000)
+    parser.add_argument('--aspects', type=int, default=3, help="average aspect mentions per review")
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.reviews, args.aspects)
+        return
+
+    print(f"{'mode':>8} {'results':>10} {'MB held':>9} {'bytes/review':>12} {'build s':>8} {'read s':>8}")
+    sys.stdout.flush()
+    for mode in MODES:
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, '--reviews', str(args.reviews),
+                        '--aspects', str(args.aspects)], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Latency of Results tab searches and aspect drill-downs over a large results table.
+
+Builds a synthetic reviews database, saves a result with aspects for every review
+through ResultsStore, which indexes them as it goes, then times what the Results tab
+does for a query: count the matches and read the first page with excerpts. Aspect
+filters are also timed the way they were answered before the aspect index, by
+scanning every result's aspects JSON.
+
+Usage: python benchmarks/bench_search.py [--reviews 1000000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from results_store import ResultsStore
+from review_source import ReviewSource
+
+WORDS = ("display comfort price battery software design weight apps performance field of view "
+         "amazing terrible heavy sharp immersive expensive great poor love hate the is a and but").split()
+RARE_WORDS = ("headache", "passthrough", "persona", "refund")
+ASPECTS = ("display", "comfort", "price", "battery", "software", "design", "weight", "apps", "performance")
+SENTIMENTS = ("POSITIVE", "NEGATIVE", "NEUTRAL")
+PAGE_SIZE = 100
+
+
+def build_database(path, reviews, chunk_size=10000):
+    """Reviews with results saved through ResultsStore; returns seconds spent saving and indexing them"""
+    rng = random.Random(25)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE reviews (id INTEGER PRIMARY KEY AUTOINCREMENT, review_text TEXT NOT NULL)")
+    conn.executemany("INSERT INTO reviews (review_text) VALUES (?)", (
+        (" ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 45)))
+         + (f" {rng.choice(RARE_WORDS)}" if rng.random() < 0.001 else ""),) for _ in range(reviews)))
+    conn.commit()
+    conn.close()
+
+    source = ReviewSource(path, 'reviews', 'review_text')
+    store = ResultsStore(source)
+    saving = 0.0
+    try:
+        for chunk in source.iter_chunks(chunk_size):
+            rows = [(review_id, text, rng.choice(SENTIMENTS), rng.random(),
+                     [{'aspect': aspect, 'sentiment': rng.choice(('positive', 'negative', 'neutral'))}
+                      for aspect in rng.sample(ASPECTS, rng.randint(0, 3))], 'api')
+                    for review_id, text in chunk]
+            start = time.perf_counter()
+            store.save_results(rows)
+            saving += time.perf_counter() - start
+    finally:
+        store.close()
+    return saving
+
+
+def time_query(store, repeat, **filters):
+    """(matches, best milliseconds to count them and read the first page with excerpts)"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total = store.count_results(**filters)
+        rows = store.query_results(0, PAGE_SIZE, **filters)
+        store.review_excerpts([row[0] for row in rows], filters.get('query'))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return total, best * 1000
+
+
+def time_json_scan(store, repeat, aspect):
+    """The aspect filter as it was before the aspect index: every result's aspects JSON is scanned"""
+    condition = ("EXISTS (SELECT 1 FROM json_each(analysis_results.aspects) j "
+                 "WHERE lower(json_extract(j.value, '$.aspect')) = ?)")
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        total = store.conn.execute(f"SELECT COUNT(*) FROM analysis_results WHERE {condition}", (aspect,)).fetchone()[0]
+        store.conn.execute(f"SELECT review_id FROM analysis_results WHERE {condition} ORDER BY review_id LIMIT ?",
+                           (aspect, PAGE_SIZE)).fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return total, best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reviews', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        saving = build_database(db_path, args.reviews)
+        print(f"{args.reviews:,} results saved and indexed in {saving:.1f}s "
+              f"({args.reviews / saving:,.0f} results/s), database {os.path.getsize(db_path) / 1024 / 1024:.0f} MB")
+        store = ResultsStore(ReviewSource(db_path, 'reviews', 'review_text'))
+        try:
+            cases = [
+                ("aspect battery", {'aspect': 'battery'}),
+                ("battery, negative", {'aspect': 'battery', 'aspect_sentiment': 'negative'}),
+                ("battery, NEGATIVE review", {'aspect': 'battery', 'sentiment': 'NEGATIVE'}),
+                ("search 'refund'", {'query': 'refund'}),
+                ("search 'headache heavy'", {'query': 'headache heavy'}),
+                ("search 'immersive'", {'query': 'immersive'}),
+                ("search 'pass*' + display", {'query': 'pass*', 'aspect': 'display'}),
+            ]
+            print(f"{'filter':>28} {'matches':>9} {'ms':>9}")
+            for label, filters in cases:
+                total, ms = time_query(store, args.repeat, **filters)
+                print(f"{label:>28} {total:>9,} {ms:>9.1f}")
+            total, ms = time_json_scan(store, max(1, args.repeat // 5), 'battery')
+            print(f"{'battery, JSON scan':>28} {total:>9,} {ms:>9.1f}")
+        finally:
+            store.close()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+
+if __name__ == '__main__':
+    main()
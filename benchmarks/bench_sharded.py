@@ -0,0 +1,96 @@
+"""Scaling of a sharded run from one worker process to several, against the mock backend.
+
+Builds a synthetic reviews database, then for each shard count analyzes every review
+of a fresh copy of it (single-pass, no result cache) with ShardedRunner. With the
+default zero mock latency a run is bound by the CPU spent building prompts, parsing
+replies, normalizing aspects and saving results, which a single process cannot spread
+over more than one core; raise --latency to see the shared rate limits and request
+concurrency dominate instead. Speedup is against the single-process engine.
+
+Usage: python benchmarks/bench_sharded.py [--reviews 20000] [--shards 1,2,4,8] [--latency 0]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from model_backends import MockBackend
+from sentiment_engine import AnalysisEngine
+from sharded_runner import ShardedRunner
+
+WORDS = ("display comfort price battery software design weight apps performance field of view "
+         "amazing terrible heavy sharp immersive expensive great poor love hate the is a and but").split()
+
+
+def build_database(path, reviews):
+    rng = random.Random(23)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE reviews (id INTEGER PRIMARY KEY AUTOINCREMENT, review_text TEXT NOT NULL)")
+    conn.executemany("INSERT INTO reviews (review_text) VALUES (?)",
+                     [(" ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 45))),) for _ in range(reviews)])
+    conn.commit()
+    conn.close()
+
+
+def run(db_path, shards, args):
+    """Seconds to analyze every review, in one process when shards is 0"""
+    make_backend = partial(MockBackend, latency=args.latency, latency_distribution='fixed')
+    engine = AnalysisEngine(backend=make_backend())
+    engine.configure(concurrency=args.concurrency, requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
+    engine.open_database(db_path, use_cache=False)
+    try:
+        start = time.perf_counter()
+        if shards:
+            ShardedRunner(engine, make_backend, shards, requests_per_minute=args.rpm,
+                          tokens_per_minute=args.tpm).run('fused')
+        else:
+            engine.run_fused_analysis()
+        elapsed = time.perf_counter() - start
+        assert engine.aggregates.total == args.reviews, engine.aggregates.total
+        # Every shard's results reached the database and the run was recorded as complete
+        stored, = engine.store.conn.execute("SELECT COUNT(*) FROM analysis_results").fetchone()
+        assert stored == args.reviews, stored
+        assert engine.unfinished_run() is None, engine.unfinished_run()
+        return elapsed
+    finally:
+        engine.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reviews', type=int, default=20000)
+    parser.add_argument('--shards', default="1,2,4,8", help="comma-separated worker process counts")
+    parser.add_argument('--latency', type=float, default=0.0, help="mock seconds per request")
+    parser.add_argument('--concurrency', type=int, default=8, help="requests in flight per process")
+    parser.add_argument('--rpm', type=int, default=0, help="shared requests per minute budget (0 = unlimited)")
+    parser.add_argument('--tpm', type=int, default=0, help="shared tokens per minute budget (0 = unlimited)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        base = os.path.join(workdir, 'base.db')
+        build_database(base, args.reviews)
+        print(f"{args.reviews:,} reviews, {args.latency * 1000:.0f} ms mock latency, {os.cpu_count()} CPUs")
+        print(f"{'run':>10} {'seconds':>9} {'reviews/s':>10} {'speedup':>8}")
+        baseline = None
+        for shards in [0] + [int(x) for x in args.shards.split(',')]:
+            db_path = os.path.join(workdir, f'run{shards}.db')
+            shutil.copy(base, db_path)
+            elapsed = run(db_path, shards, args)
+            baseline = baseline or elapsed
+            label = f"{shards} shard{'s' if shards > 1 else ''}" if shards else "engine"
+            print(f"{label:>10} {elapsed:>9.2f} {args.reviews / elapsed:>10,.0f} {baseline / elapsed:>7.2f}x")
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
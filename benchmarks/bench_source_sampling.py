@@ -0,0 +1,83 @@
+"""Time to count and read the reviews a SourceSpec selects from a wide table, whole and sampled.
+
+Builds a synthetic feedback table with a dozen columns besides the review text, then
+counts and reads (id, text) pairs for every review, a filtered date range, a random
+sample and a sample stratified by product. Filtering and sampling are SQL conditions,
+so only the selected rows' id and text ever reach Python.
+
+Usage: python benchmarks/bench_source_sampling.py [--reviews 500000] [--sample 0.01]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from review_source import ReviewSource, SourceSpec
+
+WORDS = ("display comfort price battery software design weight apps performance field of view "
+         "amazing terrible heavy sharp immersive expensive great poor love hate the is a and but").split()
+PRODUCTS = ['vision-pro'] * 6 + ['vision-air'] * 3 + ['accessory']
+
+
+def build_database(path, reviews):
+    rng = random.Random(24)
+    conn = sqlite3.connect(path)
+    extra = ", ".join(f"extra_{i} TEXT" for i in range(8))
+    conn.execute(f"CREATE TABLE feedback (feedback_id INTEGER NOT NULL, product TEXT, rating INTEGER, "
+                 f"created TEXT, {extra}, body TEXT)")
+    rows = []
+    for review_id in range(1, reviews + 1):
+        rows.append((review_id, rng.choice(PRODUCTS), rng.randint(1, 5),
+                     f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                     *("x" * rng.randint(20, 80) for _ in range(8)),
+                     " ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 45)))))
+    conn.executemany(f"INSERT INTO feedback VALUES ({','.join('?' * 13)})", rows)
+    conn.execute("CREATE UNIQUE INDEX feedback_id ON feedback(feedback_id)")
+    conn.commit()
+    conn.close()
+
+
+def measure(db_path, spec):
+    """(reviews selected, seconds to open the source, count and read them all)"""
+    start = time.perf_counter()
+    source = ReviewSource(db_path, 'feedback', 'body', spec=spec)
+    count = source.count()
+    read = sum(len(chunk) for chunk in source.iter_chunks())
+    assert read == count, (read, count)
+    return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reviews', type=int, default=500000)
+    parser.add_argument('--sample', type=float, default=0.01, help="sample fraction")
+    args = parser.parse_args()
+
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        build_database(db_path, args.reviews)
+        specs = [
+            ("whole table", SourceSpec(id_column='feedback_id')),
+            ("Feb-Mar, rating <= 2", SourceSpec(id_column='feedback_id', where="rating <= 2", date_column='created',
+                                                date_from='2024-02-01', date_to='2024-03-31')),
+            (f"{args.sample:.0%} sample", SourceSpec(id_column='feedback_id', sample=args.sample)),
+            (f"{args.sample:.0%} by product", SourceSpec(id_column='feedback_id', sample=args.sample,
+                                                         stratify_by='product'))
+        ]
+        print(f"{args.reviews:,} reviews")
+        print(f"{'selection':>22} {'reviews':>9} {'seconds':>8}")
+        for label, spec in specs:
+            count, elapsed = measure(db_path, spec)
+            print(f"{label:>22} {count:>9,} {elapsed:>8.3f}")
+    finally:
+        os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""GUI startup time: -X importtime breakdown of the entry point and time to first window.
+
+Fails (exit 1) if matplotlib or openai are imported before the window is drawn, or if
+time to first window exceeds --max-seconds. Time to first window needs a display
+(e.g. run under xvfb-run); without one only the import breakdown is reported.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--top 15] [--max-seconds 2.0]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+
+# Modules that must stay off the startup path
+DEFERRED = ('matplotlib', 'openai')
+
+
+def import_breakdown(top):
+    """Parse `python -X importtime` for the GUI module; returns (total microseconds, top packages by self time, deferred seen)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import sentiment_analysis_gui'],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"Importing sentiment_analysis_gui failed:\n{result.stderr[-2000:]}")
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        # Charge each module's own time to its top-level package
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    deferred = [name for name in packages if name in DEFERRED]
+    return sum(packages.values()), ranked[:top], deferred
+
+
+def child():
+    """Build the GUI and draw its first frame, reporting which deferred modules got imported"""
+    import tkinter as tk
+    import sentiment_analysis_gui
+    root = tk.Tk()
+    sentiment_analysis_gui.SentimentAnalysisGUI(root)
+    loaded = [name for name in DEFERRED if name in sys.modules]
+    root.update()
+    print("window", ",".join(loaded), flush=True)
+    root.destroy()
+
+
+def time_to_window():
+    """Seconds from spawning the interpreter to the first drawn window, and deferred modules imported by then"""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child'], cwd=ROOT,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    elapsed = time.perf_counter() - start
+    _, stderr = process.communicate()
+    if not line.startswith('window'):
+        return None, stderr.strip().splitlines()[-1] if stderr.strip() else "no output"
+    loaded = line.split()[1].split(',') if len(line.split()) > 1 else []
+    return elapsed, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help="fail if the median time to first window is above this")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    failed = False
+    total_us, ranked, deferred = import_breakdown(args.top)
+    print(f"import sentiment_analysis_gui: {total_us / 1000:.1f} ms")
+    print(f"{'package':<28} {'self ms':>10}")
+    for name, self_us in ranked:
+        print(f"{name:<28} {self_us / 1000:>10.1f}")
+    if deferred:
+        print(f"FAIL: imported at startup: {', '.join(deferred)}")
+        failed = True
+
+    times = []
+    for _ in range(args.runs):
+        elapsed, detail = time_to_window()
+        if elapsed is None:
+            print(f"\nTime to first window skipped: {detail}")
+            break
+        if detail:
+            print(f"FAIL: imported before the first window: {', '.join(detail)}")
+            failed = True
+        times.append(elapsed)
+    if times:
+        median = statistics.median(times)
+        print(f"\nTime to first window over {len(times)} runs: median {median:.3f}s, "
+              f"min {min(times):.3f}s, max {max(times):.3f}s")
+        if args.max_seconds is not None and median > args.max_seconds:
+            print(f"FAIL: median above {args.max_seconds:.3f}s")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Peak memory of loading reviews with fetchall() versus the chunked ReviewStream, on a synthetic database.
+
+Each mode runs in its own subprocess so peak RSS is measured independently.
+
+Usage: python benchmarks/bench_streaming_memory.py [--rows 1000000] [--db /tmp/bench_reviews.db]
+"""
+import argparse
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+WORDS = ("display comfort price battery software design weight apps performance field of view "
+         "amazing terrible heavy sharp immersive expensive great poor love hate the is a and but").split()
+
+
+def build_database(path, rows):
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+        existing = conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+        conn.close()
+        if existing == rows:
+            return
+        os.remove(path)
+    print(f"Building {rows:,} synthetic reviews in {path}...")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE reviews (id INTEGER PRIMARY KEY AUTOINCREMENT, review_text TEXT NOT NULL)")
+    rng = random.Random(42)
+    batch = []
+    for _ in range(rows):
+        batch.append((" ".join(rng.choice(WORDS) for _ in range(rng.randint(15, 45))),))
+        if len(batch) == 10000:
+            conn.executemany("INSERT INTO reviews (review_text) VALUES (?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO reviews (review_text) VALUES (?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def run_fetchall(db_path):
+    """The original loader: every row in memory, plus a result dict carrying a copy of the text"""
+    conn = sqlite3.connect(db_path)
+    reviews = conn.execute("SELECT * FROM reviews").fetchall()
+    conn.close()
+    results = []
+    for i, review in enumerate(reviews):
+        results.append({'review_id': i + 1, 'review_text': str(review[-1]), 'sentiment': 'POSITIVE',
+                        'confidence': 0.9, 'aspects': []})
+    return len(results)
+
+
+def run_stream(db_path):
+    """Chunked keyset reads through a bounded queue; only the result is kept once a review is processed"""
+    from review_source import ReviewSource, ReviewStream
+    source = ReviewSource(db_path, 'reviews', 'review_text')
+    total = source.count()
+    processed = 0
+    for review_id, text in ReviewStream(source):
+        processed += 1
+    assert processed == total
+    return processed
+
+
+def child(mode, db_path):
+    start = time.perf_counter()
+    count = run_fetchall(db_path) if mode == 'fetchall' else run_stream(db_path)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:>9} {count:>10,} {elapsed:>9.2f} {peak_mb:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--db', default=os.path.join('/tmp', 'bench_reviews.db'))
+    parser.add_argument('--child', choices=['fetchall', 'stream'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.db)
+        return
+
+    build_database(args.db, args.rows)
+    print(f"{'mode':>9} {'rows':>10} {'seconds':>9} {'peak RSS MB':>12}")
+    sys.stdout.flush()
+    for mode in ('fetchall', 'stream'):
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, '--db', args.db], check=True)
+
+
+if __name__ == '__main__':
+    main()
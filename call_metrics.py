@@ -0,0 +1,226 @@
+import csv
+import json
+import math
+import threading
+import time
+from array import array
+
+# USD per 1,000 prompt and completion tokens
+MODEL_PRICES = {
+    'gpt-3.5-turbo': (0.0005, 0.0015),
+    'gpt-4o-mini': (0.00015, 0.0006),
+    'gpt-4o': (0.0025, 0.01),
+}
+
+# Columns of the per-call CSV report
+CALL_FIELDS = ('started', 'kind', 'status', 'queue_wait', 'latency', 'retries',
+               'prompt_tokens', 'completion_tokens', 'cost')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted sequence; None if it is empty"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def _latency_summary(latencies):
+    latencies = sorted(latencies)
+    return {name: percentile(latencies, fraction) for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))}
+
+
+def format_snapshot(snapshot):
+    """One-line live summary of a CallMetrics snapshot"""
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else "-"
+
+    return (f"Calls: {snapshot['calls']} ({snapshot['errors']} failed, {snapshot['retries']} retries)   "
+            f"Latency p50 {seconds(snapshot['p50'])}  p95 {seconds(snapshot['p95'])}  p99 {seconds(snapshot['p99'])}   "
+            f"Throughput: {snapshot['calls_per_second']:.1f} calls/s, {snapshot['reviews_per_second']:.1f} reviews/s\n"
+            f"Tokens: {snapshot['prompt_tokens'] + snapshot['completion_tokens']:,}   "
+            f"Cost: ${snapshot['cost']:.4f}   "
+            f"Queue wait: {seconds(snapshot['mean_queue_wait'])} avg   "
+            f"Cache: {snapshot['cache_hits']} hits / {snapshot['cache_misses']} misses   "
+            f"Parse failures: {snapshot['parse_failures']}")
+
+
+class CallMetrics:
+    """Thread-safe instrumentation of every API call in a run.
+
+    Each call is recorded with its queue wait (rate limit waits and retry backoff),
+    the latency of the attempt that answered, retries, prompt and completion tokens
+    from response.usage and its cost at the model's prices. Cache hits and parse
+    failures are counted per request kind. snapshot() is the live view and
+    write_report() saves the run report.
+    """
+
+    def __init__(self, model='gpt-3.5-turbo'):
+        self.lock = threading.Lock()
+        # The index of the last call each thread recorded, so a parse failure can be pinned on it
+        self.local = threading.local()
+        self.model = model
+        self.prices = MODEL_PRICES.get(model, (0.0, 0.0))
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            # (started offset, kind, status, queue wait, latency, retries, prompt tokens, completion tokens, cost)
+            self.calls = []
+            self.latencies = array('d')
+            self.kinds = {}
+            self.fallbacks = 0
+            self.reviews = 0
+
+    def _kind(self, kind):
+        stats = self.kinds.get(kind)
+        if stats is None:
+            stats = self.kinds[kind] = {
+                'calls': 0, 'errors': 0, 'retries': 0, 'parse_failures': 0, 'cache_hits': 0, 'cache_misses': 0,
+                'prompt_tokens': 0, 'completion_tokens': 0, 'tokens': 0, 'latency': 0.0, 'queue_wait': 0.0,
+                'cost': 0.0
+            }
+        return stats
+
+    def record(self, kind, latency, queue_wait=0.0, retries=0, prompt_tokens=None, completion_tokens=None,
+               total_tokens=0, error=False):
+        """Record one API call; total_tokens stands in for usage when the response reported none"""
+        if prompt_tokens is None:
+            prompt_tokens, completion_tokens = total_tokens, 0
+        prompt_tokens = prompt_tokens or 0
+        completion_tokens = completion_tokens or 0
+        cost = (prompt_tokens * self.prices[0] + completion_tokens * self.prices[1]) / 1000
+        with self.lock:
+            stats = self._kind(kind)
+            stats['calls'] += 1
+            stats['retries'] += retries
+            stats['queue_wait'] += queue_wait
+            stats['prompt_tokens'] += prompt_tokens
+            stats['completion_tokens'] += completion_tokens
+            stats['tokens'] += prompt_tokens + completion_tokens
+            stats['cost'] += cost
+            if error:
+                stats['errors'] += 1
+            else:
+                stats['latency'] += latency
+                self.latencies.append(latency)
+            self.local.last = len(self.calls)
+            self.calls.append((round(time.time() - self.started, 3), kind, 'error' if error else 'ok',
+                               round(queue_wait, 4), round(latency, 4), retries,
+                               prompt_tokens, completion_tokens, round(cost, 6)))
+
+    def record_parse_failure(self, kind):
+        """Count a response that could not be parsed, marking this thread's last call as the culprit"""
+        with self.lock:
+            self._kind(kind)['parse_failures'] += 1
+            index = getattr(self.local, 'last', None)
+            if index is not None and self.calls[index][1] == kind and self.calls[index][2] == 'ok':
+                call = self.calls[index]
+                self.calls[index] = call[:2] + ('parse_failed',) + call[3:]
+            self.local.last = None
+
+    def record_cache(self, kind, hit):
+        with self.lock:
+            self._kind(kind)['cache_hits' if hit else 'cache_misses'] += 1
+
+    def record_fallback(self):
+        with self.lock:
+            self.fallbacks += 1
+
+    def add_reviews(self, count=1):
+        with self.lock:
+            self.reviews += count
+
+    def state(self):
+        """Everything recorded so far as plain data, for merge() into the metrics of another process"""
+        with self.lock:
+            return {'started': self.started, 'calls': list(self.calls), 'latencies': list(self.latencies),
+                    'kinds': {kind: dict(stats) for kind, stats in self.kinds.items()},
+                    'fallbacks': self.fallbacks, 'reviews': self.reviews}
+
+    def merge(self, state):
+        """Add the calls another CallMetrics recorded, from its state()"""
+        offset = state['started'] - self.started
+        with self.lock:
+            self.calls.extend((round(call[0] + offset, 3),) + call[1:] for call in state['calls'])
+            self.latencies.extend(state['latencies'])
+            for kind, stats in state['kinds'].items():
+                totals = self._kind(kind)
+                for key, value in stats.items():
+                    totals[key] += value
+            self.fallbacks += state['fallbacks']
+            self.reviews += state['reviews']
+
+    def averages(self, kind):
+        """(tokens per call, seconds per call) or None if no calls were made"""
+        with self.lock:
+            stats = self.kinds.get(kind)
+            answered = stats['calls'] - stats['errors'] if stats else 0
+            if not answered:
+                return None
+            return stats['tokens'] / stats['calls'], stats['latency'] / answered
+
+    def savings_report(self, two_pass_estimate):
+        """Summarize single-pass cost against the two-pass path.
+
+        Uses measured two-pass averages when this session has made two-pass calls,
+        otherwise the supplied per-review token estimate."""
+        fused = self.averages('fused')
+        if fused is None:
+            return "No single-pass requests recorded"
+        sentiment, aspects = self.averages('sentiment'), self.averages('aspects')
+        with self.lock:
+            calls = self.kinds['fused']['calls']
+            fallbacks = self.fallbacks
+
+        report = f"Single-pass: {calls} requests, {fused[0]:.0f} tokens and {fused[1]:.2f}s per review, {fallbacks} fell back to two-pass"
+        if sentiment and aspects:
+            tokens_saved = (sentiment[0] + aspects[0] - fused[0]) * calls
+            seconds_saved = (sentiment[1] + aspects[1] - fused[1]) * calls
+            report += f"\nSaved vs two-pass (measured): ~{tokens_saved:.0f} tokens, ~{seconds_saved:.1f}s of request time"
+        else:
+            tokens_saved = (two_pass_estimate - fused[0]) * calls
+            report += f"\nSaved vs two-pass (estimated): ~{tokens_saved:.0f} tokens, {calls} requests"
+        return report
+
+    def snapshot(self):
+        """Totals, latency percentiles and throughput so far, as a dict"""
+        with self.lock:
+            latencies = list(self.latencies)
+            totals = {key: sum(stats[key] for stats in self.kinds.values())
+                      for key in ('calls', 'errors', 'retries', 'parse_failures', 'cache_hits', 'cache_misses',
+                                  'prompt_tokens', 'completion_tokens', 'queue_wait', 'cost')}
+            reviews = self.reviews
+            elapsed = max(time.time() - self.started, 1e-9)
+        snapshot = dict(totals, elapsed=elapsed, reviews=reviews,
+                        calls_per_second=totals['calls'] / elapsed, reviews_per_second=reviews / elapsed,
+                        mean_queue_wait=totals['queue_wait'] / totals['calls'] if totals['calls'] else None,
+                        cost=round(totals['cost'], 6))
+        snapshot.update(_latency_summary(latencies))
+        return snapshot
+
+    def report(self):
+        """The run report: overall snapshot plus a breakdown per request kind"""
+        report = {'model': self.model, 'prices_per_1k_tokens': dict(zip(('prompt', 'completion'), self.prices)),
+                  'started_at': self.started, 'summary': self.snapshot(), 'kinds': {}}
+        with self.lock:
+            by_kind = {kind: dict(stats) for kind, stats in self.kinds.items()}
+            calls = list(self.calls)
+        for kind, stats in by_kind.items():
+            stats.update(_latency_summary(call[4] for call in calls if call[1] == kind and call[2] != 'error'))
+            stats['cost'] = round(stats['cost'], 6)
+            report['kinds'][kind] = stats
+        return report
+
+    def write_report(self, path):
+        """Save the run report: one row per call for a .csv path, otherwise the JSON summary"""
+        if path.lower().endswith('.csv'):
+            with self.lock:
+                calls = list(self.calls)
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(CALL_FIELDS)
+                writer.writerows(calls)
+            return
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
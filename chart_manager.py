@@ -0,0 +1,192 @@
+import time
+
+# Charts redraw at most this often while a run updates them
+CHART_REFRESH_SECONDS = 2.0
+
+# Bars drawn for the aspect charts
+TOP_ASPECTS = 10
+
+SENTIMENT_ORDER = ('POSITIVE', 'NEGATIVE', 'NEUTRAL')
+SENTIMENT_COLORS = {'POSITIVE': '#4CAF50', 'NEGATIVE': '#F44336', 'NEUTRAL': '#FFC107'}
+CHART_KINDS = ('sentiment', 'aspect_frequency', 'aspect_sentiment')
+# The aspect sentiment chart's bar series, in the order chart_data gives their counts
+ASPECT_SENTIMENTS = ('positive', 'negative', 'neutral')
+
+
+def chart_data(kind, aggregates):
+    """The numbers a chart shows, read from the running aggregates"""
+    if kind == 'sentiment':
+        counts = aggregates.sentiment_counts()
+        return tuple((label, counts.get(label, 0)) for label in SENTIMENT_ORDER)
+    if kind == 'aspect_frequency':
+        return tuple(aggregates.top_aspects(TOP_ASPECTS))
+    return tuple((aspect, sentiments.get('positive', 0), sentiments.get('negative', 0), sentiments.get('neutral', 0))
+                 for aspect, sentiments in aggregates.top_aspect_sentiments(TOP_ASPECTS))
+
+
+def _headroom(values):
+    # Leave space above the tallest bar for its value label
+    return max(max(values, default=0) * 1.15, 1)
+
+
+class ChartManager:
+    """Draws every Visualizations chart on one reused matplotlib Figure.
+
+    Each chart's axes and bars are built the first time it is shown, with a slot for
+    every bar it can show, and hidden rather than discarded when another chart is
+    shown. Updates only change bar sizes, value labels, tick labels and axis limits,
+    then ask the canvas to redraw. draw is the canvas's redraw
+    call (draw_idle for the Tk canvas). refresh() is the throttled variant for live
+    updates during a run: it redraws at most every min_interval seconds, and only when
+    the numbers changed.
+    """
+
+    def __init__(self, figure, draw, min_interval=CHART_REFRESH_SECONDS):
+        self.figure = figure
+        self.draw = draw
+        self.min_interval = min_interval
+        self.kind = None
+        self.data = None
+        self.ax = None
+        self.bars = []
+        self.labels = []
+        # kind -> (axes, bars, labels, data, margins) for charts built on this figure
+        self.charts = {}
+        self.margins = None
+        self.last_draw = 0.0
+
+    def show(self, kind, aggregates):
+        """Switch to a chart kind and draw it; returns False if it has nothing to show"""
+        data = chart_data(kind, aggregates)
+        if not data:
+            return False
+        if kind != self.kind:
+            self._switch(kind)
+        self._apply(data)
+        return True
+
+    def refresh(self, aggregates):
+        """Redraw the current chart from the aggregates if it changed and the last draw is old enough"""
+        if self.kind is None or time.monotonic() - self.last_draw < self.min_interval:
+            return False
+        data = chart_data(self.kind, aggregates)
+        if not data or data == self.data:
+            return False
+        self._apply(data)
+        return True
+
+    def filters_at(self, event):
+        """Results filters selecting the reviews behind the bar under a matplotlib mouse event, e.g.
+        {'aspect': 'battery', 'aspect_sentiment': 'negative'}; None if it is not over a bar"""
+        if self.kind is None or event.inaxes is not self.ax or not self.data:
+            return None
+        for series, bars in enumerate(self.bars):
+            for slot, bar in enumerate(bars[:len(self.data)]):
+                if not bar.contains(event)[0]:
+                    continue
+                label = self.data[slot][0]
+                if self.kind == 'sentiment':
+                    return {'sentiment': label}
+                if self.kind == 'aspect_frequency':
+                    return {'aspect': label}
+                return {'aspect': label, 'aspect_sentiment': ASPECT_SENTIMENTS[series]}
+        return None
+
+    def close(self):
+        """Drop every artist and forget the chart; the figure and canvas can be reused or discarded"""
+        self.figure.clear()
+        self.kind = self.data = self.ax = None
+        self.bars, self.labels = [], []
+        self.charts = {}
+        self.margins = None
+
+    def _switch(self, kind):
+        if kind not in CHART_KINDS:
+            raise ValueError(f"unknown chart {kind!r}; charts: {', '.join(CHART_KINDS)}")
+        if self.kind is not None:
+            self.charts[self.kind] = (self.ax, self.bars, self.labels, self.data, self.margins)
+            self.ax.set_visible(False)
+        self.kind = kind
+        if kind in self.charts:
+            self.ax, self.bars, self.labels, self.data, self.margins = self.charts[kind]
+            self.ax.set_visible(True)
+            # Margins are shared by every chart on the figure; restore this chart's
+            self.figure.subplots_adjust(**self.margins)
+        else:
+            self._build(kind)
+
+    def _build(self, kind):
+        self.ax = ax = self.figure.add_subplot(111, label=kind)
+        self.data = self.margins = None
+        if kind == 'sentiment':
+            bars = ax.bar(SENTIMENT_ORDER, [0] * len(SENTIMENT_ORDER),
+                          color=[SENTIMENT_COLORS[label] for label in SENTIMENT_ORDER],
+                          edgecolor='black', linewidth=1.5)
+            self.bars = [list(bars)]
+            self.labels = [ax.text(i, 0, '', ha='center', fontweight='bold') for i in range(len(SENTIMENT_ORDER))]
+            ax.set_xlabel('Sentiment', fontsize=12, fontweight='bold')
+            ax.set_ylabel('Number of Reviews', fontsize=12, fontweight='bold')
+            ax.set_title('Sentiment Distribution of Apple Vision Pro Reviews', fontsize=14, fontweight='bold')
+            ax.grid(axis='y', alpha=0.3)
+        elif kind == 'aspect_frequency':
+            slots = range(TOP_ASPECTS)
+            bars = ax.barh(slots, [0] * TOP_ASPECTS, color='#2196F3', edgecolor='black', linewidth=1.5)
+            self.bars = [list(bars)]
+            self.labels = [ax.text(0, i, '', va='center', fontweight='bold') for i in slots]
+            ax.set_yticks(slots)
+            ax.set_xlabel('Frequency', fontsize=12, fontweight='bold')
+            ax.set_ylabel('Aspect', fontsize=12, fontweight='bold')
+            ax.set_title(f'Top {TOP_ASPECTS} Most Mentioned Aspects', fontsize=14, fontweight='bold')
+            ax.set_ylim(TOP_ASPECTS - 0.5, -0.5)
+            ax.grid(axis='x', alpha=0.3)
+        elif kind == 'aspect_sentiment':
+            slots = range(TOP_ASPECTS)
+            width = 0.25
+            self.bars = [
+                list(ax.bar([i + offset for i in slots], [0] * TOP_ASPECTS, width, label=label, color=color))
+                for offset, label, color in ((-width, 'Positive', '#4CAF50'), (0, 'Negative', '#F44336'),
+                                             (width, 'Neutral', '#FFC107'))
+            ]
+            self.labels = []
+            ax.set_xticks(slots)
+            ax.set_xlabel('Aspects', fontsize=12, fontweight='bold')
+            ax.set_ylabel('Frequency', fontsize=12, fontweight='bold')
+            ax.set_title('Aspect Sentiment Distribution', fontsize=14, fontweight='bold')
+            ax.legend()
+            ax.grid(axis='y', alpha=0.3)
+
+    def _apply(self, data):
+        ax = self.ax
+        if self.kind == 'sentiment':
+            values = [count for _, count in data]
+            top = _headroom(values)
+            for bar, label, value in zip(self.bars[0], self.labels, values):
+                bar.set_height(value)
+                label.set_position((label.get_position()[0], value + top * 0.01))
+                label.set_text(str(value))
+            ax.set_ylim(0, top)
+        elif self.kind == 'aspect_frequency':
+            counts = [count for _, count in data] + [0] * (TOP_ASPECTS - len(data))
+            right = _headroom(counts)
+            for i, (bar, label, count) in enumerate(zip(self.bars[0], self.labels, counts)):
+                bar.set_width(count)
+                label.set_position((count + right * 0.01, i))
+                label.set_text(str(count) if i < len(data) else '')
+            ax.set_yticklabels([aspect for aspect, _ in data] + [''] * (TOP_ASPECTS - len(data)))
+            ax.set_xlim(0, right)
+        else:
+            columns = list(zip(*data)) if data else [(), (), (), ()]
+            padding = [0] * (TOP_ASPECTS - len(data))
+            for bars, values in zip(self.bars, columns[1:]):
+                for bar, value in zip(bars, list(values) + padding):
+                    bar.set_height(value)
+            ax.set_xticklabels(list(columns[0]) + [''] * len(padding), rotation=45, ha='right')
+            ax.set_ylim(0, _headroom([value for values in columns[1:] for value in values]))
+        if self.data is None or [row[0] for row in data] != [row[0] for row in self.data]:
+            # Laying out costs about a draw, so only when the tick labels changed
+            self.figure.tight_layout()
+            params = self.figure.subplotpars
+            self.margins = dict(left=params.left, right=params.right, bottom=params.bottom, top=params.top)
+        self.data = data
+        self.last_draw = time.monotonic()
+        self.draw()
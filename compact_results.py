@@ -0,0 +1,195 @@
+from array import array
+from collections.abc import Mapping
+
+from aspect_index import AspectIndex
+from response_parsing import ASPECT_SENTIMENTS, SENTIMENTS
+
+# Rows left behind by replaced or removed results are dropped once they are this share of all rows
+COMPACT_RATIO = 0.25
+
+# Review ids this far past the largest one seen are kept in a dict rather than growing the id index
+MAX_ID_GAP = 1 << 20
+
+_ABSENT = -1
+
+
+class _Codes:
+    """Small integer codes for label strings, so a column stores one byte per value"""
+
+    def __init__(self, labels):
+        self.labels = []
+        self.codes = {}
+        for label in labels:
+            self.code(label)
+
+    def code(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            code = len(self.labels)
+            if code > 127:
+                raise ValueError(f"more than 128 distinct labels; cannot store {label!r}")
+            self.labels.append(label)
+            self.codes[label] = code
+        return code
+
+
+class CompactResults(Mapping):
+    """Analysis results held column-wise in typed arrays rather than as a dict per review.
+
+    Each result is one row: review id (int64), sentiment code (int8) and confidence
+    (float32), with its aspect mentions stored CSR-style, as the row's slice of flat
+    aspect id (int32) and aspect sentiment code (int8) arrays between two offsets.
+    Review text is not held; exports join it back by review id. A review's row is
+    found through an array indexed by review id, which suits the dense rowids of a
+    reviews table.
+
+    Replacing a result overwrites its row when the aspect count is unchanged and
+    otherwise appends a new one; the rows left behind are compacted away in bulk.
+    As a Mapping it reads like {review_id: result dict}, building each dict on access.
+    Not thread-safe; ResultAggregates guards it with its lock.
+    """
+
+    def __init__(self, aspect_index=None):
+        self.aspect_index = aspect_index or AspectIndex()
+        self.review_ids = array('q')
+        self.sentiments = array('b')
+        self.confidences = array('f')
+        self.aspect_offsets = array('q', [0])
+        self.aspect_ids = array('i')
+        self.aspect_sentiments = array('b')
+        self.sentiment_codes = _Codes(SENTIMENTS)
+        self.aspect_sentiment_codes = _Codes(ASPECT_SENTIMENTS)
+        # review id -> row, or _ABSENT
+        self.positions = array('i')
+        self.sparse_positions = {}
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.review_ids) - self.dead
+
+    def __iter__(self):
+        sentiments = self.sentiments
+        for row, review_id in enumerate(self.review_ids):
+            if sentiments[row] != _ABSENT:
+                yield review_id
+
+    def __contains__(self, review_id):
+        return self._row(review_id) != _ABSENT
+
+    def __getitem__(self, review_id):
+        entry = self.entry(review_id)
+        if entry is None:
+            raise KeyError(review_id)
+        sentiment, confidence, aspects = entry
+        name = self.aspect_index.name
+        return {
+            'review_id': review_id,
+            'sentiment': sentiment,
+            'confidence': confidence,
+            'aspects': [{'aspect': name(aspect_id), 'sentiment': aspect_sentiment}
+                        for aspect_id, aspect_sentiment in aspects]
+        }
+
+    @property
+    def nbytes(self):
+        """Bytes held by the columns and the id index"""
+        columns = (self.review_ids, self.sentiments, self.confidences, self.aspect_offsets, self.aspect_ids,
+                   self.aspect_sentiments, self.positions)
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def _row(self, review_id):
+        if 0 <= review_id < len(self.positions):
+            return self.positions[review_id]
+        return self.sparse_positions.get(review_id, _ABSENT)
+
+    def _set_row(self, review_id, row):
+        if 0 <= review_id < len(self.positions):
+            self.positions[review_id] = row
+        elif review_id == len(self.positions):
+            self.positions.append(row)
+        elif 0 <= review_id < len(self.positions) + MAX_ID_GAP:
+            self.positions.extend([_ABSENT] * (review_id + 1 - len(self.positions)))
+            self.positions[review_id] = row
+            for moved in [i for i in self.sparse_positions if 0 <= i < len(self.positions)]:
+                self.positions[moved] = self.sparse_positions.pop(moved)
+        elif row == _ABSENT:
+            self.sparse_positions.pop(review_id, None)
+        else:
+            self.sparse_positions[review_id] = row
+
+    def entry(self, review_id):
+        """(sentiment, confidence, ((aspect id, aspect sentiment), ...)) for a review, or None"""
+        row = self._row(review_id)
+        if row == _ABSENT:
+            return None
+        labels = self.aspect_sentiment_codes.labels
+        start, end = self.aspect_offsets[row], self.aspect_offsets[row + 1]
+        return (self.sentiment_codes.labels[self.sentiments[row]], self.confidences[row],
+                tuple((self.aspect_ids[i], labels[self.aspect_sentiments[i]]) for i in range(start, end)))
+
+    def put(self, review_id, sentiment, confidence, aspects):
+        """Store a review's result, replacing any earlier one; aspects are (aspect id, aspect sentiment) pairs.
+
+        Returns the confidence as stored, rounded to float32"""
+        code = self.sentiment_codes.code(sentiment)
+        aspect_code = self.aspect_sentiment_codes.code
+        row = self._row(review_id)
+        if row != _ABSENT:
+            start, end = self.aspect_offsets[row], self.aspect_offsets[row + 1]
+            if end - start == len(aspects):
+                self.sentiments[row] = code
+                self.confidences[row] = confidence
+                for i, (aspect_id, aspect_sentiment) in enumerate(aspects, start):
+                    self.aspect_ids[i] = aspect_id
+                    self.aspect_sentiments[i] = aspect_code(aspect_sentiment)
+                return self.confidences[row]
+            self._drop(row)
+        self._set_row(review_id, len(self.review_ids))
+        self.review_ids.append(review_id)
+        self.sentiments.append(code)
+        self.confidences.append(confidence)
+        if aspects:
+            codes = self.aspect_sentiment_codes.codes
+            self.aspect_ids.extend([aspect_id for aspect_id, _ in aspects])
+            self.aspect_sentiments.extend([codes[label] if label in codes else aspect_code(label)
+                                           for _, label in aspects])
+        self.aspect_offsets.append(len(self.aspect_ids))
+        confidence = self.confidences[-1]
+        self._maybe_compact()
+        return confidence
+
+    def pop(self, review_id):
+        """Remove a review's result and return its entry, or None if it had none"""
+        entry = self.entry(review_id)
+        if entry is not None:
+            self._drop(self._row(review_id))
+            self._set_row(review_id, _ABSENT)
+            self._maybe_compact()
+        return entry
+
+    def _drop(self, row):
+        self.sentiments[row] = _ABSENT
+        self.dead += 1
+
+    def _maybe_compact(self):
+        if self.dead > 1024 and self.dead > len(self.review_ids) * COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the columns without the rows of replaced and removed results"""
+        review_ids, sentiments, confidences = array('q'), array('b'), array('f')
+        offsets, aspect_ids, aspect_sentiments = array('q', [0]), array('i'), array('b')
+        for row, review_id in enumerate(self.review_ids):
+            if self.sentiments[row] == _ABSENT:
+                continue
+            self._set_row(review_id, len(review_ids))
+            review_ids.append(review_id)
+            sentiments.append(self.sentiments[row])
+            confidences.append(self.confidences[row])
+            start, end = self.aspect_offsets[row], self.aspect_offsets[row + 1]
+            aspect_ids.extend(self.aspect_ids[start:end])
+            aspect_sentiments.extend(self.aspect_sentiments[start:end])
+            offsets.append(len(aspect_ids))
+        self.review_ids, self.sentiments, self.confidences = review_ids, sentiments, confidences
+        self.aspect_offsets, self.aspect_ids, self.aspect_sentiments = offsets, aspect_ids, aspect_sentiments
+        self.dead = 0
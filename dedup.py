@@ -0,0 +1,124 @@
+import hashlib
+import random
+import re
+import zlib
+from array import array
+
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+
+# Mersenne prime for the MinHash permutations a*x + b mod P
+_PRIME = (1 << 61) - 1
+
+
+def normalize_text(text):
+    """Lowercase with punctuation and repeated whitespace removed, so trivially different copies compare equal"""
+    return ' '.join(_NON_WORD.sub(' ', str(text).lower()).split())
+
+
+def exact_key(normalized):
+    return int.from_bytes(hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def choose_bands(num_perm, threshold):
+    """(bands, rows) splitting the signature so the LSH similarity cut-off (1/bands)^(1/rows) is
+    the closest one at or just below threshold, favouring recall; candidates are then verified"""
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    below = [option for option in options if (1 / option[0]) ** (1 / option[1]) <= threshold]
+    return max(below or options[:1], key=lambda option: (1 / option[0]) ** (1 / option[1]))
+
+
+class MinHashLSH:
+    """MinHash signatures over word shingles, indexed by LSH bands for near-duplicate lookup"""
+
+    def __init__(self, threshold=0.8, num_perm=64, shingle_size=3, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self.permutations = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        self.buckets = [{} for _ in range(self.bands)]
+        # key -> signature, kept for verifying candidates
+        self.signatures = {}
+
+    def shingles(self, normalized):
+        words = normalized.split()
+        size = self.shingle_size
+        if len(words) <= size:
+            return {zlib.crc32(normalized.encode('utf-8'))}
+        return {zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+    def signature(self, normalized):
+        hashes = self.shingles(normalized)
+        return array('I', [min((a * x + b) % _PRIME for x in hashes) & 0xFFFFFFFF for a, b in self.permutations])
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [hash(tuple(signature[i * rows:(i + 1) * rows])) for i in range(self.bands)]
+
+    def similarity(self, first, second):
+        """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+        return sum(1 for a, b in zip(first, second) if a == b) / self.num_perm
+
+    def query(self, signature):
+        """The most similar indexed key at or above the threshold, or None"""
+        candidates = set()
+        for band, key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(band.get(key, ()))
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = self.similarity(signature, self.signatures[candidate])
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def insert(self, key, signature):
+        self.signatures[key] = signature
+        for band, band_key in zip(self.buckets, self._band_keys(signature)):
+            band.setdefault(band_key, []).append(key)
+
+
+def find_duplicates(reviews, threshold=0.8, num_perm=64, on_signature=None):
+    """Group a stream of (review_id, text) into duplicate clusters.
+
+    Returns (assignments, stats): assignments maps every duplicate's review id to its
+    cluster id, the id of the first review seen with that text. Exact copies (after
+    normalize_text) are matched by hash; near-duplicates by MinHash/LSH at the given
+    estimated Jaccard similarity. Only cluster representatives are indexed, so each
+    review is compared against one review per cluster.
+
+    A review may come as (review_id, text, signature) with the MinHash signature computed
+    for the same text before, or None; only missing signatures are computed, and each is
+    passed to on_signature(review_id, signature) so it can be stored for the next run.
+    """
+    lsh = MinHashLSH(threshold, num_perm) if threshold is not None and threshold < 1 else None
+    exact = {}
+    assignments = {}
+    stats = {'reviews': 0, 'exact': 0, 'near': 0, 'signatures': 0}
+    for review_id, text, *stored in reviews:
+        stats['reviews'] += 1
+        normalized = normalize_text(text)
+        key = exact_key(normalized)
+        cluster_id = exact.get(key)
+        if cluster_id is not None:
+            assignments[review_id] = cluster_id
+            stats['exact'] += 1
+            continue
+        if lsh is not None:
+            signature = stored[0] if stored else None
+            if signature is None or len(signature) != num_perm:
+                signature = lsh.signature(normalized)
+                stats['signatures'] += 1
+                if on_signature is not None:
+                    on_signature(review_id, signature)
+            cluster_id = lsh.query(signature)
+            if cluster_id is not None:
+                # Later exact copies of this text join the same cluster without another MinHash
+                exact[key] = cluster_id
+                assignments[review_id] = cluster_id
+                stats['near'] += 1
+                continue
+            lsh.insert(review_id, signature)
+        exact[key] = review_id
+    stats['clusters'] = len(set(assignments.values()))
+    return assignments, stats
@@ -0,0 +1,186 @@
+import json
+import math
+import os
+import random
+import re
+import zlib
+
+LABELS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL')
+
+# Seed lexicon; training on stored API labels adjusts these and learns the rest
+POSITIVE_WORDS = ("amazing great love loved excellent incredible awesome fantastic impressive stunning best "
+                  "wonderful perfect beautiful immersive recommend worth enjoy enjoyed happy revolutionary good "
+                  "nice sharp comfortable smooth magical brilliant gorgeous favorite superb").split()
+NEGATIVE_WORDS = ("terrible awful hate hated disappointing disappointed worst poor bad uncomfortable overpriced "
+                  "headache headaches returned return waste useless broken buggy pain nausea regret boring lacking "
+                  "painful annoying mediocre frustrating clunky sore").split()
+NEGATIONS = {'not', 'no', 'never', "isn't", "wasn't", "don't", "doesn't", "didn't", "can't", "won't", 'hardly'}
+LEXICON_WEIGHT = 1.2
+
+# The calibrated threshold is the lowest confidence at which the model's held-out answers agree with the
+# API at least CALIBRATION_AGREEMENT of the time, over at least CALIBRATION_MIN_REVIEWS answers
+CALIBRATION_AGREEMENT = 0.9
+CALIBRATION_MIN_REVIEWS = 10
+CALIBRATION_FOLDS = 5
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text):
+    """Lowercase word tokens, with the three words after a negation prefixed by not_"""
+    tokens = []
+    negated = 0
+    for word in _TOKEN.findall(str(text).lower()):
+        if word in NEGATIONS:
+            negated = 3
+            tokens.append(word)
+            continue
+        tokens.append('not_' + word if negated else word)
+        negated = max(0, negated - 1)
+    return tokens
+
+
+def model_path_for(db_path):
+    """Where the local model trained on a database's labels is saved"""
+    return os.path.splitext(db_path)[0] + '.local_model.json'
+
+
+def calibrate_threshold(texts, labels, folds=CALIBRATION_FOLDS, seed=3):
+    """(threshold, share of reviews answered locally, their agreement with labels) for the lowest threshold
+    meeting CALIBRATION_AGREEMENT, with each review scored by a model trained on the other folds;
+    threshold is None when no threshold meets it"""
+    examples = [(text, label) for text, label in zip(texts, labels) if label in LABELS]
+    random.Random(seed).shuffle(examples)
+    scored = []
+    for fold in range(folds):
+        held_out = examples[fold::folds]
+        training = [example for i, example in enumerate(examples) if i % folds != fold]
+        if not held_out or not training:
+            continue
+        model = LocalClassifier()
+        model.train([text for text, _ in training], [label for _, label in training])
+        predictions = model.predict_batch([text for text, _ in held_out])
+        scored.extend((confidence, predicted == label)
+                      for (_, label), (predicted, confidence) in zip(held_out, predictions))
+    scored.sort(reverse=True)
+    best = (None, 0.0, None)
+    correct = 0
+    for answered, (confidence, agrees) in enumerate(scored, 1):
+        correct += agrees
+        # A threshold answers every review at or above it, so only cut where the confidence drops
+        if answered < len(scored) and scored[answered][0] == confidence:
+            continue
+        if answered >= CALIBRATION_MIN_REVIEWS and correct / answered >= CALIBRATION_AGREEMENT:
+            best = (confidence, answered / len(scored), correct / answered)
+    return best
+
+
+class LocalClassifier:
+    """Multinomial logistic regression over hashed unigrams and bigrams, in pure Python.
+
+    Starts from the seed lexicon, so it gives (weak) predictions before any training,
+    and is refined by train() on labels the API has already produced. predict_batch
+    returns (label, probability) pairs; callers escalate those below their threshold.
+    threshold is the one calibrate_threshold() found when it was last trained, or None.
+    """
+
+    def __init__(self, n_features=2 ** 18):
+        self.n_features = n_features
+        self.bias = [0.0, 0.0, 0.5]
+        # feature bucket -> per-label weights, only for buckets that have been seen
+        self.weights = {}
+        self.trained_on = 0
+        self.threshold = None
+        for word in POSITIVE_WORDS:
+            self._weight(self._bucket(word))[0] += LEXICON_WEIGHT
+            self._weight(self._bucket('not_' + word))[1] += LEXICON_WEIGHT
+        for word in NEGATIVE_WORDS:
+            self._weight(self._bucket(word))[1] += LEXICON_WEIGHT
+            self._weight(self._bucket('not_' + word))[2] += LEXICON_WEIGHT / 2
+
+    def _bucket(self, token):
+        return zlib.crc32(token.encode('utf-8')) % self.n_features
+
+    def _weight(self, bucket):
+        weight = self.weights.get(bucket)
+        if weight is None:
+            weight = self.weights[bucket] = [0.0, 0.0, 0.0]
+        return weight
+
+    def features(self, text):
+        """(buckets, value) for a review: distinct hashed unigrams and bigrams, scaled to unit length"""
+        tokens = tokenize(text)
+        grams = set(tokens)
+        grams.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        buckets = list({self._bucket(gram) for gram in grams})
+        return buckets, 1.0 / math.sqrt(len(buckets)) if buckets else 0.0
+
+    def _probabilities(self, buckets, value):
+        scores = list(self.bias)
+        weights = self.weights
+        for bucket in buckets:
+            weight = weights.get(bucket)
+            if weight is not None:
+                scores[0] += weight[0] * value
+                scores[1] += weight[1] * value
+                scores[2] += weight[2] * value
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict_batch(self, texts):
+        """[(label, probability)] for each text"""
+        predictions = []
+        for text in texts:
+            probabilities = self._probabilities(*self.features(text))
+            best = max(range(len(LABELS)), key=probabilities.__getitem__)
+            predictions.append((LABELS[best], probabilities[best]))
+        return predictions
+
+    def train(self, texts, labels, epochs=8, learning_rate=0.5, seed=13):
+        """Fit to (text, label) pairs with stochastic gradient descent; returns training accuracy"""
+        examples = [(self.features(text), LABELS.index(label))
+                    for text, label in zip(texts, labels) if label in LABELS]
+        if not examples:
+            return None
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(examples)
+            rate = learning_rate / (1 + epoch)
+            for (buckets, value), target in examples:
+                probabilities = self._probabilities(buckets, value)
+                gradient = [(1.0 if i == target else 0.0) - p for i, p in enumerate(probabilities)]
+                for i in range(len(LABELS)):
+                    self.bias[i] += rate * gradient[i] * 0.1
+                step = [rate * g * value for g in gradient]
+                for bucket in buckets:
+                    weight = self._weight(bucket)
+                    weight[0] += step[0]
+                    weight[1] += step[1]
+                    weight[2] += step[2]
+        self.trained_on += len(examples)
+        correct = sum(1 for (buckets, value), target in examples
+                      if max(range(len(LABELS)), key=self._probabilities(buckets, value).__getitem__) == target)
+        return correct / len(examples)
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'n_features': self.n_features,
+                'bias': self.bias,
+                'trained_on': self.trained_on,
+                'threshold': self.threshold,
+                'weights': {str(bucket): [round(w, 5) for w in weight] for bucket, weight in self.weights.items()}
+            }, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        model = cls(data['n_features'])
+        model.bias = data['bias']
+        model.trained_on = data.get('trained_on', 0)
+        model.threshold = data.get('threshold')
+        model.weights = {int(bucket): weight for bucket, weight in data['weights'].items()}
+        return model
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import types
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+# Shapes the mock backend can draw request latency from
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+_POSITIVE = re.compile(r"\b(love|amazing|incredible|great|best|beautiful|premium|stunning|wow|worth|immersive|"
+                       r"comfortable|sharp|smooth|fantastic|excellent)\b", re.IGNORECASE)
+_NEGATIVE = re.compile(r"\b(not|heavy|expensive|useless|underwhelm\w*|disappoint\w*|return\w*|pain|headache|"
+                       r"terrible|clunky|lonely|empty|bug\w*|overpriced|uncomfortable|short)\b", re.IGNORECASE)
+_ASPECT_WORDS = {
+    'display': ('display', 'screen', 'resolution', 'picture'),
+    'comfort': ('comfort', 'comfortable', 'uncomfortable', 'strap'),
+    'price': ('price', 'expensive', 'overpriced', 'cost', '$'),
+    'battery': ('battery', 'cable'),
+    'software': ('software', 'visionos', 'bug', 'update'),
+    'design': ('design', 'build', 'glass', 'metal'),
+    'weight': ('weight', 'heavy'),
+    'apps': ('apps', 'app'),
+    'performance': ('performance', 'fast', 'lag'),
+    'field of view': ('field of view',),
+}
+
+
+class Completion:
+    """One chat completion: the reply text and its token usage, shaped like an OpenAI response's usage"""
+
+    def __init__(self, content, prompt_tokens=None, completion_tokens=None, finish_reason='stop'):
+        self.content = content
+        self.finish_reason = finish_reason
+        total = prompt_tokens + completion_tokens if prompt_tokens is not None and completion_tokens is not None else None
+        self.usage = types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                           total_tokens=total)
+
+
+class OpenAIBackend:
+    """Chat completions from the OpenAI API, or from any server implementing it (vLLM, llama.cpp,
+    Ollama, LM Studio...) when base_url is given.
+
+    The client's own retries are off; retries are handled by the request scheduler.
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, api_key=None, base_url=None, client=None):
+        if client is None:
+            from openai import OpenAI
+            # Local servers usually ignore the key, but the client refuses to start without one
+            client = OpenAI(api_key=api_key or ('not-needed' if base_url else None), base_url=base_url,
+                            max_retries=0)
+        self.client = client
+        self.model = model
+        self.base_url = base_url
+        self.name = base_url or 'OpenAI'
+        # Keeps cached results of same-named models served from different places apart
+        self.cache_namespace = model if base_url is None else f"{base_url}|{model}"
+
+    def complete(self, messages, max_tokens, temperature, **options):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **options
+        )
+        choice = response.choices[0]
+        usage = getattr(response, 'usage', None)
+        completion = Completion(choice.message.content or "", finish_reason=getattr(choice, 'finish_reason', None))
+        if usage is not None:
+            completion.usage = usage
+        return completion
+
+
+class MockAPIError(Exception):
+    """A simulated HTTP error, shaped like the OpenAI client's so the scheduler retries 429s and 5xx"""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"mock HTTP {status_code}")
+        self.status_code = status_code
+        headers = {'retry-after': str(retry_after)} if retry_after is not None else {}
+        self.response = types.SimpleNamespace(headers=headers)
+
+
+def _label(text):
+    """Deterministic (sentiment, confidence, aspects) for a review from keyword counts"""
+    positive, negative = len(_POSITIVE.findall(text)), len(_NEGATIVE.findall(text))
+    if positive > negative:
+        sentiment = 'POSITIVE'
+    elif negative > positive:
+        sentiment = 'NEGATIVE'
+    else:
+        sentiment = 'NEUTRAL'
+    confidence = round(min(0.99, 0.55 + 0.1 * abs(positive - negative)), 2)
+    lowered = text.lower()
+    aspects = [{"aspect": aspect, "sentiment": sentiment.lower()}
+               for aspect, words in _ASPECT_WORDS.items() if any(word in lowered for word in words)]
+    return sentiment, confidence, aspects
+
+
+def _estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+class MockBackend:
+    """Deterministic in-process stand-in for a chat completions API, for offline load tests.
+
+    Replies are worked out from the review text, so sentiment, aspect, single-pass and batch
+    requests all get answers their parsers accept. Each request sleeps for a latency drawn
+    from latency_distribution around the median latency (spread is the lognormal sigma, or
+    the relative half-width for uniform), then fails with a 5xx at error_rate, a 429 at
+    rate_limit_rate, or replies with prose, cut-off or invalid JSON at malformed_rate.
+    Replies longer than max_tokens are cut off as a real model's would be. Every draw comes
+    from the seed, the request and how many times that request was sent before, so a run
+    is reproducible whatever the thread timing.
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, latency=0.3, latency_distribution='lognormal', spread=0.5,
+                 error_rate=0.0, rate_limit_rate=0.0, malformed_rate=0.0, retry_after=None, seed=0):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency distribution must be one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+        self.model = model
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.spread = spread
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.name = 'mock'
+        self.cache_namespace = f"mock|{model}|{seed}"
+        self.lock = threading.Lock()
+        self.sent = {}
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'malformed': 0, 'truncated': 0}
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _rng(self, messages):
+        digest = hashlib.blake2b(json.dumps(messages, sort_keys=True).encode('utf-8'), digest_size=8).digest()
+        with self.lock:
+            attempt = self.sent.get(digest, 0)
+            self.sent[digest] = attempt + 1
+            self.stats['requests'] += 1
+        return random.Random(f"{self.seed}:{digest.hex()}:{attempt}")
+
+    def draw_latency(self, rng):
+        if self.latency_distribution == 'fixed':
+            return self.latency
+        if self.latency_distribution == 'uniform':
+            return rng.uniform(self.latency * (1 - self.spread), self.latency * (1 + self.spread))
+        if self.latency_distribution == 'exponential':
+            return rng.expovariate(1 / self.latency) if self.latency else 0.0
+        return rng.lognormvariate(math.log(self.latency), self.spread) if self.latency else 0.0
+
+    def reply(self, messages, options):
+        """The well-formed reply a model following the prompt would give"""
+        system, user = messages[0]['content'], messages[-1]['content']
+        schema = options.get('response_format', {}).get('json_schema', {}).get('name')
+        if 'JSON list' in system:
+            items = json.loads(user)
+            with_aspects = 'aspects' in system
+            answers = {}
+            for item in items:
+                sentiment, confidence, aspects = _label(item['text'])
+                answers[item['id']] = {"sentiment": sentiment, "confidence": confidence}
+                if with_aspects:
+                    answers[item['id']]['aspects'] = aspects
+            return json.dumps(answers)
+        sentiment, confidence, aspects = _label(user)
+        if schema == 'review_fused' or (schema is None and 'JSON object' in system):
+            return json.dumps({"sentiment": sentiment, "confidence": confidence, "aspects": aspects})
+        if schema == 'review_aspects':
+            return json.dumps({"aspects": aspects})
+        if schema is None and 'JSON array' in system:
+            return json.dumps(aspects)
+        if schema == 'review_sentiment':
+            return json.dumps({"sentiment": sentiment, "confidence": confidence})
+        return f"{sentiment} {confidence}"
+
+    def complete(self, messages, max_tokens, temperature, **options):
+        rng = self._rng(messages)
+        time.sleep(self.draw_latency(rng))
+        roll = rng.random()
+        if roll < self.error_rate:
+            self._count('errors')
+            raise MockAPIError(500)
+        if roll < self.error_rate + self.rate_limit_rate:
+            self._count('rate_limited')
+            raise MockAPIError(429, self.retry_after)
+
+        content = self.reply(messages, options)
+        if rng.random() < self.malformed_rate:
+            self._count('malformed')
+            content = rng.choice([
+                "I'm sorry, I can't determine that from the review.",
+                content[:max(1, len(content) // 2)],
+                content.replace('"', "'"),
+            ])
+        finish_reason = 'stop'
+        if _estimate_tokens(content) > max_tokens:
+            self._count('truncated')
+            content = content[:max_tokens * 4]
+            finish_reason = 'length'
+        prompt_tokens = sum(_estimate_tokens(message['content']) + 4 for message in messages)
+        return Completion(content, prompt_tokens, _estimate_tokens(content), finish_reason)
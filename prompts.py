@@ -0,0 +1,176 @@
+import math
+import re
+
+# Prompt templates used unless configured otherwise; 'v1' are the original, longer prompts
+DEFAULT_PROMPT_VERSION = 'v2'
+
+# Longest review text sent, in tokens; longer reviews keep their opening and closing parts
+REVIEW_TOKEN_BUDGET = 600
+
+# Every v2 system prompt opens with this line saying what the model is reading
+SHARED_PREFIX = "You analyze Apple Vision Pro customer reviews.\n"
+
+ASPECT_NAMES = "Prefer these aspect names: display, comfort, price, battery, software, design, weight, apps, performance, field of view.\n"
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+_encoding = None
+
+
+def _tiktoken_encoding():
+    """The cl100k_base tokenizer if tiktoken is installed, else False"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding
+
+
+def _piece_tokens(piece):
+    # Common BPE vocabularies hold most English words whole; longer ones split into ~6 character pieces
+    return max(1, math.ceil(len(piece) / 6))
+
+
+def count_tokens(text):
+    """Token count of text with tiktoken when it is installed, else a close word-piece approximation"""
+    encoding = _tiktoken_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return sum(_piece_tokens(piece) for piece in _PIECE.findall(text))
+
+
+def truncate_to_budget(text, budget=REVIEW_TOKEN_BUDGET):
+    """Text cut to about budget tokens, keeping the first two thirds and the last third of the budget"""
+    encoding = _tiktoken_encoding()
+    if encoding:
+        tokens = encoding.encode(text)
+        if len(tokens) <= budget:
+            return text
+        head = budget * 2 // 3
+        return encoding.decode(tokens[:head]) + " … " + encoding.decode(tokens[len(tokens) - (budget - head):])
+
+    pieces = [(match.start(), match.end(), _piece_tokens(match.group())) for match in _PIECE.finditer(text)]
+    if sum(tokens for _, _, tokens in pieces) <= budget:
+        return text
+    head_end, used = 0, 0
+    for _, end, tokens in pieces:
+        if used + tokens > budget * 2 // 3:
+            break
+        head_end, used = end, used + tokens
+    tail_start, tail_used = len(text), 0
+    for start, _, tokens in reversed(pieces):
+        if used + tail_used + tokens > budget:
+            break
+        tail_start, tail_used = start, tail_used + tokens
+    return text[:head_end] + " … " + text[tail_start:]
+
+
+class PromptTemplate:
+    """A versioned prompt: the system text, how the review is framed and cut, and the completion budget.
+
+    compile(review_text, structured) returns (messages, max_tokens). max_tokens is
+    fixed_max_tokens when set, otherwise output_tokens (structured_tokens when the reply
+    has to match a JSON schema) plus aspect_tokens for each aspect a review of that
+    length is expected to mention.
+    """
+
+    def __init__(self, kind, version, system, user_prefix="", review_budget=None, fixed_max_tokens=None,
+                 output_tokens=0, aspect_tokens=0, structured_tokens=None):
+        self.kind = kind
+        self.version = version
+        self.system = system
+        self.user_prefix = user_prefix
+        self.review_budget = review_budget
+        self.fixed_max_tokens = fixed_max_tokens
+        self.output_tokens = output_tokens
+        self.aspect_tokens = aspect_tokens
+        self.structured_tokens = output_tokens if structured_tokens is None else structured_tokens
+        # Stands in for the prompt in result cache keys; the bare system text for untruncated
+        # templates, so results cached before templates existed stay valid
+        self.fingerprint = system + (f"\n[review budget {review_budget} tokens]" if review_budget else "")
+
+    def review_text(self, review_text):
+        if self.review_budget:
+            return truncate_to_budget(review_text, self.review_budget)
+        return review_text
+
+    def max_tokens(self, review_tokens, structured=False):
+        if self.fixed_max_tokens:
+            return self.fixed_max_tokens
+        output_tokens = self.structured_tokens if structured else self.output_tokens
+        if not self.aspect_tokens:
+            return output_tokens
+        # Room for about one aspect per 8 review tokens, at least four and at most fifteen; the reserve
+        # only holds rate-limit budget until the reply arrives, while a reply cut short loses aspects
+        aspects = min(15, max(4, review_tokens // 8 + 3))
+        return output_tokens + aspects * self.aspect_tokens
+
+    def compile(self, review_text, structured=False):
+        text = self.review_text(review_text)
+        messages = [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user_prefix + text}
+        ]
+        return messages, self.max_tokens(count_tokens(text), structured)
+
+
+PROMPTS = {
+    'v1': {
+        'sentiment': PromptTemplate(
+            'sentiment', 'v1',
+            "You are a sentiment analysis expert. Analyze the sentiment of product reviews and respond with only one word (POSITIVE, NEGATIVE, or NEUTRAL) followed by a confidence score between 0 and 1. Format: SENTIMENT CONFIDENCE",
+            user_prefix="Analyze the sentiment of this Apple Vision Pro review:\n\n",
+            fixed_max_tokens=50),
+        'aspects': PromptTemplate(
+            'aspects', 'v1',
+            """You are an expert at extracting product aspects from reviews. Extract key aspects/features mentioned in Apple Vision Pro reviews and indicate if they are mentioned positively or negatively.
+
+Return ONLY a valid JSON array with this exact format:
+[{"aspect": "display", "sentiment": "positive"}, {"aspect": "price", "sentiment": "negative"}]
+
+Common aspects: display, comfort, price, battery, software, design, weight, apps, performance, field of view""",
+            user_prefix="Extract aspects from this review:\n\n",
+            fixed_max_tokens=300),
+        'fused': PromptTemplate(
+            'fused', 'v1',
+            """You are a sentiment analysis expert for Apple Vision Pro reviews. Determine the overall sentiment of the review and extract the key aspects/features it mentions, indicating if each is mentioned positively, negatively or neutrally.
+
+Return ONLY a valid JSON object with this exact format:
+{"sentiment": "POSITIVE", "confidence": 0.9, "aspects": [{"aspect": "display", "sentiment": "positive"}, {"aspect": "price", "sentiment": "negative"}]}
+
+sentiment must be POSITIVE, NEGATIVE or NEUTRAL and confidence a number between 0 and 1.
+Common aspects: display, comfort, price, battery, software, design, weight, apps, performance, field of view""",
+            user_prefix="Analyze this Apple Vision Pro review:\n\n",
+            fixed_max_tokens=350),
+    },
+    'v2': {
+        'sentiment': PromptTemplate(
+            'sentiment', 'v2',
+            SHARED_PREFIX + "Reply with only the overall sentiment (POSITIVE, NEGATIVE or NEUTRAL) "
+                            "and a confidence from 0 to 1, e.g. POSITIVE 0.9",
+            # A schema reply spells out its keys: {"sentiment":"NEUTRAL","confidence":0.85}
+            review_budget=REVIEW_TOKEN_BUDGET, output_tokens=8, structured_tokens=24),
+        'aspects': PromptTemplate(
+            'aspects', 'v2',
+            SHARED_PREFIX + ASPECT_NAMES + 'Reply with only a JSON array of the aspects the review mentions and how: '
+                            '[{"aspect":"display","sentiment":"positive"}]. sentiment: positive, negative or neutral',
+            # The schema wraps the array in {"aspects": ...}
+            review_budget=REVIEW_TOKEN_BUDGET, output_tokens=6, aspect_tokens=14, structured_tokens=12),
+        'fused': PromptTemplate(
+            'fused', 'v2',
+            SHARED_PREFIX + ASPECT_NAMES + 'Reply with only a JSON object: {"sentiment":"POSITIVE","confidence":0.9,'
+                            '"aspects":[{"aspect":"display","sentiment":"positive"}]}. sentiment: POSITIVE, '
+                            'NEGATIVE or NEUTRAL; confidence: 0 to 1; aspect sentiment: positive, negative or neutral',
+            review_budget=REVIEW_TOKEN_BUDGET, output_tokens=24, aspect_tokens=14),
+    },
+}
+
+
+def get_template(kind, version=DEFAULT_PROMPT_VERSION):
+    try:
+        return PROMPTS[version][kind]
+    except KeyError:
+        raise ValueError(f"no {kind!r} prompt in version {version!r}; versions: {', '.join(PROMPTS)}")
@@ -0,0 +1,210 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+_EXHAUSTED = object()
+
+
+def estimate_tokens(*texts):
+    """Rough token count for rate limiting (about 4 characters per token)"""
+    return sum(len(text) for text in texts) // 4 + 1
+
+
+def is_retryable(error):
+    """True for rate limit (429), server side (5xx) and connection errors"""
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return type(error).__name__ in ('APIConnectionError', 'APITimeoutError')
+
+
+def retry_after_seconds(error):
+    """Read the Retry-After header from an API error, if the server sent one"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most capacity tokens"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        # Default burst is ten seconds' worth of budget
+        self.capacity = capacity if capacity else max(1.0, rate_per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take amount tokens and return the seconds to wait before they are really available"""
+        with self.lock:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def adjust(self, delta):
+        """Charge (positive) or refund (negative) tokens after the real usage is known"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket whose level is kept in shared memory, so every process given it draws on one budget.
+
+    Created in the parent from a multiprocessing context and passed to worker processes as
+    they are started. time.monotonic is a system-wide clock, so the refill is the same
+    whichever process computes it."""
+
+    def __init__(self, context, rate_per_minute, capacity=None):
+        # [tokens, updated]; the array's lock serializes every process's reserve() and adjust()
+        self.state = context.Array('d', 2)
+        super().__init__(rate_per_minute, capacity)
+        self.lock = self.state.get_lock()
+
+    @property
+    def tokens(self):
+        return self.state[0]
+
+    @tokens.setter
+    def tokens(self, value):
+        self.state[0] = value
+
+    @property
+    def updated(self):
+        return self.state[1]
+
+    @updated.setter
+    def updated(self, value):
+        self.state[1] = value
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budgets; a budget of 0 or None is unlimited"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    @classmethod
+    def shared(cls, context, requests_per_minute=None, tokens_per_minute=None):
+        """A limiter whose budgets are shared by every process it is passed to; see SharedTokenBucket"""
+        limiter = cls()
+        if requests_per_minute:
+            limiter.request_bucket = SharedTokenBucket(context, requests_per_minute)
+        if tokens_per_minute:
+            limiter.token_bucket = SharedTokenBucket(context, tokens_per_minute)
+        return limiter
+
+    def acquire(self, tokens=0):
+        """Block until one request using about `tokens` tokens fits the budgets; returns seconds waited"""
+        delay = 0.0
+        if self.request_bucket:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket and tokens:
+            delay = max(delay, self.token_bucket.reserve(tokens))
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def adjust_tokens(self, delta):
+        if self.token_bucket and delta:
+            self.token_bucket.adjust(delta)
+
+
+class RequestScheduler:
+    """Runs API calls concurrently under rate limits, retrying 429/5xx with jittered exponential backoff.
+
+    limiter replaces the budgets from requests_per_minute and tokens_per_minute with an
+    existing RateLimiter, such as one shared with other processes."""
+
+    def __init__(self, concurrency=8, requests_per_minute=3500, tokens_per_minute=90000,
+                 max_retries=5, base_delay=1.0, max_delay=30.0, limiter=None):
+        self.concurrency = max(1, int(concurrency))
+        self.limiter = limiter if limiter is not None else RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff_delay(self, attempt, error=None):
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = retry_after_seconds(error) if error is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def call(self, request, estimated_tokens=0, stats=None):
+        """Run request() once the rate limits allow it, retrying retryable failures.
+
+        If given, stats is filled with 'queue_wait' (seconds spent waiting on the rate limits
+        and retry backoff) and 'retries'."""
+        attempt = 0
+        stats = {} if stats is None else stats
+        stats['queue_wait'], stats['retries'] = 0.0, 0
+        while True:
+            stats['queue_wait'] += self.limiter.acquire(estimated_tokens)
+            try:
+                response = request()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt, e)
+                time.sleep(delay)
+                stats['queue_wait'] += delay
+                attempt += 1
+                stats['retries'] = attempt
+                continue
+
+            # Settle the token estimate against the real usage when the response reports it
+            usage = getattr(response, 'usage', None)
+            total_tokens = getattr(usage, 'total_tokens', None)
+            if total_tokens is not None and estimated_tokens:
+                self.limiter.adjust_tokens(total_tokens - estimated_tokens)
+            return response
+
+    def run(self, func, items):
+        """Yield (index, func(item)) as calls complete, keeping at most `concurrency` calls in flight"""
+        items = iter(items)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = {}
+            index = 0
+            for item in items:
+                pending[pool.submit(func, item)] = index
+                index += 1
+                if len(pending) >= self.concurrency:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+                    item = next(items, _EXHAUSTED)
+                    if item is not _EXHAUSTED:
+                        pending[pool.submit(func, item)] = index
+                        index += 1
+
+    def map(self, func, items, on_result=None):
+        """Apply func to every item concurrently and return the results in input order"""
+        items = list(items)
+        results = [None] * len(items)
+        for index, result in self.run(func, items):
+            results[index] = result
+            if on_result:
+                on_result(index, result)
+        return results
+
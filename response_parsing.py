@@ -0,0 +1,248 @@
+import json
+import re
+
+SENTIMENTS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL')
+ASPECT_SENTIMENTS = ('positive', 'negative', 'neutral')
+
+# Confidence given to a plain-text sentiment reply that leaves the score out
+DEFAULT_CONFIDENCE = 0.8
+
+_ASPECT_LIST_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "aspect": {"type": "string"},
+            "sentiment": {"type": "string", "enum": list(ASPECT_SENTIMENTS)}
+        },
+        "required": ["aspect", "sentiment"],
+        "additionalProperties": False
+    }
+}
+
+# JSON schemas for structured output, one per single-review request kind
+RESPONSE_SCHEMAS = {
+    'sentiment': {
+        "type": "object",
+        "properties": {
+            "sentiment": {"type": "string", "enum": list(SENTIMENTS)},
+            "confidence": {"type": "number"}
+        },
+        "required": ["sentiment", "confidence"],
+        "additionalProperties": False
+    },
+    'aspects': {
+        "type": "object",
+        "properties": {"aspects": _ASPECT_LIST_SCHEMA},
+        "required": ["aspects"],
+        "additionalProperties": False
+    },
+    'fused': {
+        "type": "object",
+        "properties": {
+            "sentiment": {"type": "string", "enum": list(SENTIMENTS)},
+            "confidence": {"type": "number"},
+            "aspects": _ASPECT_LIST_SCHEMA
+        },
+        "required": ["sentiment", "confidence", "aspects"],
+        "additionalProperties": False
+    },
+}
+
+_SENTIMENT_WORD = re.compile(r"\b(POSITIVE|NEGATIVE|NEUTRAL)\b", re.IGNORECASE)
+_CONFIDENCE = re.compile(r"(?<![\w.])(\d*\.?\d+)\s*(%?)")
+_SCALAR = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null")
+_DECODER = json.JSONDecoder(strict=False)
+
+
+def structured_response_format(kind):
+    """response_format asking the API to return JSON matching the kind's schema"""
+    return {"type": "json_schema",
+            "json_schema": {"name": f"review_{kind}", "strict": True, "schema": RESPONSE_SCHEMAS[kind]}}
+
+
+def strip_code_fence(content):
+    """Remove a ``` or ```json fence the model sometimes wraps around JSON"""
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.strip("`").strip()
+        if content.startswith("json"):
+            content = content[4:].strip()
+    return content
+
+
+def _string_end(text, start):
+    """Index just past the string literal opening at start, or None if it is unterminated"""
+    i = start + 1
+    while i < len(text):
+        if text[i] == '\\':
+            i += 2
+        elif text[i] == '"':
+            return i + 1
+        else:
+            i += 1
+    return None
+
+
+def _close_truncated(text):
+    """The longest prefix of text that ends after a complete value, with trailing commas dropped and
+    the arrays and objects still open at that point closed"""
+    stack = []
+    # What the innermost container expects next: key, colon, value or next (a comma or its closer)
+    state = 'value'
+    cut, cut_stack = None, None
+    drop = []
+    last_comma = None
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch in ' \t\r\n':
+            i += 1
+        elif ch in '{[':
+            if state != 'value':
+                break
+            stack.append(ch)
+            state = 'key' if ch == '{' else 'value'
+            i += 1
+            # A nested container only counts once it is complete, so a cut-off item is dropped, not emptied
+            if len(stack) == 1:
+                cut, cut_stack = i, list(stack)
+        elif ch in '}]':
+            if not stack or stack[-1] != ('{' if ch == '}' else '['):
+                break
+            if state in ('key', 'value') and last_comma is not None:
+                drop.append(last_comma)
+            stack.pop()
+            state = 'next'
+            last_comma = None
+            i += 1
+            cut, cut_stack = i, list(stack)
+            if not stack:
+                break
+        elif ch == ',':
+            if state != 'next' or not stack:
+                break
+            state = 'key' if stack[-1] == '{' else 'value'
+            last_comma = i
+            i += 1
+        elif ch == ':':
+            if state != 'colon':
+                break
+            state = 'value'
+            i += 1
+        elif ch == '"':
+            end = _string_end(text, i)
+            if end is None or state not in ('key', 'value'):
+                break
+            if state == 'value':
+                cut, cut_stack = end, list(stack)
+            state = 'colon' if state == 'key' else 'next'
+            last_comma = None
+            i = end
+        else:
+            match = _SCALAR.match(text, i)
+            # A number or literal not followed by a delimiter may have been cut short
+            if state != 'value' or not match or text[match.end():match.end() + 1] not in tuple(' \t\r\n,}]'):
+                break
+            state = 'next'
+            last_comma = None
+            i = match.end()
+            cut, cut_stack = i, list(stack)
+    if cut is None:
+        raise ValueError("no JSON value to recover")
+    kept = ''.join(ch for index, ch in enumerate(text[:cut]) if index not in drop) if drop else text[:cut]
+    return kept + ''.join('}' if opener == '{' else ']' for opener in reversed(cut_stack))
+
+
+def recover_json(content):
+    """Parse the JSON in a model response, recovering what it can from an untidy or cut-off one.
+
+    Code fences and text around the JSON are ignored. A response that stops early, whether
+    truncated at max_tokens or only partly received, keeps every complete value before the
+    cut. Raises ValueError if no JSON value can be recovered."""
+    text = strip_code_fence(content)
+    try:
+        return _DECODER.decode(text)
+    except ValueError:
+        pass
+    starts = [index for index in (text.find('{'), text.find('[')) if index >= 0]
+    if not starts:
+        raise ValueError("no JSON in response")
+    text = text[min(starts):]
+    try:
+        return _DECODER.raw_decode(text)[0]
+    except ValueError:
+        return _DECODER.decode(_close_truncated(text))
+
+
+def validate_sentiment_item(data):
+    """Return (sentiment, confidence) from a parsed JSON object; raises ValueError if invalid"""
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    sentiment = str(data.get('sentiment', '')).upper()
+    if sentiment not in SENTIMENTS:
+        raise ValueError(f"invalid sentiment {data.get('sentiment')!r}")
+    try:
+        confidence = float(data.get('confidence'))
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid confidence {data.get('confidence')!r}")
+    if not 0 <= confidence <= 1:
+        raise ValueError(f"confidence {confidence} out of range")
+    return sentiment, confidence
+
+
+def _clean_aspect(item):
+    if not isinstance(item, dict) or not isinstance(item.get('aspect'), str) or not item['aspect'].strip():
+        return None
+    sentiment = str(item.get('sentiment', '')).lower()
+    if sentiment not in ASPECT_SENTIMENTS:
+        return None
+    return {'aspect': item['aspect'], 'sentiment': sentiment}
+
+
+def clean_aspects(aspects):
+    """The well-formed entries of an aspect list, with sentiments lowercased; raises ValueError if it is not a list"""
+    if not isinstance(aspects, list):
+        raise ValueError("aspects must be a list")
+    return [aspect for aspect in map(_clean_aspect, aspects) if aspect is not None]
+
+
+def validate_fused_item(data):
+    """Return (sentiment, confidence, aspects) from a parsed JSON object, dropping malformed aspect entries;
+    raises ValueError if the sentiment, confidence or aspect list is missing or malformed"""
+    sentiment, confidence = validate_sentiment_item(data)
+    return sentiment, confidence, clean_aspects(data.get('aspects'))
+
+
+def parse_sentiment_result(content):
+    """(sentiment, confidence) from a 'SENTIMENT CONFIDENCE' reply or a JSON object; raises ValueError if
+    the reply names no sentiment, or is JSON without a valid confidence"""
+    text = content.strip()
+    if text.startswith(('{', '```')):
+        # A JSON reply missing its confidence was most likely cut off, so it is retried rather than guessed
+        return validate_sentiment_item(recover_json(text))
+    match = _SENTIMENT_WORD.search(text)
+    if match is None:
+        raise ValueError(f"no sentiment in response {text[:80]!r}")
+    confidence = DEFAULT_CONFIDENCE
+    number = _CONFIDENCE.search(text, match.end())
+    if number:
+        value = float(number.group(1)) / (100 if number.group(2) else 1)
+        if 0 <= value <= 1:
+            confidence = value
+    return match.group(1).upper(), confidence
+
+
+def parse_aspects_result(content):
+    """Aspects from a JSON array, or an object holding one under "aspects"; malformed entries are dropped.
+    Raises ValueError if no aspect list can be recovered"""
+    data = recover_json(content)
+    if isinstance(data, dict):
+        data = data.get('aspects')
+    return clean_aspects(data)
+
+
+def parse_fused_result(content):
+    """(sentiment, confidence, aspects) from a single-pass JSON response; raises ValueError if the sentiment,
+    confidence or aspect list is missing or malformed"""
+    return validate_fused_item(recover_json(content))
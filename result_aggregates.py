@@ -0,0 +1,171 @@
+import sys
+import threading
+from collections import Counter
+
+from aspect_index import AspectIndex
+from compact_results import CompactResults
+
+# Confidence histograms use this many equal-width bins over [0, 1]
+CONFIDENCE_BINS = 10
+
+
+def confidence_bin(confidence):
+    # The nudge keeps a confidence such as 0.7 in the same bin once stored as a float32 (0.69999999)
+    return min(CONFIDENCE_BINS - 1, max(0, int(confidence * CONFIDENCE_BINS + 1e-6)))
+
+
+class ResultAggregates:
+    """Running totals over the analysis results, updated one result at a time.
+
+    Holds sentiment counts, per-aspect sentiment counts and confidence histograms so
+    summaries, charts and reports never rescan the results. Each review's contribution
+    is remembered, so re-analyzing a review replaces it rather than counting it twice.
+    Views cost O(1), or O(unique aspects) for top-k aspect lists, whatever the result count.
+    Aspects are counted by their canonical integer id from the aspect index, and the
+    contributions are kept in a CompactResults, which also serves as a read-only
+    {review_id: result} view of everything counted. Counts from other processes can be
+    added with merge(), without their per-review contributions.
+    """
+
+    def __init__(self, aspect_index=None):
+        self.lock = threading.Lock()
+        self.aspect_index = aspect_index or AspectIndex()
+        self.results = CompactResults(self.aspect_index)
+        self.sentiments = Counter()
+        self.confidence = {}
+        self.aspect_totals = Counter()
+        self.aspect_sentiments = {}
+        self.aspect_mentions = 0
+        # Reviews added by merge(), which are counted but have no entry in results
+        self.merged = 0
+
+    @classmethod
+    def from_results(cls, results, aspect_index=None):
+        """Build from an iterable of (review_id, sentiment, confidence, aspects) rows"""
+        aggregates = cls(aspect_index)
+        for review_id, sentiment, confidence, aspects in results:
+            aggregates.update(review_id, sentiment, confidence, aspects)
+        return aggregates
+
+    @property
+    def total(self):
+        return len(self.results) + self.merged
+
+    def _compact(self, aspects):
+        """((aspect id, aspect sentiment), ...) for a list of aspect dicts, one per distinct pair"""
+        pairs = []
+        for a in aspects or []:
+            aspect_id = self.aspect_index.id_for(a.get('aspect', '')) if isinstance(a, dict) else None
+            if aspect_id is not None:
+                pair = (aspect_id, sys.intern(str(a.get('sentiment', 'neutral')).lower()))
+                if pair not in pairs:
+                    pairs.append(pair)
+        return tuple(pairs)
+
+    def _apply(self, entry, step):
+        sentiment, confidence, aspects = entry
+        self.sentiments[sentiment] += step
+        if not self.sentiments[sentiment]:
+            del self.sentiments[sentiment]
+        self.confidence.setdefault(sentiment, [0] * CONFIDENCE_BINS)[confidence_bin(confidence)] += step
+        self.aspect_mentions += step * len(aspects)
+        for aspect_id, aspect_sentiment in aspects:
+            self.aspect_totals[aspect_id] += step
+            counts = self.aspect_sentiments.setdefault(aspect_id, Counter())
+            counts[aspect_sentiment] += step
+            if not counts[aspect_sentiment]:
+                del counts[aspect_sentiment]
+            if not self.aspect_totals[aspect_id]:
+                del self.aspect_totals[aspect_id]
+                del self.aspect_sentiments[aspect_id]
+
+    def _replace(self, review_id, sentiment, confidence, aspects):
+        previous = self.results.entry(review_id)
+        if previous is not None:
+            self._apply(previous, -1)
+        # Counted as stored, so removing it later takes away exactly what was added
+        confidence = self.results.put(review_id, sentiment, confidence, aspects)
+        self._apply((sentiment, confidence, aspects), 1)
+
+    def update(self, review_id, sentiment, confidence, aspects):
+        """Add a review's result, replacing whatever it contributed before"""
+        with self.lock:
+            self._replace(review_id, sentiment, confidence, self._compact(aspects))
+
+    def set_aspects(self, review_id, aspects):
+        """Replace the aspects of a review already counted, keeping its sentiment"""
+        with self.lock:
+            previous = self.results.entry(review_id)
+            if previous is not None:
+                self._replace(review_id, previous[0], previous[1], self._compact(aspects))
+
+    def remove(self, review_id):
+        with self.lock:
+            previous = self.results.pop(review_id)
+            if previous is not None:
+                self._apply(previous, -1)
+
+    def snapshot(self):
+        """The counts as plain data, with aspects by name rather than id, for sending to another process"""
+        name = self.aspect_index.name
+        with self.lock:
+            return {
+                'total': self.total,
+                'sentiments': dict(self.sentiments),
+                'confidence': {sentiment: list(bins) for sentiment, bins in self.confidence.items()},
+                'aspects': {name(aspect_id): dict(counts) for aspect_id, counts in self.aspect_sentiments.items()}
+            }
+
+    def merge(self, snapshot):
+        """Add the counts of another ResultAggregates' snapshot(). Its reviews are counted in the views
+        but have no per-review contribution here, so they cannot be replaced or removed"""
+        with self.lock:
+            self.merged += snapshot['total']
+            self.sentiments.update(snapshot['sentiments'])
+            for sentiment, bins in snapshot['confidence'].items():
+                counts = self.confidence.setdefault(sentiment, [0] * CONFIDENCE_BINS)
+                for i, count in enumerate(bins):
+                    counts[i] += count
+            for aspect, counts in snapshot['aspects'].items():
+                aspect_id = self.aspect_index.id_for(aspect)
+                if aspect_id is None:
+                    continue
+                self.aspect_sentiments.setdefault(aspect_id, Counter()).update(counts)
+                mentions = sum(counts.values())
+                self.aspect_totals[aspect_id] += mentions
+                self.aspect_mentions += mentions
+
+    def sentiment_counts(self):
+        with self.lock:
+            return dict(self.sentiments)
+
+    def top_aspects(self, k):
+        """[(aspect, mentions)] for the k most mentioned aspects"""
+        name = self.aspect_index.name
+        with self.lock:
+            return [(name(aspect_id), count) for aspect_id, count in self.aspect_totals.most_common(k)]
+
+    def top_aspect_sentiments(self, k):
+        """[(aspect, {aspect sentiment: count})] for the k most mentioned aspects"""
+        name = self.aspect_index.name
+        with self.lock:
+            return [(name(aspect_id), dict(self.aspect_sentiments[aspect_id]))
+                    for aspect_id, _ in self.aspect_totals.most_common(k)]
+
+    def top_by_aspect_sentiment(self, aspect_sentiment, k):
+        """[(aspect, count)] for the k aspects most often mentioned with the given sentiment"""
+        with self.lock:
+            counts = Counter({aspect_id: counts[aspect_sentiment]
+                              for aspect_id, counts in self.aspect_sentiments.items() if counts[aspect_sentiment] > 0})
+        return [(self.aspect_index.name(aspect_id), count) for aspect_id, count in counts.most_common(k)]
+
+    def unique_aspects(self):
+        with self.lock:
+            return len(self.aspect_totals)
+
+    def confidence_histogram(self, sentiment=None):
+        """Counts per confidence bin, for one sentiment or all of them"""
+        with self.lock:
+            if sentiment is not None:
+                return list(self.confidence.get(sentiment, [0] * CONFIDENCE_BINS))
+            return [sum(bins) for bins in zip([0] * CONFIDENCE_BINS, *self.confidence.values())]
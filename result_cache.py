@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def prompt_version(prompt):
+    """Short fingerprint of a prompt, so editing a prompt stops old cache entries from matching"""
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+
+
+def cache_path_for(db_path):
+    """Cache file stored next to the reviews database, e.g. feedback.db -> feedback.cache.db"""
+    root, _ = os.path.splitext(os.path.abspath(db_path))
+    return root + ".cache.db"
+
+
+class ResultCache:
+    """Persistent SQLite cache of LLM results keyed by a hash of (model, prompt version, temperature, text).
+
+    Least recently used entries are evicted once the stored values exceed max_bytes.
+    """
+
+    def __init__(self, path, max_bytes=100 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # Shared by a sharded run's workers; writers take the lock up front and wait for it rather than failing
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level='IMMEDIATE')
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                prompt_version TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache(last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+    @staticmethod
+    def make_key(model, version, temperature, text):
+        payload = json.dumps([model, version, temperature, text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return json.loads(row[0])
+
+    def put(self, key, version, value):
+        value = json.dumps(value, ensure_ascii=False)
+        size = len(value.encode('utf-8')) + len(key)
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, prompt_version, value, size, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, version, value, size, time.time())
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of max_bytes"""
+        target = self.max_bytes * 0.9
+        while self.total_bytes > target:
+            rows = self.conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY last_used LIMIT 500").fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            evicted = []
+            for key, size in rows:
+                if self.total_bytes <= target:
+                    break
+                evicted.append((key,))
+                self.total_bytes -= size
+            self.conn.executemany("DELETE FROM llm_cache WHERE key = ?", evicted)
+
+    def invalidate(self, version=None):
+        """Delete entries for one prompt version, or every entry when version is None"""
+        with self.lock:
+            if version is None:
+                self.conn.execute("DELETE FROM llm_cache")
+            else:
+                self.conn.execute("DELETE FROM llm_cache WHERE prompt_version = ?", (version,))
+            self.conn.commit()
+            self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+            self.hits = 0
+            self.misses = 0
+
+    def entry_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,176 @@
+import importlib.util
+import json
+import sqlite3
+import time
+
+from results_store import quote_identifier
+
+# File extensions and the export format each one selects; any other path is written as a SQLite database
+EXPORT_FORMATS = {'.json': 'json', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.parquet': 'parquet'}
+
+# Rows handed to executemany, or gathered into one Parquet row group, at a time
+WRITE_BATCH_ROWS = 5000
+PARQUET_ROW_GROUP_ROWS = 20000
+
+# Progress is reported at most this often while exporting
+PROGRESS_SECONDS = 0.5
+
+_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+
+def export_format(path):
+    """'json', 'jsonl', 'parquet' or 'sqlite', from the path's extension"""
+    lowered = path.lower()
+    for extension, name in EXPORT_FORMATS.items():
+        if lowered.endswith(extension):
+            return name
+    return 'sqlite'
+
+
+def parquet_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def with_progress(results, total, on_progress, label="Exporting"):
+    """Pass results through, calling on_progress(text, percent) at most every PROGRESS_SECONDS"""
+    last = time.monotonic()
+    written = 0
+    for written, result in enumerate(results, 1):
+        yield result
+        now = time.monotonic()
+        if now - last >= PROGRESS_SECONDS:
+            last = now
+            on_progress(f"{label} {written}/{total}...", written / max(total, 1) * 100)
+    on_progress(f"{label} complete: {written} results", 100)
+
+
+def encode_result(result):
+    """One result as a JSON object. Aspects already given as JSON text are copied in as they are,
+    at the end of the object, rather than decoded and encoded again"""
+    aspects = result['aspects']
+    if not isinstance(aspects, str):
+        return _encode(result)
+    del result['aspects']
+    return _encode(result)[:-1] + ', "aspects": ' + aspects + '}'
+
+
+def write_json(results, path):
+    """A JSON array with one result per line, written as results arrive; returns the result count"""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for count, result in enumerate(results, 1):
+            f.write((',\n' if count > 1 else '\n') + encode_result(result))
+        f.write('\n]\n')
+    return count
+
+
+def write_jsonl(results, path):
+    """One JSON object per line, written as results arrive; returns the result count"""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for count, result in enumerate(results, 1):
+            f.write(encode_result(result) + '\n')
+    return count
+
+
+def write_parquet(results, path, row_group_rows=PARQUET_ROW_GROUP_ROWS):
+    """Columnar Parquet file written one row group at a time; aspects become a list of structs.
+
+    Needs pyarrow; returns the result count"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    schema = pa.schema([
+        ('review_id', pa.int64()),
+        ('review_text', pa.string()),
+        ('sentiment', pa.dictionary(pa.int8(), pa.string())),
+        ('confidence', pa.float64()),
+        ('aspects', pa.list_(pa.struct([('aspect', pa.string()), ('sentiment', pa.string())]))),
+        ('labeled_by', pa.dictionary(pa.int8(), pa.string())),
+        ('cluster_id', pa.int64()),
+    ])
+    count = 0
+    columns = {name: [] for name in schema.names}
+    with pq.ParquetWriter(path, schema) as writer:
+        for result in results:
+            for name, values in columns.items():
+                values.append(result[name])
+            columns['aspects'][-1] = [a for a in result['aspects'] if isinstance(a, dict)]
+            count += 1
+            if count % row_group_rows == 0:
+                writer.write_table(pa.table(columns, schema=schema))
+                columns = {name: [] for name in schema.names}
+        if columns['review_id']:
+            writer.write_table(pa.table(columns, schema=schema))
+    return count
+
+
+def write_sqlite(results, path, table, with_text=True, batch_rows=WRITE_BATCH_ROWS):
+    """Results in a table of path's database, one row per review, and their aspects in {table}_aspects,
+    one row per mention; returns the result count.
+
+    Both tables are replaced in a single transaction, so readers see the old or the new
+    results, never a mix. with_text=False leaves the review text out, for writing back
+    into the reviews database, where review_id is the review's rowid. Aspects may be
+    given as the stored JSON text."""
+    aspects_table = quote_identifier(table + '_aspects')
+    index = quote_identifier(table + '_aspects_aspect')
+    table = quote_identifier(table)
+    text_column = "review_text TEXT," if with_text else ""
+    columns = "review_id, review_text, sentiment, confidence, aspects, labeled_by, cluster_id" if with_text \
+        else "review_id, sentiment, confidence, aspects, labeled_by, cluster_id"
+    placeholders = ", ".join("?" * len(columns.split(", ")))
+    conn = sqlite3.connect(path, timeout=30)
+    count = 0
+    try:
+        # Dropping and recreating in the transaction also replaces tables written by older versions
+        conn.execute("BEGIN")
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.execute(f"DROP TABLE IF EXISTS {aspects_table}")
+        conn.execute(f"""
+            CREATE TABLE {table} (
+                review_id INTEGER PRIMARY KEY,
+                {text_column}
+                sentiment TEXT NOT NULL,
+                confidence REAL NOT NULL,
+                aspects TEXT NOT NULL,
+                labeled_by TEXT,
+                cluster_id INTEGER
+            )
+        """)
+        conn.execute(f"""
+            CREATE TABLE {aspects_table} (
+                review_id INTEGER NOT NULL,
+                aspect TEXT,
+                sentiment TEXT
+            )
+        """)
+        rows, mentions = [], []
+        for result in results:
+            aspects = result['aspects']
+            if isinstance(aspects, str):
+                stored, aspects = aspects, json.loads(aspects)
+            else:
+                stored = json.dumps(aspects)
+            row = (result['review_id'], result['sentiment'], result['confidence'], stored,
+                   result['labeled_by'], result['cluster_id'])
+            rows.append(row[:1] + (result['review_text'],) + row[1:] if with_text else row)
+            mentions.extend((result['review_id'], a.get('aspect'), a.get('sentiment'))
+                            for a in aspects if isinstance(a, dict))
+            if len(rows) >= batch_rows:
+                conn.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+                conn.executemany(f"INSERT INTO {aspects_table} VALUES (?, ?, ?)", mentions)
+                count += len(rows)
+                rows, mentions = [], []
+        conn.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+        conn.executemany(f"INSERT INTO {aspects_table} VALUES (?, ?, ?)", mentions)
+        count += len(rows)
+        # Built once the rows are in, which is faster than keeping it up to date row by row
+        conn.execute(f"CREATE INDEX {index} ON {aspects_table}(aspect, sentiment)")
+        conn.commit()
+    finally:
+        conn.close()
+    return count
@@ -0,0 +1,477 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from array import array
+
+from search_index import SearchIndex
+
+
+def text_hash(text):
+    """Stable fingerprint of a review's text, used to detect edited reviews"""
+    return hashlib.sha1((text or "").encode('utf-8')).hexdigest()
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+# Tables the app keeps in the reviews database, besides the write-back tables; the full-text index
+# is stored as review_search and its review_search_* shadow tables
+APP_TABLES = ('analysis_results', 'analysis_runs', 'analysis_failures', 'review_clusters', 'review_signatures',
+              'review_aspects')
+DEFAULT_WRITE_BACK_TABLE = 'sentiment_results'
+
+
+def is_results_table(name):
+    """Whether a table is one results, runs or the search indexes are kept in, or SQLite's own"""
+    lowered = name.lower()
+    return lowered in APP_TABLES or lowered.startswith(('review_search', 'sqlite_'))
+
+
+def is_app_table(name, tables=()):
+    """Whether a table is one the app created rather than one of reviews: a results table, or a
+    write-back table, which come in pairs of name and name_aspects among tables"""
+    lowered = name.lower()
+    names = {table.lower() for table in tables}
+    return (is_results_table(name)
+            or lowered in (DEFAULT_WRITE_BACK_TABLE, f"{DEFAULT_WRITE_BACK_TABLE}_aspects")
+            or f"{lowered}_aspects" in names
+            or (lowered.endswith('_aspects') and lowered[:-len('_aspects')] in names))
+
+
+# Columns the results view may sort by
+SORT_COLUMNS = ('review_id', 'sentiment', 'confidence')
+
+# Filters on aspects or words matching more results than this are paged by walking the sort order and
+# checking each result against the search indexes, which stops at the end of the page; fewer matches
+# are looked up in the indexes and sorted
+STREAM_MATCHES = 20000
+
+SEARCH_FILTERS = ('aspect', 'aspect_sentiment', 'query')
+
+
+class ResultsStore:
+    """Analysis results persisted in the reviews database, keyed by review id and text hash"""
+
+    def __init__(self, source):
+        self.source = source
+        self.table = source.table
+        self.text_column = source.text_column
+        self.id_column = source.id_column
+        self.lock = threading.Lock()
+        # Write transactions take the write lock when they begin, so processes saving at once (a sharded
+        # run's workers) wait their turn for up to the timeout; a deferred transaction that read first
+        # would fail with "database is locked" as soon as another process committed
+        self.conn = sqlite3.connect(source.db_path, check_same_thread=False, timeout=30, isolation_level='IMMEDIATE')
+        self.conn.create_function('text_hash', 1, text_hash, deterministic=True)
+        # WAL lets each checkpoint commit append to the log instead of rewriting pages, and lets
+        # readers (the Results tab, exports) carry on while a run writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_results (
+                review_id INTEGER PRIMARY KEY,
+                text_hash TEXT NOT NULL,
+                sentiment TEXT NOT NULL,
+                confidence REAL NOT NULL,
+                aspects TEXT,
+                analyzed_at REAL NOT NULL,
+                labeled_by TEXT NOT NULL DEFAULT 'api',
+                cluster_id INTEGER,
+                run_id INTEGER
+            )
+        """)
+        # Tables created before sentiment could come from the local classifier, before deduplication
+        # or before runs were recorded
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(analysis_results)")}
+        if 'labeled_by' not in columns:
+            self.conn.execute("ALTER TABLE analysis_results ADD COLUMN labeled_by TEXT NOT NULL DEFAULT 'api'")
+        if 'cluster_id' not in columns:
+            self.conn.execute("ALTER TABLE analysis_results ADD COLUMN cluster_id INTEGER")
+        if 'run_id' not in columns:
+            self.conn.execute("ALTER TABLE analysis_results ADD COLUMN run_id INTEGER")
+        # One row per analysis run; completed is updated in the same transaction as each checkpoint
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                settings TEXT NOT NULL,
+                status TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                completed INTEGER NOT NULL DEFAULT 0,
+                started_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # Duplicate clusters: every member of a cluster with more than one review, including its representative,
+        # whose review id is the cluster id
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS review_clusters (
+                review_id INTEGER PRIMARY KEY,
+                cluster_id INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS review_clusters_cluster ON review_clusters(cluster_id)")
+        # MinHash signatures of deduplicated reviews, so later runs only compute them for new or edited reviews
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS review_signatures (
+                review_id INTEGER PRIMARY KEY,
+                text_hash TEXT NOT NULL,
+                signature BLOB NOT NULL
+            )
+        """)
+        # Reviews whose responses could not be used even after retrying, instead of a made-up neutral result;
+        # a review leaves this table when a later run saves a result for it
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS analysis_failures (
+                review_id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                failed_at REAL NOT NULL,
+                run_id INTEGER
+            )
+        """)
+        # Indexes that let sorted, filtered pages be read without scanning every result
+        self.conn.execute("CREATE INDEX IF NOT EXISTS analysis_results_sentiment ON analysis_results(sentiment, review_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS analysis_results_confidence ON analysis_results(confidence, review_id)")
+        # Full-text and aspect indexes for search and drill-down, kept up to date as results are saved
+        self.search = SearchIndex(self.conn, self.source)
+        if self.search.created:
+            self.search.rebuild()
+        self.conn.commit()
+
+    def pending_filter(self, need_aspects=False):
+        """(join, condition) selecting reviews that are new, edited, or (optionally) still missing aspects"""
+        condition = f"r.review_id IS NULL OR r.text_hash != text_hash(v.{self.text_column})"
+        if need_aspects:
+            condition += " OR r.aspects IS NULL"
+        return f"LEFT JOIN analysis_results r ON r.review_id = v.{self.id_column}", condition
+
+    def analyzed_filter(self, missing_aspects_only=False):
+        """(join, condition) selecting reviews that already have a stored result"""
+        return (f"JOIN analysis_results r ON r.review_id = v.{self.id_column}",
+                "r.aspects IS NULL" if missing_aspects_only else "")
+
+    def run_filter(self, run_id, base=None):
+        """(join, condition) selecting reviews the run has not saved yet, optionally narrowing a
+        (join, condition) that already joins the results as alias r"""
+        join, condition = base or (f"LEFT JOIN analysis_results r ON r.review_id = v.{self.id_column}", "")
+        done = f"r.run_id IS NOT {int(run_id)}"
+        return join, f"({condition}) AND {done}" if condition else done
+
+    def start_run(self, kind, total, settings):
+        """Record a new run as running; returns its run id"""
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO analysis_runs (kind, settings, status, total, started_at, updated_at) "
+                "VALUES (?, ?, 'running', ?, ?, ?)", (kind, json.dumps(settings), total, now, now))
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def resume_run(self, run_id, total):
+        """Mark an unfinished run as running again, now expecting total reviews in all"""
+        with self.lock:
+            self.conn.execute("UPDATE analysis_runs SET status = 'running', total = ?, updated_at = ? "
+                              "WHERE run_id = ?", (total, time.time(), run_id))
+            self.conn.commit()
+
+    def finish_run(self, run_id, status):
+        """Record a run as 'complete' or 'interrupted'"""
+        with self.lock:
+            self.conn.execute("UPDATE analysis_runs SET status = ?, updated_at = ? WHERE run_id = ?",
+                              (status, time.time(), run_id))
+            self.search.refresh()
+            self.conn.commit()
+
+    def mark_abandoned_runs(self):
+        """Runs still marked running when the store is opened were cut off by a crash; mark them interrupted"""
+        with self.lock:
+            cursor = self.conn.execute("UPDATE analysis_runs SET status = 'interrupted' WHERE status = 'running'")
+            self.conn.commit()
+            return cursor.rowcount
+
+    def unfinished_run(self):
+        """The most recent run if it did not complete, as a dict, else None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT run_id, kind, settings, status, total, completed, started_at FROM analysis_runs "
+                "ORDER BY run_id DESC LIMIT 1").fetchone()
+        if row is None or row[3] == 'complete':
+            return None
+        run_id, kind, settings, status, total, completed, started_at = row
+        return {'run_id': run_id, 'kind': kind, 'settings': json.loads(settings), 'status': status,
+                'total': total, 'completed': completed, 'started_at': started_at}
+
+    def _count_progress(self, run_id, count):
+        if run_id is not None and count:
+            self.conn.execute("UPDATE analysis_runs SET completed = completed + ?, updated_at = ? WHERE run_id = ?",
+                              (count, time.time(), run_id))
+
+    def representatives_filter(self):
+        """(join, condition) selecting reviews that are not a duplicate of another review"""
+        return (f"LEFT JOIN review_clusters c ON c.review_id = v.{self.id_column}",
+                f"c.cluster_id IS NULL OR c.cluster_id = v.{self.id_column}")
+
+    def replace_clusters(self, assignments):
+        """Store duplicate clusters from a {duplicate review id: cluster id} mapping, replacing the previous ones"""
+        rows = list(assignments.items())
+        rows.extend((cluster_id, cluster_id) for cluster_id in set(assignments.values()))
+        with self.lock:
+            self.conn.execute("DELETE FROM review_clusters")
+            self.conn.executemany("INSERT OR REPLACE INTO review_clusters (review_id, cluster_id) VALUES (?, ?)", rows)
+            self.conn.execute("UPDATE analysis_results SET cluster_id = "
+                              "(SELECT c.cluster_id FROM review_clusters c WHERE c.review_id = analysis_results.review_id)")
+            self.conn.commit()
+
+    def signatures(self, reviews):
+        """{review_id: MinHash signature} stored for a chunk of (review_id, text) in id order, leaving out
+        reviews whose text has changed since"""
+        if not reviews:
+            return {}
+        hashes = {review_id: text_hash(text) for review_id, text in reviews}
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT review_id, text_hash, signature FROM review_signatures WHERE review_id BETWEEN ? AND ?",
+                (reviews[0][0], reviews[-1][0])).fetchall()
+        return {review_id: array('I', signature) for review_id, stored_hash, signature in rows
+                if hashes.get(review_id) == stored_hash}
+
+    def save_signatures(self, rows):
+        """Store MinHash signatures from (review_id, text, signature) rows"""
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO review_signatures (review_id, text_hash, signature) VALUES (?, ?, ?)",
+                [(review_id, text_hash(text), signature.tobytes()) for review_id, text, signature in rows])
+            self.conn.commit()
+
+    def fan_out(self, cluster_ids=None):
+        """Copy representatives' results to the duplicates in their clusters that have no result, an older one
+        or one for different text; only for the given cluster ids when passed.
+
+        Returns the copied results as (review_id, sentiment, confidence, aspects) rows."""
+        where, params = "", []
+        if cluster_ids is not None:
+            if not cluster_ids:
+                return []
+            where = f"AND c.cluster_id IN ({','.join('?' * len(cluster_ids))})"
+            params = list(cluster_ids)
+        with self.lock:
+            rows = self.conn.execute(f"""
+                SELECT c.review_id, v.{self.text_column}, r.sentiment, r.confidence, r.aspects,
+                       r.labeled_by, c.cluster_id, r.run_id
+                FROM review_clusters c
+                JOIN analysis_results r ON r.review_id = c.cluster_id
+                JOIN {self.table} v ON v.{self.id_column} = c.review_id
+                LEFT JOIN analysis_results m ON m.review_id = c.review_id
+                WHERE c.review_id != c.cluster_id {where}
+                  AND (m.review_id IS NULL OR m.analyzed_at < r.analyzed_at
+                       OR m.text_hash != text_hash(v.{self.text_column}))
+            """, params).fetchall()
+            now = time.time()
+            hashes = [text_hash(text) for _, text, _, _, _, _, _, _ in rows]
+            self.search.index_text([(row[0], row[1], hashed) for row, hashed in zip(rows, hashes)])
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO analysis_results "
+                "(review_id, text_hash, sentiment, confidence, aspects, analyzed_at, labeled_by, cluster_id, run_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(review_id, hashed, sentiment, confidence, aspects, now, labeled_by, cluster_id, run_id)
+                 for (review_id, _, sentiment, confidence, aspects, labeled_by, cluster_id, run_id), hashed
+                 in zip(rows, hashes)]
+            )
+            self.search.index_aspects([(review_id, json.loads(aspects) if aspects else None)
+                                       for review_id, _, _, _, aspects, _, _, _ in rows])
+            self.conn.commit()
+        return [(review_id, sentiment, confidence, json.loads(aspects) if aspects else [])
+                for review_id, _, sentiment, confidence, aspects, _, _, _ in rows]
+
+    def save_results(self, rows, run_id=None):
+        """Insert or update results from (review_id, text, sentiment, confidence, aspects or None, labeled_by) rows.
+
+        labeled_by is 'api' or 'local' for sentiment from the local pre-classifier. aspects None
+        keeps the aspects already stored for the review unless its text has changed since. Each
+        result records the review's duplicate cluster, if it has one, and the run that saved it.
+        The rows and the run's progress are committed in one transaction."""
+        now = time.time()
+        with self.lock:
+            hashes = [text_hash(text) for _, text, _, _, _, _ in rows]
+            self.search.index_text([(row[0], row[1], hashed) for row, hashed in zip(rows, hashes)])
+            self.conn.executemany(
+                "INSERT INTO analysis_results "
+                "(review_id, text_hash, sentiment, confidence, aspects, analyzed_at, labeled_by, cluster_id, run_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT cluster_id FROM review_clusters WHERE review_id = ?), ?) "
+                "ON CONFLICT(review_id) DO UPDATE SET sentiment = excluded.sentiment, "
+                "confidence = excluded.confidence, analyzed_at = excluded.analyzed_at, "
+                "labeled_by = excluded.labeled_by, cluster_id = excluded.cluster_id, run_id = excluded.run_id, "
+                "aspects = CASE WHEN excluded.aspects IS NOT NULL THEN excluded.aspects "
+                "WHEN text_hash = excluded.text_hash THEN aspects END, "
+                "text_hash = excluded.text_hash",
+                [(review_id, hashed, sentiment, confidence,
+                  json.dumps(aspects) if aspects is not None else None, now, labeled_by, review_id, run_id)
+                 for (review_id, _, sentiment, confidence, aspects, labeled_by), hashed in zip(rows, hashes)]
+            )
+            self.search.index_aspects([(review_id, aspects) for review_id, _, _, _, aspects, _ in rows])
+            self._clear_failures(row[0] for row in rows)
+            self._count_progress(run_id, len(rows))
+            self.conn.commit()
+
+    def save_aspects(self, rows, run_id=None):
+        """Attach aspects to already stored results from (review_id, aspects) rows"""
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE analysis_results SET aspects = ?, analyzed_at = ?, run_id = COALESCE(?, run_id) "
+                "WHERE review_id = ?",
+                [(json.dumps(aspects), now, run_id, review_id) for review_id, aspects in rows]
+            )
+            self.search.index_aspects(rows)
+            self._clear_failures(review_id for review_id, _ in rows)
+            self._count_progress(run_id, len(rows))
+            self.conn.commit()
+
+    def _clear_failures(self, review_ids):
+        self.conn.executemany("DELETE FROM analysis_failures WHERE review_id = ?",
+                              [(review_id,) for review_id in review_ids])
+
+    def mark_failed(self, review_ids, kind, attempts, run_id=None):
+        """Record reviews the run could not get a usable response for after attempts tries each"""
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO analysis_failures (review_id, kind, attempts, failed_at, run_id) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(review_id) DO UPDATE SET kind = excluded.kind, "
+                "attempts = attempts + excluded.attempts, failed_at = excluded.failed_at, run_id = excluded.run_id",
+                [(review_id, kind, attempts, now, run_id) for review_id in review_ids]
+            )
+            self.conn.commit()
+
+    def failure_count(self):
+        """Number of reviews currently marked as failed"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM analysis_failures").fetchone()[0]
+
+    def prune_deleted(self):
+        """Drop results whose review no longer exists; returns the number removed.
+
+        When no stored result matches a review of the source, the source is taken to be the
+        wrong table rather than every review deleted: nothing is removed and None is returned"""
+        with self.lock:
+            reviews = f"SELECT {self.id_column} FROM {self.table}"
+            has_results, matched = self.conn.execute(
+                f"SELECT EXISTS (SELECT 1 FROM analysis_results), "
+                f"EXISTS (SELECT 1 FROM analysis_results WHERE review_id IN ({reviews}))").fetchone()
+            if has_results and not matched:
+                return None
+            cursor = self.conn.execute(f"DELETE FROM analysis_results WHERE review_id NOT IN ({reviews})")
+            self.conn.execute(f"DELETE FROM analysis_failures WHERE review_id NOT IN ({reviews})")
+            self.conn.execute(f"DELETE FROM review_signatures WHERE review_id NOT IN ({reviews})")
+            if cursor.rowcount:
+                self.search.remove_missing()
+            self.conn.commit()
+            return cursor.rowcount
+
+    def iter_results(self, chunk_size=1000):
+        """Stored results as (review_id, sentiment, confidence, aspects) rows, read one chunk at a time;
+        only those of the source's id range when it has one"""
+        low, high = self.source.id_range or (None, None)
+        last_id = -1 if low is None else int(low) - 1
+        bound = "" if high is None else f"AND review_id < {int(high)} "
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT review_id, sentiment, confidence, aspects FROM analysis_results "
+                    f"WHERE review_id > ? {bound}ORDER BY review_id LIMIT ?", (last_id, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for review_id, sentiment, confidence, aspects in rows:
+                yield review_id, sentiment, confidence, json.loads(aspects) if aspects else []
+
+    def _filter_sql(self, sentiment=None, min_confidence=None, aspect=None, aspect_sentiment=None, query=None,
+                    correlated=False):
+        clauses, params = [], []
+        if sentiment:
+            clauses.append("sentiment = ?")
+            params.append(sentiment)
+        if min_confidence is not None:
+            clauses.append("confidence >= ?")
+            params.append(min_confidence)
+        # Aspects and words are looked up in the search indexes rather than scanning every result
+        search_clauses, search_params = self.search.filter_sql(aspect, aspect_sentiment, query, correlated)
+        clauses.extend(search_clauses)
+        params.extend(search_params)
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count_results(self, **filters):
+        """Number of stored results matching the sentiment / min_confidence / aspect / aspect_sentiment / query
+        filters; query finds reviews containing all of its words"""
+        with self.lock:
+            return self._count(filters)
+
+    def _count(self, filters):
+        if not any(filters.get(name) is not None for name in ('sentiment', 'min_confidence')):
+            # Only aspects and words: counted from the search indexes without touching the results
+            count = self.search.count(**{name: filters.get(name) for name in SEARCH_FILTERS})
+            if count is not None:
+                return count
+        where, params = self._filter_sql(**filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM analysis_results {where}", params).fetchone()[0]
+
+    def query_results(self, offset, limit, order_by='review_id', descending=False, **filters):
+        """One page of matching results as (review_id, sentiment, confidence, aspects) rows"""
+        if order_by not in SORT_COLUMNS:
+            raise ValueError(f"cannot sort by {order_by!r}")
+        direction = "DESC" if descending else "ASC"
+        with self.lock:
+            many = self.search.more_than(STREAM_MATCHES, **{name: filters.get(name) for name in SEARCH_FILTERS})
+            where, params = self._filter_sql(correlated=bool(many), **filters)
+            rows = self.conn.execute(
+                f"SELECT review_id, sentiment, confidence, aspects FROM analysis_results {where} "
+                f"ORDER BY {order_by} {direction}, review_id {direction} LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [(review_id, sentiment, confidence, json.loads(aspects) if aspects else [])
+                for review_id, sentiment, confidence, aspects in rows]
+
+    def review_excerpts(self, review_ids, query=None):
+        """{review id: start of its text}, or the part around a search query's words"""
+        with self.lock:
+            return self.search.snippets(review_ids, query)
+
+    def iter_results_with_text(self, chunk_size=500, raw_aspects=False):
+        """Stored results joined with their review text, read one chunk at a time.
+
+        raw_aspects=True leaves each result's aspects as the stored JSON text, for writers
+        that would only encode them again"""
+        join, condition = self.analyzed_filter()
+        conn = self.source.connect()
+        try:
+            # Every stored result, including those outside the source's current filter or sample
+            for chunk in self.source.iter_chunks(chunk_size, join, condition, conn=conn, scoped=False):
+                ids = [review_id for review_id, _ in chunk]
+                placeholders = ",".join("?" * len(ids))
+                stored = {row[0]: row[1:] for row in conn.execute(
+                    f"SELECT review_id, sentiment, confidence, aspects, labeled_by, cluster_id FROM analysis_results "
+                    f"WHERE review_id IN ({placeholders})", ids)}
+                for review_id, text in chunk:
+                    sentiment, confidence, aspects, labeled_by, cluster_id = stored[review_id]
+                    yield {
+                        'review_id': review_id,
+                        'review_text': text,
+                        'sentiment': sentiment,
+                        'confidence': confidence,
+                        'aspects': (aspects or '[]') if raw_aspects else json.loads(aspects) if aspects else [],
+                        'labeled_by': labeled_by,
+                        'cluster_id': cluster_id
+                    }
+        finally:
+            conn.close()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
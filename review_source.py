@@ -0,0 +1,310 @@
+import queue
+import re
+import sqlite3
+import threading
+
+from results_store import text_hash, quote_identifier
+
+_DONE = object()
+
+# Keyset pagination starts below every 64-bit id
+_BEFORE_FIRST_ID = -(1 << 63)
+
+# A review is sampled when a multiplicative (Fibonacci) hash of its id and the seed, taken
+# mod 2**32, falls below the sample fraction of 2**32. It is plain SQL arithmetic, so a
+# sampled scan never calls back into Python
+_HASH_MULTIPLIER = 2654435761
+_HASH_RANGE = 1 << 32
+
+
+def _literal(value):
+    """SQL literal for a number or string a column is compared with"""
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class SourceSpec:
+    """Which reviews to analyze: the table, its id and text columns, and an optional filter and sample.
+
+    table, id_column and text_column default to the review table found by name, its rowid
+    and its last column. id_column must hold unique integers, since results are keyed by
+    it. where is an SQL condition on the table's columns (qualify them as v.column if they
+    share a name with a results column). date_column keeps reviews with date_from <= value
+    <= date_to, either bound optional, compared as stored, so ISO dates or timestamps.
+    sample keeps a deterministic fraction of the reviews left, picked by a hash of the
+    review id and seed; with stratify_by it keeps that fraction of each of the column's
+    values, at least one review each.
+    """
+
+    def __init__(self, table=None, id_column=None, text_column=None, where=None, date_column=None,
+                 date_from=None, date_to=None, sample=None, stratify_by=None, seed=0):
+        if sample is not None and not 0 < sample <= 1:
+            raise ValueError("sample must be a fraction above 0 and at most 1")
+        if (date_from is not None or date_to is not None) and not date_column:
+            raise ValueError("a date range needs a date column")
+        if stratify_by and sample is None:
+            raise ValueError("stratified sampling needs a sample fraction")
+        self.table = table
+        self.id_column = id_column
+        self.text_column = text_column
+        self.where = where
+        self.date_column = date_column
+        self.date_from = date_from
+        self.date_to = date_to
+        self.sample = sample
+        self.stratify_by = stratify_by
+        self.seed = int(seed)
+
+
+class ReviewSource:
+    """The table, id and text columns reviews are read from, read in keyset-paginated chunks.
+
+    spec narrows the reviews to the filter and sample of a SourceSpec; only the id and
+    text columns are ever selected. id_range=(low, high) restricts it further to the
+    reviews with low <= id < high, either bound None for open-ended, as one shard of a
+    sharded run sees the table."""
+
+    def __init__(self, db_path, table_name, text_column, id_range=None, spec=None):
+        self.db_path = db_path
+        self.table_name = table_name
+        self.text_column_name = text_column
+        self.table = quote_identifier(table_name)
+        self.text_column = quote_identifier(text_column)
+        self.id_range = id_range
+        self.spec = spec or SourceSpec()
+        # Results are keyed by the id column; the table's rowid unless the spec names one
+        self.id_column_name = self.spec.id_column or 'rowid'
+        self.id_column = quote_identifier(self.spec.id_column) if self.spec.id_column else 'rowid'
+        self._scope_condition = None
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.create_function('text_hash', 1, text_hash, deterministic=True)
+        return conn
+
+    def _sample_key(self):
+        return f"(((v.{self.id_column} + {self.spec.seed}) * {_HASH_MULTIPLIER}) & {_HASH_RANGE - 1})"
+
+    @property
+    def scope(self):
+        """The spec's filter and sample, built on first use: a stratified sample queries the table, so this
+        waits until validate() has checked the columns it names"""
+        if self._scope_condition is None:
+            self._scope_condition = self._scope()
+        return self._scope_condition
+
+    def _scope(self):
+        """The spec's filter and sample as one condition on alias v; empty when it selects every review"""
+        spec = self.spec
+        clauses = []
+        if spec.where:
+            clauses.append(f"({spec.where})")
+        if spec.date_column:
+            column = f"v.{quote_identifier(spec.date_column)}"
+            if spec.date_from is not None:
+                clauses.append(f"{column} >= {_literal(spec.date_from)}")
+            if spec.date_to is not None:
+                clauses.append(f"{column} <= {_literal(spec.date_to)}")
+        if spec.sample is not None and spec.stratify_by:
+            clauses.append(self._stratified_sample(" AND ".join(clauses) or "1"))
+        elif spec.sample is not None and spec.sample < 1:
+            clauses.append(f"{self._sample_key()} < {int(spec.sample * _HASH_RANGE)}")
+        return " AND ".join(clauses)
+
+    def _stratified_sample(self, filters):
+        """Condition keeping the lowest-hashing reviews of each stratum, up to the sample fraction of it.
+
+        Each stratum's cut-off hash is found once here, with one window query, so reading the
+        sample is a per-row comparison rather than a sort of the table for every chunk"""
+        key = self._sample_key()
+        stratum = f"v.{quote_identifier(self.spec.stratify_by)}"
+        conn = self.connect()
+        try:
+            cutoffs = conn.execute(
+                f"SELECT stratum, sample_key FROM (SELECT {stratum} AS stratum, {key} AS sample_key, "
+                f"ROW_NUMBER() OVER (PARTITION BY {stratum} ORDER BY {key}) AS position, "
+                f"COUNT(*) OVER (PARTITION BY {stratum}) AS size FROM {self.table} v WHERE {filters}) "
+                f"WHERE position = MAX(1, ROUND(size * {float(self.spec.sample)}))").fetchall()
+        finally:
+            conn.close()
+        null_cutoff = next((cutoff for value, cutoff in cutoffs if value is None), -1)
+        cases = " ".join(f"WHEN {_literal(value)} THEN {cutoff}" for value, cutoff in cutoffs if value is not None)
+        return (f"{key} <= CASE WHEN {stratum} IS NULL THEN {null_cutoff} "
+                f"ELSE CASE {stratum} {cases} ELSE -1 END END") if cases else f"{key} <= {null_cutoff}"
+
+    def _where(self, condition, scoped=True):
+        clauses = [self.scope] if scoped and self.scope else []
+        low, high = self.id_range or (None, None)
+        if low is not None:
+            clauses.append(f"v.{self.id_column} >= {int(low)}")
+        if high is not None:
+            clauses.append(f"v.{self.id_column} < {int(high)}")
+        if condition:
+            clauses.append(f"({condition})")
+        return "".join(f" AND {clause}" for clause in clauses)
+
+    def columns(self):
+        """[(name, declared type, primary key position)] of the table's columns"""
+        conn = self.connect()
+        try:
+            return [(row[1], row[2], row[5]) for row in conn.execute(f"PRAGMA table_info({self.table})")]
+        finally:
+            conn.close()
+
+    def validate(self):
+        """Raise ValueError if a column the spec names is missing, or the id column does not hold integers"""
+        columns = {name.lower(): declared for name, declared, _ in self.columns()}
+        if not columns:
+            raise ValueError(f"no table {self.table_name!r} in the database")
+        spec = self.spec
+        for name in (self.text_column_name, spec.id_column, spec.date_column, spec.stratify_by):
+            if name and name.lower() not in columns:
+                raise ValueError(f"no column {name!r} in table {self.table_name!r}")
+        if spec.id_column and 'INT' not in (columns[spec.id_column.lower()] or '').upper():
+            raise ValueError(f"id column {spec.id_column!r} must be declared as an integer column")
+        # Compiles the filter, so a mistake in it is reported now rather than when a run starts
+        conn = self.connect()
+        try:
+            conn.execute(f"EXPLAIN SELECT v.{self.id_column} FROM {self.table} v WHERE 1{self._where('')}")
+        except sqlite3.Error as e:
+            raise ValueError(f"invalid review filter: {str(e)}")
+        finally:
+            conn.close()
+
+    def missing_indexes(self):
+        """CREATE INDEX statements for the columns the spec pages, filters or samples on that no index starts with"""
+        columns = self.columns()
+        names = [name for name, _, _ in columns]
+        keys = [name for name, _, pk in columns if pk]
+        indexed = set()
+        # An INTEGER PRIMARY KEY is the rowid itself
+        if len(keys) == 1 and [declared for name, declared, pk in columns if pk][0].upper() == 'INTEGER':
+            indexed.add(keys[0].lower())
+        conn = self.connect()
+        try:
+            for index in conn.execute(f"PRAGMA index_list({self.table})").fetchall():
+                first = conn.execute(f"PRAGMA index_info({quote_identifier(index[1])})").fetchone()
+                if first and first[2]:
+                    indexed.add(first[2].lower())
+        finally:
+            conn.close()
+        spec = self.spec
+        wanted = [spec.id_column, spec.date_column, spec.stratify_by]
+        if spec.where:
+            wanted.extend(name for name in names if re.search(rf"\b{re.escape(name)}\b", spec.where, re.IGNORECASE))
+        statements = []
+        for name in dict.fromkeys(name for name in wanted if name):
+            if name.lower() not in indexed:
+                index = quote_identifier(f"{self.table_name}_{name}")
+                statements.append(f"CREATE INDEX IF NOT EXISTS {index} ON {self.table}({quote_identifier(name)})")
+        return statements
+
+    def create_indexes(self, statements):
+        conn = self.connect()
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def count(self, join="", condition="", scoped=True):
+        """Number of reviews, optionally restricted by a join and condition on alias v"""
+        conn = self.connect()
+        try:
+            where = self._where(condition, scoped)
+            if not join and not where:
+                return conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            return conn.execute(f"SELECT COUNT(*) FROM {self.table} v {join} WHERE 1{where}").fetchone()[0]
+        finally:
+            conn.close()
+
+    def iter_chunks(self, chunk_size=1000, join="", condition="", conn=None, scoped=True):
+        """Yield lists of (review_id, text), walking the table by id (WHERE id > ? ORDER BY id LIMIT ?).
+
+        scoped=False reads past the spec's filter and sample, e.g. to join stored results to their text"""
+        own_conn = conn is None
+        conn = conn or self.connect()
+        query = (f"SELECT v.{self.id_column}, v.{self.text_column} FROM {self.table} v {join} "
+                 f"WHERE v.{self.id_column} > ?{self._where(condition, scoped)} ORDER BY v.{self.id_column} LIMIT ?")
+        try:
+            last_id = _BEFORE_FIRST_ID
+            while True:
+                rows = conn.execute(query, (last_id, chunk_size)).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                yield [(review_id, str(text) if text is not None else "") for review_id, text in rows]
+                if len(rows) < chunk_size:
+                    break
+        finally:
+            if own_conn:
+                conn.close()
+
+    def split_points(self, parts, join="", condition=""):
+        """Ascending ids splitting the selected reviews into `parts` runs of about equal size,
+        each id starting a run; fewer when there are fewer reviews than parts"""
+        count = self.count(join, condition)
+        targets = {count * k // parts for k in range(1, parts)}
+        points = []
+        conn = self.connect()
+        try:
+            rows = conn.execute(f"SELECT v.{self.id_column} FROM {self.table} v {join} "
+                                f"WHERE 1{self._where(condition)} ORDER BY v.{self.id_column}")
+            for position, (review_id,) in enumerate(rows):
+                if position in targets and position:
+                    points.append(review_id)
+        finally:
+            conn.close()
+        return points
+
+    def read_text(self, review_id):
+        conn = self.connect()
+        try:
+            row = conn.execute(f"SELECT {self.text_column} FROM {self.table} WHERE {self.id_column} = ?",
+                               (review_id,)).fetchone()
+            return str(row[0]) if row and row[0] is not None else ""
+        finally:
+            conn.close()
+
+
+class ReviewStream:
+    """Iterates (review_id, text) pairs read on a background thread through a bounded queue of chunks"""
+
+    def __init__(self, source, chunk_size=1000, max_chunks=4, join="", condition=""):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.join = join
+        self.condition = condition
+        self.chunks = queue.Queue(maxsize=max_chunks)
+        self.stopped = threading.Event()
+
+    def _produce(self):
+        try:
+            for chunk in self.source.iter_chunks(self.chunk_size, self.join, self.condition):
+                while not self.stopped.is_set():
+                    try:
+                        self.chunks.put(chunk, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if self.stopped.is_set():
+                    return
+            self.chunks.put(_DONE)
+        except Exception as e:
+            self.chunks.put(e)
+
+    def __iter__(self):
+        reader = threading.Thread(target=self._produce, daemon=True)
+        reader.start()
+        try:
+            while True:
+                chunk = self.chunks.get()
+                if chunk is _DONE:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield from chunk
+        finally:
+            self.stopped.set()
@@ -0,0 +1,224 @@
+import json
+import re
+import sqlite3
+
+# Words, optionally ending in * for a prefix search, taken from what the user typed; anything
+# else (quotes, operators, punctuation) is dropped rather than parsed as FTS5 query syntax
+_TERM = re.compile(r"[^\W_]+(?:['\-][^\W_]+)*\*?")
+
+# Words in a search excerpt, and characters shown of a review when there is no search
+SNIPPET_WORDS = 16
+EXCERPT_CHARS = 200
+
+
+def _literal(name):
+    return "'" + name.replace("'", "''") + "'"
+
+
+def match_expression(query):
+    """An FTS5 MATCH expression finding reviews containing every word of a typed query, or '' if it has none"""
+    terms = []
+    for term in _TERM.findall(query or ""):
+        prefix = term.endswith('*')
+        terms.append('"' + term.rstrip('*') + '"' + ('*' if prefix else ''))
+    return " ".join(terms)
+
+
+class SearchIndex:
+    """Full-text index of analyzed reviews' text, and an inverted index from aspect to review ids.
+
+    Both live in the reviews database beside analysis_results: review_search is an FTS5
+    table whose rowid is the review id, review_aspects holds one (aspect, review id,
+    aspect sentiment) row per aspect mention. review_search is an external-content table
+    over the reviews table, so it keeps only the index and reads text from the reviews
+    themselves. ResultsStore updates both in the same transaction as the results they
+    index, so they cover exactly the stored results; methods use the store's connection
+    and leave locking and committing to it. Without FTS5 in the SQLite build, full_text
+    is False and only the aspect index is kept.
+    """
+
+    def __init__(self, conn, source):
+        self.conn = conn
+        self.table = source.table
+        self.id_column = source.id_column
+        self.text_column = source.text_column
+        existing = dict(conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE name IN ('review_search', 'review_aspects')").fetchall())
+        # Keyed by aspect first, so an aspect's reviews are one range scan in review id order
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS review_aspects (
+                aspect TEXT NOT NULL,
+                review_id INTEGER NOT NULL,
+                sentiment TEXT NOT NULL,
+                PRIMARY KEY (aspect, review_id, sentiment)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS review_aspects_review ON review_aspects(review_id)")
+        # Results saved again after their review was edited: their entries still hold the old text's words,
+        # which an external-content index cannot delete without that text, so the index is rebuilt by refresh()
+        conn.execute("CREATE TABLE IF NOT EXISTS review_search_stale (review_id INTEGER PRIMARY KEY)")
+        definition = (f"CREATE VIRTUAL TABLE review_search USING fts5({self.text_column}, "
+                      f"content={_literal(source.table_name)}, content_rowid={_literal(source.id_column_name)}, "
+                      f"tokenize='porter unicode61 remove_diacritics 2')")
+        try:
+            # An index over another reviews table, or one from before it read text from the reviews table
+            if existing.get('review_search', definition) != definition:
+                conn.execute("DROP TABLE review_search")
+                del existing['review_search']
+            if 'review_search' not in existing:
+                conn.execute(definition)
+            self.full_text = True
+        except sqlite3.OperationalError:
+            self.full_text = False
+            existing['review_search'] = None
+        # True when either index was just created and has to be built from the results already stored
+        self.created = len(existing) < 2
+
+    def rebuild(self):
+        """Index every stored result from scratch, reading review text from the reviews table"""
+        self.conn.execute("DELETE FROM review_aspects")
+        self.conn.execute("""
+            INSERT OR IGNORE INTO review_aspects (aspect, review_id, sentiment)
+            SELECT lower(trim(json_extract(j.value, '$.aspect'))), r.review_id,
+                   lower(COALESCE(json_extract(j.value, '$.sentiment'), 'neutral'))
+            FROM analysis_results r, json_each(r.aspects) j
+            WHERE r.aspects IS NOT NULL AND trim(COALESCE(json_extract(j.value, '$.aspect'), '')) != ''
+        """)
+        self.rebuild_text()
+
+    def rebuild_text(self):
+        if self.full_text:
+            self.conn.execute("INSERT INTO review_search (review_search) VALUES ('delete-all')")
+            self.conn.execute(f"INSERT INTO review_search (rowid, {self.text_column}) "
+                              f"SELECT r.review_id, v.{self.text_column} FROM analysis_results r "
+                              f"JOIN {self.table} v ON v.{self.id_column} = r.review_id")
+        self.conn.execute("DELETE FROM review_search_stale")
+
+    def refresh(self):
+        """Rebuild the full-text index if results of edited reviews were saved since it was last built"""
+        if self.conn.execute("SELECT EXISTS (SELECT 1 FROM review_search_stale)").fetchone()[0]:
+            self.rebuild_text()
+
+    def index_text(self, rows):
+        """Index the text of results about to be stored, from (review_id, text, text hash) rows. Only reviews
+        without a stored result are added; a stored result's entry already holds its text unless the review
+        was edited, which leaves the index to be rebuilt by refresh()"""
+        if not self.full_text or not rows:
+            return
+        texts = {review_id: (text, hashed) for review_id, text, hashed in rows}
+        stored = dict(self.conn.execute(
+            "SELECT review_id, text_hash FROM analysis_results WHERE review_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(texts)),)))
+        self.conn.executemany("INSERT OR IGNORE INTO review_search_stale (review_id) VALUES (?)",
+                              [(review_id,) for review_id, (_, hashed) in texts.items()
+                               if stored.get(review_id, hashed) != hashed])
+        self.conn.executemany(f"INSERT INTO review_search (rowid, {self.text_column}) VALUES (?, ?)",
+                              [(review_id, text) for review_id, (text, _) in texts.items() if review_id not in stored])
+
+    def index_aspects(self, rows):
+        """Index the aspects of stored results from (review_id, aspects) rows; aspects None keeps the indexed
+        aspects only while the stored result still has aspects"""
+        self.conn.executemany("DELETE FROM review_aspects WHERE review_id = ?",
+                              [(review_id,) for review_id, aspects in rows if aspects is not None])
+        self.conn.executemany(
+            "DELETE FROM review_aspects WHERE review_id = ? AND NOT EXISTS "
+            "(SELECT 1 FROM analysis_results WHERE review_id = ? AND aspects IS NOT NULL)",
+            [(review_id, review_id) for review_id, aspects in rows if aspects is None])
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO review_aspects (aspect, review_id, sentiment) VALUES (?, ?, ?)",
+            [(str(a.get('aspect', '')).strip().lower(), review_id, str(a.get('sentiment', 'neutral')).lower())
+             for review_id, aspects in rows for a in aspects or []
+             if isinstance(a, dict) and str(a.get('aspect', '')).strip()]
+        )
+
+    def remove_missing(self):
+        """Drop index entries for reviews that no longer have a stored result"""
+        self.conn.execute("DELETE FROM review_aspects WHERE review_id NOT IN (SELECT review_id FROM analysis_results)")
+        # Their reviews were deleted too, and with them the text their entries would be deleted by
+        self.rebuild_text()
+
+    def _terms(self, aspect, aspect_sentiment, query):
+        """(condition on review_aspects or None, its params, MATCH expression or '') for the filters"""
+        expression = match_expression(query)
+        if expression and not self.full_text:
+            raise ValueError("full-text search needs an SQLite build with FTS5")
+        if not aspect:
+            return None, [], expression
+        condition, params = "aspect = ?", [aspect.strip().lower()]
+        if aspect_sentiment:
+            condition += " AND sentiment = ?"
+            params.append(aspect_sentiment.lower())
+        return condition, params, expression
+
+    def _matching_ids(self, aspect, aspect_sentiment, query, distinct=False):
+        """(SQL selecting the ids of reviews mentioning the aspect and containing the query's words, params),
+        or None without an aspect or query; with both, the words' matches are looked up first"""
+        condition, params, expression = self._terms(aspect, aspect_sentiment, query)
+        words = "SELECT rowid FROM review_search WHERE review_search MATCH ?"
+        if condition is None:
+            return (words, [expression]) if expression else None
+        if expression:
+            condition += f" AND review_id IN ({words})"
+            params.append(expression)
+        return f"SELECT {'DISTINCT ' if distinct else ''}review_id FROM review_aspects WHERE {condition}", params
+
+    def count(self, aspect=None, aspect_sentiment=None, query=None):
+        """Number of stored results mentioning an aspect and containing a query's words, read from the
+        indexes alone; None without an aspect or query"""
+        # A review is indexed once for each sentiment it mentions the aspect with
+        matching = self._matching_ids(aspect, aspect_sentiment, query, distinct=not aspect_sentiment)
+        if matching is None:
+            return None
+        ids, params = matching
+        return self.conn.execute(f"SELECT COUNT(*) FROM ({ids})", params).fetchone()[0]
+
+    def more_than(self, limit, aspect=None, aspect_sentiment=None, query=None):
+        """Whether more than limit stored results mention the aspect and contain the query's words, found
+        without counting them all; None without an aspect or query"""
+        matching = self._matching_ids(aspect, aspect_sentiment, query)
+        if matching is None:
+            return None
+        ids, params = matching
+        return self.conn.execute(f"SELECT COUNT(*) FROM ({ids} LIMIT ?)",
+                                 params + [int(limit) + 1]).fetchone()[0] > limit
+
+    def filter_sql(self, aspect=None, aspect_sentiment=None, query=None, correlated=False):
+        """(clauses, params) on analysis_results for reviews mentioning an aspect, optionally with a sentiment,
+        and containing every word of a query.
+
+        The clause looks the matching review ids up in the indexes, which suits a few matches;
+        correlated=True checks each result against them instead, so a query walking the
+        results in sort order can stop at the end of its page when there are many"""
+        if not correlated:
+            matching = self._matching_ids(aspect, aspect_sentiment, query)
+            if matching is None:
+                return [], []
+            ids, params = matching
+            return [f"review_id IN ({ids})"], params
+        condition, params, expression = self._terms(aspect, aspect_sentiment, query)
+        clauses = []
+        if condition is not None:
+            clauses.append(f"EXISTS (SELECT 1 FROM review_aspects a WHERE {condition} "
+                           f"AND a.review_id = analysis_results.review_id)")
+        if expression:
+            clauses.append("EXISTS (SELECT 1 FROM review_search s WHERE review_search MATCH ? "
+                           "AND s.rowid = analysis_results.review_id)")
+            params.append(expression)
+        return clauses, params
+
+    def snippets(self, review_ids, query=None):
+        """{review id: text excerpt} for indexed reviews; with a query, the excerpt is around its words,
+        which are marked [like this]"""
+        if not review_ids:
+            return {}
+        placeholders = ",".join("?" * len(review_ids))
+        expression = match_expression(query) if self.full_text else ""
+        if expression:
+            rows = self.conn.execute(
+                f"SELECT rowid, snippet(review_search, 0, '[', ']', '...', {SNIPPET_WORDS}) FROM review_search "
+                f"WHERE review_search MATCH ? AND rowid IN ({placeholders})", [expression] + list(review_ids))
+        else:
+            rows = self.conn.execute(f"SELECT {self.id_column}, substr({self.text_column}, 1, {EXCERPT_CHARS}) "
+                                     f"FROM {self.table} WHERE {self.id_column} IN ({placeholders})",
+                                     list(review_ids))
+        return {review_id: text or "" for review_id, text in rows}
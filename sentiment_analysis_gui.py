@@ -1,15 +1,29 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
-import sqlite3
-from openai import OpenAI
-import json
-from collections import Counter
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import re
 import threading
+import time
 import MasonsAPI_KEY
+from call_metrics import format_snapshot
+from sentiment_engine import CALIBRATED, AnalysisEngine, build_summary, build_recommendations
+from model_backends import OpenAIBackend
+from prompts import DEFAULT_PROMPT_VERSION, PROMPTS
+from ui_bridge import UIBridge
+from chart_manager import ChartManager
+from result_exporters import parquet_available
+from review_source import SourceSpec
 
 apikey = MasonsAPI_KEY.OPENAI_API_KEY
+
+
+def load_plotting():
+    """Import matplotlib on first use; it is the slowest import in the app, so startup skips it.
+
+    Figures are created directly rather than through pyplot, which would keep every one alive"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    return Figure, FigureCanvasTkAgg
+
      
 class SentimentAnalysisGUI:
     def __init__(self, root):
@@ -17,17 +31,15 @@ class SentimentAnalysisGUI:
         self.root.title("Apple Vision Pro Sentiment Analysis")
         self.root.geometry("1200x800")
          
-        # Initialize OpenAI client with API key from separate file
-        try:
-            self.client = OpenAI(api_key=MasonsAPI_KEY.OPENAI_API_KEY)
-            self.api_key_loaded = True
-        except:
-            self.client = None
-            self.api_key_loaded = False
+        # Worker threads post UI updates here; the main loop applies them
+        self.ui = UIBridge(root)
+        
+        # All loading, analysis and storage is done by the engine; the GUI only displays it
+        self.engine = AnalysisEngine(log_status=self.log_status, log_analysis=self.log_analysis,
+                                     on_progress=self.set_progress)
         
-        # Data storage
-        self.reviews = []
-        self.analysis_results = []
+        # None until the OpenAI client has been built in the background
+        self.api_key_loaded = None
         
         # Create main container with tabs
         self.notebook = ttk.Notebook(root)
@@ -49,19 +61,15 @@ class SentimentAnalysisGUI:
         self.create_results_tab()
         self.create_visualization_tab()
         
+        # Importing openai is slow, so the client is built once the window is up
+        self.root.after(100, self.load_client)
+        
     def create_setup_tab(self):
         # API Status Section
         api_frame = ttk.LabelFrame(self.setup_tab, text="OpenAI API Status", padding=10)
         api_frame.pack(fill='x', padx=10, pady=10)
         
-        if self.api_key_loaded:
-            status_text = "✓ API Key loaded successfully from MasonsAPI_KEY.py"
-            status_color = "green"
-        else:
-            status_text = "✗ API Key not found. Please check MasonsAPI_KEY.py"
-            status_color = "red"
-        
-        self.api_status_label = ttk.Label(api_frame, text=status_text, foreground=status_color)
+        self.api_status_label = ttk.Label(api_frame, text="Loading OpenAI client...", foreground="gray")
         self.api_status_label.pack(pady=5)
         
         # Database Section
@@ -74,7 +82,32 @@ class SentimentAnalysisGUI:
         self.db_path_entry.grid(row=0, column=1, padx=5, pady=5)
         
         ttk.Button(db_frame, text="Browse", command=self.browse_database).grid(row=0, column=2, padx=5)
-        ttk.Button(db_frame, text="Load Reviews", command=self.load_reviews).grid(row=1, column=1, pady=10)
+        
+        # Review Source: every field is optional; blank fields keep the defaults (whole table, found by name)
+        source_frame = ttk.LabelFrame(db_frame, text="Review Source (optional)", padding=5)
+        source_frame.grid(row=1, column=0, columnspan=3, sticky='we', pady=5)
+        
+        self.source_vars = {name: tk.StringVar() for name in
+                            ('table', 'id_column', 'text_column', 'where', 'date_column',
+                             'date_from', 'date_to', 'sample', 'stratify_by')}
+        self.create_indexes_var = tk.BooleanVar(value=False)
+        fields = [
+            [("Table:", 'table', 16), ("ID Column:", 'id_column', 12), ("Text Column:", 'text_column', 12)],
+            [("Date Column:", 'date_column', 12), ("From:", 'date_from', 12), ("To:", 'date_to', 12)],
+            [("Sample %:", 'sample', 6), ("Stratify By:", 'stratify_by', 12)]
+        ]
+        for row, row_fields in enumerate(fields):
+            for position, (label, name, width) in enumerate(row_fields):
+                ttk.Label(source_frame, text=label).grid(row=row, column=position * 2, sticky='w', padx=5, pady=2)
+                ttk.Entry(source_frame, width=width, textvariable=self.source_vars[name]).grid(
+                    row=row, column=position * 2 + 1, sticky='w', padx=5, pady=2)
+        ttk.Label(source_frame, text="Where (SQL):").grid(row=3, column=0, sticky='w', padx=5, pady=2)
+        ttk.Entry(source_frame, width=60, textvariable=self.source_vars['where']).grid(
+            row=3, column=1, columnspan=5, sticky='we', padx=5, pady=2)
+        ttk.Checkbutton(source_frame, text="Create suggested indexes",
+                        variable=self.create_indexes_var).grid(row=2, column=4, columnspan=2, sticky='w', padx=5)
+        
+        ttk.Button(db_frame, text="Load Reviews", command=self.load_reviews).grid(row=2, column=1, pady=10)
         
         # Status Section
         status_frame = ttk.LabelFrame(self.setup_tab, text="Status", padding=10)
@@ -83,23 +116,93 @@ class SentimentAnalysisGUI:
         self.status_text = scrolledtext.ScrolledText(status_frame, height=15, width=80)
         self.status_text.pack(fill='both', expand=True)
         
-        if self.api_key_loaded:
-            self.log_status("API Key loaded successfully from MasonsAPI_KEY.py")
-        else:
-            self.log_status("WARNING: API Key not loaded. Please check MasonsAPI_KEY.py file")
-        
     def create_analysis_tab(self):
         # Control Frame
         control_frame = ttk.LabelFrame(self.analysis_tab, text="Analysis Controls", padding=10)
         control_frame.pack(fill='x', padx=10, pady=10)
         
-        ttk.Button(control_frame, text="Run Full Analysis", 
-                  command=self.run_full_analysis, 
-                  style="Accent.TButton").pack(side='left', padx=5)
-        ttk.Button(control_frame, text="Start Sentiment Analysis", 
-                  command=self.start_sentiment_analysis).pack(side='left', padx=5)
-        ttk.Button(control_frame, text="Start Aspect Extraction", 
-                  command=self.start_aspect_extraction).pack(side='left', padx=5)
+        # Disabled while a job runs, so only one job uses the engine at a time
+        self.run_buttons = [
+            ttk.Button(control_frame, text="Run Full Analysis", 
+                      command=self.run_full_analysis, 
+                      style="Accent.TButton"),
+            ttk.Button(control_frame, text="Start Sentiment Analysis", 
+                      command=self.start_sentiment_analysis),
+            ttk.Button(control_frame, text="Start Aspect Extraction", 
+                      command=self.start_aspect_extraction),
+            ttk.Button(control_frame, text="Resume Run",
+                      command=self.resume_run),
+        ]
+        for button in self.run_buttons:
+            button.pack(side='left', padx=5)
+        
+        self.fused_mode_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(control_frame, text="Single-pass (sentiment + aspects in one request)",
+                        variable=self.fused_mode_var).pack(side='left', padx=15)
+        self.incremental_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(control_frame, text="Incremental (only new or changed reviews)",
+                        variable=self.incremental_var).pack(side='left', padx=5)
+        
+        # Scheduler Settings
+        settings_frame = ttk.LabelFrame(self.analysis_tab, text="Request Settings", padding=10)
+        settings_frame.pack(fill='x', padx=10, pady=10)
+        
+        self.concurrency_var = tk.IntVar(value=self.engine.scheduler.concurrency)
+        self.rpm_var = tk.IntVar(value=3500)
+        self.tpm_var = tk.IntVar(value=90000)
+        self.batch_size_var = tk.IntVar(value=1)
+        
+        ttk.Label(settings_frame, text="Concurrent Requests:").pack(side='left', padx=5)
+        ttk.Spinbox(settings_frame, from_=1, to=64, width=5,
+                    textvariable=self.concurrency_var).pack(side='left', padx=5)
+        ttk.Label(settings_frame, text="Requests/min:").pack(side='left', padx=5)
+        ttk.Entry(settings_frame, width=8, textvariable=self.rpm_var).pack(side='left', padx=5)
+        ttk.Label(settings_frame, text="Tokens/min:").pack(side='left', padx=5)
+        ttk.Entry(settings_frame, width=10, textvariable=self.tpm_var).pack(side='left', padx=5)
+        ttk.Label(settings_frame, text="Max Reviews/Request:").pack(side='left', padx=5)
+        ttk.Spinbox(settings_frame, from_=1, to=50, width=5,
+                    textvariable=self.batch_size_var).pack(side='left', padx=5)
+        
+        # Prompt templates and structured output for single-review requests
+        prompt_frame = ttk.LabelFrame(self.analysis_tab, text="Prompts", padding=10)
+        prompt_frame.pack(fill='x', padx=10, pady=10)
+        
+        self.prompt_version_var = tk.StringVar(value=DEFAULT_PROMPT_VERSION)
+        self.structured_var = tk.BooleanVar(value=False)
+        
+        ttk.Label(prompt_frame, text="Prompt Version:").pack(side='left', padx=5)
+        ttk.Combobox(prompt_frame, textvariable=self.prompt_version_var, width=5, state='readonly',
+                     values=list(PROMPTS)).pack(side='left', padx=5)
+        ttk.Checkbutton(prompt_frame, text="Structured output (JSON schema; needs a model that supports it)",
+                        variable=self.structured_var).pack(side='left', padx=15)
+        
+        # Local pre-classifier: sentiment-only runs skip the API for confident reviews
+        local_frame = ttk.LabelFrame(self.analysis_tab, text="Local Pre-classifier", padding=10)
+        local_frame.pack(fill='x', padx=10, pady=10)
+        
+        self.local_var = tk.BooleanVar(value=False)
+        # "calibrated" uses the threshold found by Train from Stored Labels; a fixed 0.9 answered no review
+        # locally on feedback.db, as the model is rarely that sure of so few labels
+        self.local_threshold_var = tk.StringVar(value=CALIBRATED)
+        
+        ttk.Checkbutton(local_frame, text="Answer confident reviews locally (sentiment analysis only)",
+                        variable=self.local_var).pack(side='left', padx=5)
+        ttk.Label(local_frame, text="Min Confidence (0-1 or calibrated):").pack(side='left', padx=5)
+        ttk.Entry(local_frame, width=10, textvariable=self.local_threshold_var).pack(side='left', padx=5)
+        ttk.Button(local_frame, text="Train from Stored Labels",
+                  command=self.train_local_model).pack(side='right', padx=5)
+        
+        # Deduplication: one review per cluster of copies is analyzed and its result copied to the rest
+        dedup_frame = ttk.LabelFrame(self.analysis_tab, text="Duplicate Reviews", padding=10)
+        dedup_frame.pack(fill='x', padx=10, pady=10)
+        
+        self.dedup_var = tk.BooleanVar(value=False)
+        self.dedup_threshold_var = tk.DoubleVar(value=0.8)
+        
+        ttk.Checkbutton(dedup_frame, text="Analyze one review per group of duplicates",
+                        variable=self.dedup_var).pack(side='left', padx=5)
+        ttk.Label(dedup_frame, text="Min Similarity:").pack(side='left', padx=5)
+        ttk.Entry(dedup_frame, width=6, textvariable=self.dedup_threshold_var).pack(side='left', padx=5)
         
         # Progress Section
         progress_frame = ttk.LabelFrame(self.analysis_tab, text="Progress", padding=10)
@@ -111,6 +214,27 @@ class SentimentAnalysisGUI:
         self.progress_bar = ttk.Progressbar(progress_frame, length=400, mode='determinate')
         self.progress_bar.pack(pady=10)
         
+        # Run Metrics: live latency percentiles, throughput and cost of the current run's API calls
+        metrics_frame = ttk.LabelFrame(self.analysis_tab, text="Run Metrics", padding=10)
+        metrics_frame.pack(fill='x', padx=10, pady=10)
+        
+        self.metrics_label = ttk.Label(metrics_frame, text="No API calls yet", justify='left')
+        self.metrics_label.pack(side='left', padx=5)
+        ttk.Button(metrics_frame, text="Export Run Report",
+                  command=self.export_run_report).pack(side='right', padx=5)
+        self.job_running = False
+        # after-id of the pending refresh, so only one refresh loop ever runs
+        self.metrics_after = None
+        
+        # Result Cache
+        cache_frame = ttk.LabelFrame(self.analysis_tab, text="Result Cache", padding=10)
+        cache_frame.pack(fill='x', padx=10, pady=10)
+        
+        self.cache_label = ttk.Label(cache_frame, text="Cache opens when reviews are loaded")
+        self.cache_label.pack(side='left', padx=5)
+        ttk.Button(cache_frame, text="Clear Cache",
+                  command=self.clear_cache).pack(side='right', padx=5)
+        
         # Analysis Output
         output_frame = ttk.LabelFrame(self.analysis_tab, text="Analysis Output", padding=10)
         output_frame.pack(fill='both', expand=True, padx=10, pady=10)
@@ -130,23 +254,83 @@ class SentimentAnalysisGUI:
         details_frame = ttk.LabelFrame(self.results_tab, text="Detailed Results", padding=10)
         details_frame.pack(fill='both', expand=True, padx=10, pady=10)
         
-        # Create Treeview for results
-        columns = ('Review ID', 'Sentiment', 'Confidence', 'Key Aspects')
-        self.results_tree = ttk.Treeview(details_frame, columns=columns, show='headings', height=15)
+        # Filters (applied as SQL on the stored results)
+        filter_frame = ttk.Frame(details_frame)
+        filter_frame.pack(fill='x', pady=(0, 5))
+        
+        self.filter_sentiment_var = tk.StringVar(value="All")
+        self.filter_confidence_var = tk.StringVar()
+        self.filter_aspect_var = tk.StringVar()
+        self.filter_aspect_sentiment_var = tk.StringVar(value="Any")
+        self.search_var = tk.StringVar()
+        
+        ttk.Label(filter_frame, text="Sentiment:").pack(side='left', padx=5)
+        ttk.Combobox(filter_frame, textvariable=self.filter_sentiment_var, width=10, state='readonly',
+                     values=("All", "POSITIVE", "NEGATIVE", "NEUTRAL")).pack(side='left', padx=5)
+        ttk.Label(filter_frame, text="Min Confidence:").pack(side='left', padx=5)
+        ttk.Entry(filter_frame, textvariable=self.filter_confidence_var, width=6).pack(side='left', padx=5)
+        ttk.Label(filter_frame, text="Aspect:").pack(side='left', padx=5)
+        aspect_entry = ttk.Entry(filter_frame, textvariable=self.filter_aspect_var, width=15)
+        aspect_entry.pack(side='left', padx=5)
+        ttk.Combobox(filter_frame, textvariable=self.filter_aspect_sentiment_var, width=9, state='readonly',
+                     values=("Any", "positive", "negative", "neutral")).pack(side='left', padx=5)
+        # Full-text search over the analyzed reviews; Enter in either box applies the filters
+        ttk.Label(filter_frame, text="Search:").pack(side='left', padx=5)
+        search_entry = ttk.Entry(filter_frame, textvariable=self.search_var, width=25)
+        search_entry.pack(side='left', padx=5)
+        for entry in (aspect_entry, search_entry):
+            entry.bind('<Return>', lambda event: self.apply_result_filters())
+        ttk.Button(filter_frame, text="Apply", command=self.apply_result_filters).pack(side='left', padx=5)
+        ttk.Button(filter_frame, text="Clear", command=lambda: self.show_filtered_results({})).pack(side='left', padx=5)
+        
+        # Create Treeview for results; only the current page is ever inserted
+        tree_frame = ttk.Frame(details_frame)
+        tree_frame.pack(fill='both', expand=True)
+        
+        columns = ('Review ID', 'Sentiment', 'Confidence', 'Key Aspects', 'Review')
+        sort_keys = {'Review ID': 'review_id', 'Sentiment': 'sentiment', 'Confidence': 'confidence'}
+        self.results_tree = ttk.Treeview(tree_frame, columns=columns, show='headings', height=15)
         
         for col in columns:
-            self.results_tree.heading(col, text=col)
-            self.results_tree.column(col, width=150)
-        
-        scrollbar = ttk.Scrollbar(details_frame, orient='vertical', command=self.results_tree.yview)
+            if col in sort_keys:
+                self.results_tree.heading(col, text=col,
+                                          command=lambda key=sort_keys[col]: self.sort_results(key))
+            else:
+                self.results_tree.heading(col, text=col)
+            self.results_tree.column(col, width=400 if col == 'Review' else 150)
+        # Double-click a result to read the whole review
+        self.results_tree.bind('<Double-1>', self.show_review)
+        
+        scrollbar = ttk.Scrollbar(tree_frame, orient='vertical', command=self.results_tree.yview)
         self.results_tree.configure(yscrollcommand=scrollbar.set)
         
         self.results_tree.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
         
-        # Export Button
-        ttk.Button(self.results_tab, text="Export Results to JSON", 
-                  command=self.export_results).pack(pady=10)
+        # Paging
+        page_frame = ttk.Frame(details_frame)
+        page_frame.pack(fill='x', pady=(5, 0))
+        
+        self.page = 0
+        self.page_size = 100
+        self.sort_column = 'review_id'
+        self.sort_descending = False
+        self.result_filters = {}
+        # review_id -> (sentiment, confidence, aspects) of the results on the current page
+        self.page_results = {}
+        
+        ttk.Button(page_frame, text="< Prev", command=lambda: self.change_page(-1)).pack(side='left', padx=5)
+        ttk.Button(page_frame, text="Next >", command=lambda: self.change_page(1)).pack(side='left', padx=5)
+        self.page_label = ttk.Label(page_frame, text="No results")
+        self.page_label.pack(side='left', padx=10)
+        
+        # Export Buttons
+        export_frame = ttk.Frame(self.results_tab)
+        export_frame.pack(pady=10)
+        ttk.Button(export_frame, text="Export Results...", 
+                  command=self.export_results).pack(side='left', padx=5)
+        ttk.Button(export_frame, text="Write Back to Database", 
+                  command=self.write_back_results).pack(side='left', padx=5)
         
     def create_visualization_tab(self):
         # Visualization controls
@@ -162,10 +346,43 @@ class SentimentAnalysisGUI:
         ttk.Button(control_frame, text="Generate Recommendations", 
                   command=self.generate_recommendations).pack(side='left', padx=5)
         
-        # Canvas for plots
+        # Canvas for plots; one figure is created on first use and reused for every chart
         self.viz_frame = ttk.Frame(self.visualization_tab)
         self.viz_frame.pack(fill='both', expand=True, padx=10, pady=10)
+        self.charts = None
+        
+    def load_client(self):
+        """Build the OpenAI backend on a worker thread and report it on the main loop"""
+        def build():
+            # Initialize OpenAI client with API key from separate file
+            try:
+                backend = OpenAIBackend(api_key=MasonsAPI_KEY.OPENAI_API_KEY)
+            except Exception:
+                backend = None
+            self.ui.call(self.client_loaded, backend)
         
+        threading.Thread(target=build, daemon=True).start()
+    
+    def client_loaded(self, backend):
+        if backend is not None:
+            self.engine.use_backend(backend)
+        self.api_key_loaded = backend is not None
+        if self.api_key_loaded:
+            self.api_status_label.config(text="✓ API Key loaded successfully from MasonsAPI_KEY.py", foreground="green")
+            self.log_status("API Key loaded successfully from MasonsAPI_KEY.py")
+        else:
+            self.api_status_label.config(text="✗ API Key not found. Please check MasonsAPI_KEY.py", foreground="red")
+            self.log_status("WARNING: API Key not loaded. Please check MasonsAPI_KEY.py file")
+    
+    def check_api_ready(self):
+        if self.api_key_loaded is None:
+            messagebox.showwarning("Warning", "The OpenAI client is still loading, please try again in a moment")
+            return False
+        if not self.api_key_loaded:
+            messagebox.showwarning("Warning", "API key not loaded")
+            return False
+        return True
+    
     def browse_database(self):
         filename = filedialog.askopenfilename(
             title="Select Database File",
@@ -178,427 +395,356 @@ class SentimentAnalysisGUI:
     def load_reviews(self):
         db_path = self.db_path_entry.get()
         try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # Find tables
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            
-            if not tables:
-                messagebox.showerror("Error", "No tables found in database")
-                return
-            
-            # Find the most likely review table
-            table_name = tables[0][0]
-            for table in tables:
-                if 'review' in table[0].lower() or 'feedback' in table[0].lower():
-                    table_name = table[0]
-                    break
-            
-            cursor.execute(f"SELECT * FROM {table_name}")
-            self.reviews = cursor.fetchall()
-            
-            # Get column names
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            self.column_names = [col[1] for col in cursor.fetchall()]
-            
-            conn.close()
-            
-            self.log_status(f"Loaded {len(self.reviews)} reviews from table '{table_name}'")
-            self.log_status(f"Columns: {', '.join(self.column_names)}")
-            messagebox.showinfo("Success", f"Loaded {len(self.reviews)} reviews successfully!")
-            
+            table_name, self.column_names = self.engine.open_database(
+                db_path, spec=self.source_spec(), create_indexes=self.create_indexes_var.get())
         except Exception as e:
+            self.engine.source = None
             messagebox.showerror("Error", f"Failed to load reviews: {str(e)}")
             self.log_status(f"Error loading reviews: {str(e)}")
+            return
+        
+        self.update_cache_label()
+        if self.engine.aggregates.total:
+            self.display_results()
+        self.log_status(f"Loaded {self.engine.review_count} reviews from table '{table_name}'")
+        self.log_status(f"Columns: {', '.join(self.column_names)}")
+        messagebox.showinfo("Success", f"Loaded {self.engine.review_count} reviews successfully!")
     
-    def analyze_sentiment(self, review_text):
-        """Analyze sentiment of a single review using OpenAI API"""
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a sentiment analysis expert. Analyze the sentiment of product reviews and respond with only one word (POSITIVE, NEGATIVE, or NEUTRAL) followed by a confidence score between 0 and 1. Format: SENTIMENT CONFIDENCE"},
-                    {"role": "user", "content": f"Analyze the sentiment of this Apple Vision Pro review:\n\n{review_text}"}
-                ],
-                temperature=0.3,
-                max_tokens=50
-            )
-            
-            result = response.choices[0].message.content.strip()
-            parts = result.split()
-            sentiment = parts[0].upper()
-            
-            # Ensure valid sentiment
-            if sentiment not in ['POSITIVE', 'NEGATIVE', 'NEUTRAL']:
-                sentiment = 'NEUTRAL'
-            
-            confidence = float(parts[1]) if len(parts) > 1 and parts[1].replace('.', '').isdigit() else 0.8
-            
-            return sentiment, confidence
-        except Exception as e:
-            self.log_status(f"Error in sentiment analysis: {str(e)}")
-            return "NEUTRAL", 0.5
+    def source_spec(self):
+        """The Review Source fields as a SourceSpec, blank fields left to their defaults"""
+        fields = {name: var.get().strip() or None for name, var in self.source_vars.items()}
+        sample = fields.pop('sample')
+        if sample is not None:
+            try:
+                sample = float(sample.rstrip('%')) / 100
+            except ValueError:
+                raise ValueError(f"Sample % must be a number, not {sample!r}")
+        return SourceSpec(sample=sample, **fields)
+    
+    def update_cache_label(self):
+        cache = self.engine.cache
+        if cache is None:
+            self.cache_label.config(text="Cache not open")
+            return
+        self.cache_label.config(
+            text=f"Cache hits: {cache.hits}   misses: {cache.misses}   "
+                 f"entries: {cache.entry_count()}   size: {cache.total_bytes / 1024 / 1024:.1f} MB"
+        )
+    
+    def clear_cache(self):
+        """Invalidate every cached result, e.g. after a prompt change"""
+        if self.engine.cache is None:
+            messagebox.showinfo("Info", "No cache open. Load reviews first.")
+            return
+        if messagebox.askyesno("Clear Cache", "Delete all cached analysis results?"):
+            self.engine.cache.invalidate()
+            self.log_status("Result cache cleared")
+            self.update_cache_label()
     
-    def extract_aspects(self, review_text):
-        """Extract specific aspects mentioned in the review"""
+    def configure_engine(self):
+        """Apply the Request Settings, Prompts, Incremental, Local Pre-classifier and Duplicate Reviews fields to the engine"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": """You are an expert at extracting product aspects from reviews. Extract key aspects/features mentioned in Apple Vision Pro reviews and indicate if they are mentioned positively or negatively. 
-                    
-Return ONLY a valid JSON array with this exact format:
-[{"aspect": "display", "sentiment": "positive"}, {"aspect": "price", "sentiment": "negative"}]
-
-Common aspects: display, comfort, price, battery, software, design, weight, apps, performance, field of view"""},
-                    {"role": "user", "content": f"Extract aspects from this review:\n\n{review_text}"}
-                ],
-                temperature=0.3,
-                max_tokens=300
+            self.engine.configure(
+                concurrency=self.concurrency_var.get(),
+                requests_per_minute=self.rpm_var.get(),
+                tokens_per_minute=self.tpm_var.get(),
+                batch_size=self.batch_size_var.get(),
+                incremental=self.incremental_var.get(),
+                local_threshold=self.local_threshold() if self.local_var.get() else None,
+                dedup_threshold=self.dedup_threshold_var.get() if self.dedup_var.get() else None,
+                prompt_version=self.prompt_version_var.get(),
+                structured_output=self.structured_var.get()
             )
-            
-            result = response.choices[0].message.content.strip()
-            # Clean up the response to ensure it's valid JSON
-            if result.startswith("```json"):
-                result = result.replace("```json", "").replace("```", "").strip()
-            
-            aspects = json.loads(result)
-            return aspects if isinstance(aspects, list) else []
-        except Exception as e:
-            self.log_status(f"Error in aspect extraction: {str(e)}")
-            return []
+        except (tk.TclError, ValueError):
+            self.log_status("Invalid request settings, keeping previous values")
     
-    def start_sentiment_analysis(self):
-        if not self.reviews:
-            messagebox.showwarning("Warning", "Please load reviews first")
-            return
-        if not self.api_key_loaded:
-            messagebox.showwarning("Warning", "API key not loaded")
+    def local_threshold(self):
+        """The Min Confidence field: CALIBRATED, or a confidence; raises ValueError otherwise"""
+        value = self.local_threshold_var.get().strip().lower()
+        return CALIBRATED if value == CALIBRATED else float(value)
+    
+    def run_in_background(self, run, message):
+        """Run an engine job on a worker thread, then report and refresh the results on the main loop"""
+        if self.job_running:
+            messagebox.showinfo("Info", "A job is already running. Wait for it to finish.")
             return
+        self.configure_engine()
+        self.job_running = True
+        for button in self.run_buttons:
+            button.state(['disabled'])
+        self.refresh_metrics()
+        
+        def work():
+            try:
+                run()
+            except Exception as e:
+                self.log_analysis(f"Analysis failed: {str(e)}")
+                self.ui.call(messagebox.showerror, "Error", f"Analysis failed: {str(e)}")
+                return
+            finally:
+                self.ui.call(self.stop_metrics)
+            self.ui.call(self.update_cache_label)
+            self.ui.call(messagebox.showinfo, "Complete", message)
+            self.ui.call(self.display_results)
         
-        thread = threading.Thread(target=self.run_sentiment_analysis)
+        thread = threading.Thread(target=work)
         thread.daemon = True
         thread.start()
     
-    def run_sentiment_analysis(self):
-        self.analysis_results = []
-        total = len(self.reviews)
-        
-        for i, review in enumerate(self.reviews):
-            # Find the review text column (usually last or contains 'review', 'text', 'feedback')
-            review_text = str(review[-1]) if review else ""
-            
-            self.progress_label.config(text=f"Analyzing review {i+1}/{total}...")
-            self.progress_bar['value'] = (i + 1) / total * 100
-            self.root.update_idletasks()
-            
-            sentiment, confidence = self.analyze_sentiment(review_text)
-            
-            result = {
-                'review_id': i + 1,
-                'review_text': review_text,
-                'sentiment': sentiment,
-                'confidence': confidence,
-                'aspects': []
-            }
-            self.analysis_results.append(result)
-            
-            self.log_analysis(f"Review {i+1}: {sentiment} (confidence: {confidence:.2f})")
-        
-        self.progress_label.config(text="Sentiment analysis complete!")
-        messagebox.showinfo("Complete", "Sentiment analysis finished!")
-        self.display_results()
+    def refresh_metrics(self):
+        """Redraw the Run Metrics panel once a second while a run is in progress, and the shown chart
+        when it changed, at most every CHART_REFRESH_SECONDS"""
+        if self.metrics_after is not None:
+            self.root.after_cancel(self.metrics_after)
+            self.metrics_after = None
+        self.metrics_label.config(text=format_snapshot(self.engine.call_stats.snapshot()))
+        if self.charts is not None:
+            self.charts.refresh(self.engine.aggregates)
+        if self.job_running:
+            self.metrics_after = self.root.after(1000, self.refresh_metrics)
+    
+    def stop_metrics(self):
+        self.job_running = False
+        for button in self.run_buttons:
+            button.state(['!disabled'])
+        self.refresh_metrics()
+    
+    def export_run_report(self):
+        if not self.engine.call_stats.calls:
+            messagebox.showinfo("Info", "No API calls recorded yet. Run an analysis first.")
+            return
+        
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON summary", "*.json"), ("CSV, one row per call", "*.csv")]
+        )
+        if filename:
+            try:
+                self.engine.export_run_report(filename)
+                messagebox.showinfo("Success", f"Run report exported to {filename}")
+            except Exception as e:
+                messagebox.showerror("Error", f"Export failed: {str(e)}")
+    
+    def start_sentiment_analysis(self):
+        if self.engine.store is None:
+            messagebox.showwarning("Warning", "Please load reviews first")
+            return
+        if not self.check_api_ready():
+            return
+        
+        self.run_in_background(self.engine.run_sentiment_analysis, "Sentiment analysis finished!")
     
     def start_aspect_extraction(self):
-        if not self.analysis_results:
+        if not self.engine.aggregates.total:
             messagebox.showwarning("Warning", "Please run sentiment analysis first")
             return
+        if not self.check_api_ready():
+            return
         
-        thread = threading.Thread(target=self.run_aspect_extraction)
-        thread.daemon = True
-        thread.start()
+        self.run_in_background(self.engine.run_aspect_extraction, "Aspect extraction finished!")
     
-    def run_aspect_extraction(self):
-        total = len(self.analysis_results)
-        
-        for i, result in enumerate(self.analysis_results):
-            self.progress_label.config(text=f"Extracting aspects {i+1}/{total}...")
-            self.progress_bar['value'] = (i + 1) / total * 100
-            self.root.update_idletasks()
-            
-            aspects = self.extract_aspects(result['review_text'])
-            result['aspects'] = aspects
-            
-            self.log_analysis(f"Review {i+1} aspects: {len(aspects)} found")
+    def train_local_model(self):
+        if self.engine.store is None:
+            messagebox.showwarning("Warning", "Please load reviews first")
+            return
         
-        self.progress_label.config(text="Aspect extraction complete!")
-        messagebox.showinfo("Complete", "Aspect extraction finished!")
-        self.display_results()
+        def train():
+            count, accuracy = self.engine.train_local_model()
+            if not count:
+                self.ui.call(messagebox.showinfo, "Info", "No API labels stored yet. Run sentiment analysis first.")
+                return
+            threshold = self.engine.local_model.threshold
+            calibrated = (f"calibrated threshold {threshold:.2f}" if threshold is not None
+                          else "too few agreeing labels to calibrate a threshold")
+            self.ui.call(messagebox.showinfo, "Complete",
+                         f"Local classifier trained on {count} reviews ({accuracy:.1%} training accuracy, "
+                         f"{calibrated})")
+        
+        thread = threading.Thread(target=train)
+        thread.daemon = True
+        thread.start()
     
     def run_full_analysis(self):
-        if not self.reviews:
+        if self.engine.store is None:
             messagebox.showwarning("Warning", "Please load reviews first")
             return
-        if not self.api_key_loaded:
-            messagebox.showwarning("Warning", "API key not loaded")
+        if not self.check_api_ready():
             return
         
-        thread = threading.Thread(target=self._run_full_analysis)
-        thread.daemon = True
-        thread.start()
+        fused = self.fused_mode_var.get()
+        self.run_in_background(lambda: self.engine.run_full_analysis(fused=fused), "Full analysis finished!")
     
-    def _run_full_analysis(self):
-        self.log_analysis("Starting full analysis...")
-        self.run_sentiment_analysis()
-        self.run_aspect_extraction()
-        self.log_analysis("Full analysis complete!")
+    def resume_run(self):
+        """Continue the last run that was cut off, analyzing only the reviews it had not saved"""
+        if self.engine.store is None:
+            messagebox.showwarning("Warning", "Please load reviews first")
+            return
+        run = self.engine.unfinished_run()
+        if run is None:
+            messagebox.showinfo("Info", "The last run completed; there is nothing to resume.")
+            return
+        if not self.check_api_ready():
+            return
+        
+        self.log_analysis(f"Resuming run {run['run_id']} ({run['kind']}), "
+                          f"{run['completed']} of {run['total']} reviews already saved")
+        self.run_in_background(self.engine.resume_run, "Resumed run finished!")
     
     def display_results(self):
+        self.show_results_page()
+        
+        # Update summary
+        self.update_summary()
+    
+    def show_results_page(self):
+        """Query and show only the current page of results, sorted and filtered in SQLite"""
         # Clear existing results
         for item in self.results_tree.get_children():
             self.results_tree.delete(item)
+        store = self.engine.store
+        if store is None:
+            return
+        
+        start = time.perf_counter()
+        try:
+            total = store.count_results(**self.result_filters)
+            pages = max(1, (total + self.page_size - 1) // self.page_size)
+            self.page = min(self.page, pages - 1)
+            rows = store.query_results(self.page * self.page_size, self.page_size,
+                                       order_by=self.sort_column, descending=self.sort_descending,
+                                       **self.result_filters)
+            # Review text comes from the search index: the start of each review, or the part matching the search
+            excerpts = store.review_excerpts([row[0] for row in rows], self.result_filters.get('query'))
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e))
+            return
+        elapsed = time.perf_counter() - start
         
         # Display in tree
-        for result in self.analysis_results:
-            aspects_str = ", ".join([a.get('aspect', '') for a in result.get('aspects', [])])
+        self.page_results = {}
+        for review_id, sentiment, confidence, aspects in rows:
+            self.page_results[review_id] = (sentiment, confidence, aspects)
+            aspects_str = ", ".join([a.get('aspect', '') for a in aspects])
             self.results_tree.insert('', 'end', values=(
-                result['review_id'],
-                result['sentiment'],
-                f"{result['confidence']:.2f}",
-                aspects_str[:50] + "..." if len(aspects_str) > 50 else aspects_str
+                review_id,
+                sentiment,
+                f"{confidence:.2f}",
+                aspects_str[:50] + "..." if len(aspects_str) > 50 else aspects_str,
+                " ".join(excerpts.get(review_id, "").split())
             ))
-        
-        # Update summary
-        self.update_summary()
+        self.page_label.config(text=f"Page {self.page + 1} of {pages} ({total} results, {elapsed * 1000:.0f} ms)")
+    
+    def change_page(self, step):
+        self.page = max(0, self.page + step)
+        self.show_results_page()
+    
+    def sort_results(self, column):
+        """Sort by column, toggling direction when it is already the sort column"""
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        self.page = 0
+        self.show_results_page()
+    
+    def apply_result_filters(self):
+        filters = {}
+        if self.filter_sentiment_var.get() != "All":
+            filters['sentiment'] = self.filter_sentiment_var.get()
+        confidence = self.filter_confidence_var.get().strip()
+        if confidence:
+            try:
+                filters['min_confidence'] = float(confidence)
+            except ValueError:
+                messagebox.showwarning("Warning", "Min confidence must be a number between 0 and 1")
+                return
+        if self.filter_aspect_var.get().strip():
+            # Stored aspects use canonical names, so "screen" finds "display"
+            filters['aspect'] = self.engine.aspect_index.canonical(self.filter_aspect_var.get().strip())
+            if self.filter_aspect_sentiment_var.get() != "Any":
+                filters['aspect_sentiment'] = self.filter_aspect_sentiment_var.get()
+        if self.search_var.get().strip():
+            filters['query'] = self.search_var.get().strip()
+        self.result_filters = filters
+        self.page = 0
+        self.show_results_page()
+    
+    def show_filtered_results(self, filters):
+        """Set the Results tab's filters to a sentiment / aspect / aspect_sentiment drill-down, then show them"""
+        self.filter_sentiment_var.set(filters.get('sentiment', "All"))
+        self.filter_confidence_var.set("")
+        self.filter_aspect_var.set(filters.get('aspect', ""))
+        self.filter_aspect_sentiment_var.set(filters.get('aspect_sentiment', "Any"))
+        self.search_var.set("")
+        self.notebook.select(self.results_tab)
+        self.apply_result_filters()
+    
+    def show_review(self, event):
+        """Open the double-clicked result's whole review with its sentiment and aspects"""
+        item = self.results_tree.identify_row(event.y)
+        if not item or self.engine.source is None:
+            return
+        review_id = int(self.results_tree.item(item, 'values')[0])
+        sentiment, confidence, aspects = self.page_results[review_id]
+        
+        review_window = tk.Toplevel(self.root)
+        review_window.title(f"Review {review_id}")
+        review_window.geometry("600x400")
+        
+        review_text = scrolledtext.ScrolledText(review_window, width=70, height=20, wrap=tk.WORD)
+        review_text.pack(padx=10, pady=10, fill='both', expand=True)
+        aspects_str = ", ".join(f"{a.get('aspect', '')} ({a.get('sentiment', 'neutral')})" for a in aspects)
+        review_text.insert(1.0, f"{sentiment} (confidence {confidence:.2f})\n"
+                                f"Aspects: {aspects_str or 'none'}\n\n"
+                                f"{self.engine.source.read_text(review_id)}")
+        review_text.config(state='disabled')
     
     def update_summary(self):
-        if not self.analysis_results:
+        if not self.engine.aggregates.total:
             return
         
-        total = len(self.analysis_results)
-        sentiments = [r['sentiment'] for r in self.analysis_results]
-        sentiment_counts = Counter(sentiments)
-        
-        all_aspects = []
-        for r in self.analysis_results:
-            all_aspects.extend([a.get('aspect', '') for a in r.get('aspects', [])])
-        
-        aspect_counts = Counter(all_aspects)
-        
-        summary = f"""Total Reviews Analyzed: {total}
-
-Sentiment Distribution:
-  Positive: {sentiment_counts.get('POSITIVE', 0)} ({sentiment_counts.get('POSITIVE', 0)/total*100:.1f}%)
-  Negative: {sentiment_counts.get('NEGATIVE', 0)} ({sentiment_counts.get('NEGATIVE', 0)/total*100:.1f}%)
-  Neutral: {sentiment_counts.get('NEUTRAL', 0)} ({sentiment_counts.get('NEUTRAL', 0)/total*100:.1f}%)
-
-Total Aspects Extracted: {len(all_aspects)}
-Unique Aspects: {len(aspect_counts)}
-
-Top 5 Most Mentioned Aspects:
-"""
-        for aspect, count in aspect_counts.most_common(5):
-            summary += f"  {aspect}: {count} times\n"
-        
         self.summary_text.delete(1.0, tk.END)
-        self.summary_text.insert(1.0, summary)
+        self.summary_text.insert(1.0, build_summary(self.engine.aggregates))
     
-    def plot_sentiment_distribution(self):
-        if not self.analysis_results:
+    def show_chart(self, kind, empty_message):
+        """Draw a chart on the reused figure, creating the figure and canvas on first use"""
+        if not self.engine.aggregates.total:
             messagebox.showwarning("Warning", "No analysis results to visualize")
             return
         
-        for widget in self.viz_frame.winfo_children():
-            widget.destroy()
-        
-        sentiments = [r['sentiment'] for r in self.analysis_results]
-        sentiment_counts = Counter(sentiments)
-        
-        fig, ax = plt.subplots(figsize=(8, 6))
-        colors = {'POSITIVE': '#4CAF50', 'NEGATIVE': '#F44336', 'NEUTRAL': '#FFC107'}
-        
-        labels = list(sentiment_counts.keys())
-        values = list(sentiment_counts.values())
-        bar_colors = [colors.get(label, '#999999') for label in labels]
-        
-        ax.bar(labels, values, color=bar_colors, edgecolor='black', linewidth=1.5)
-        ax.set_xlabel('Sentiment', fontsize=12, fontweight='bold')
-        ax.set_ylabel('Number of Reviews', fontsize=12, fontweight='bold')
-        ax.set_title('Sentiment Distribution of Apple Vision Pro Reviews', fontsize=14, fontweight='bold')
-        ax.grid(axis='y', alpha=0.3)
-        
-        for i, v in enumerate(values):
-            ax.text(i, v + 0.5, str(v), ha='center', fontweight='bold')
-        
-        canvas = FigureCanvasTkAgg(fig, master=self.viz_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill='both', expand=True)
+        if self.charts is None:
+            Figure, FigureCanvasTkAgg = load_plotting()
+            figure = Figure(figsize=(10, 6))
+            canvas = FigureCanvasTkAgg(figure, master=self.viz_frame)
+            canvas.get_tk_widget().pack(fill='both', expand=True)
+            # Clicking a bar shows the reviews behind it in the Results tab
+            canvas.mpl_connect('button_press_event', self.chart_clicked)
+            self.charts = ChartManager(figure, canvas.draw_idle)
+        
+        if not self.charts.show(kind, self.engine.aggregates):
+            messagebox.showinfo("Info", empty_message)
+    
+    def chart_clicked(self, event):
+        filters = self.charts.filters_at(event)
+        if filters:
+            self.show_filtered_results(filters)
+    
+    def plot_sentiment_distribution(self):
+        self.show_chart('sentiment', "No sentiment results yet.")
     
     def plot_aspect_frequency(self):
-        if not self.analysis_results:
-            messagebox.showwarning("Warning", "No analysis results to visualize")
-            return
-        
-        for widget in self.viz_frame.winfo_children():
-            widget.destroy()
-        
-        all_aspects = []
-        for r in self.analysis_results:
-            all_aspects.extend([a.get('aspect', '') for a in r.get('aspects', [])])
-        
-        aspect_counts = Counter(all_aspects)
-        top_aspects = aspect_counts.most_common(10)
-        
-        if not top_aspects:
-            messagebox.showinfo("Info", "No aspects found. Please run aspect extraction first.")
-            return
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
-        aspects = [a[0] for a in top_aspects]
-        counts = [a[1] for a in top_aspects]
-        
-        ax.barh(aspects, counts, color='#2196F3', edgecolor='black', linewidth=1.5)
-        ax.set_xlabel('Frequency', fontsize=12, fontweight='bold')
-        ax.set_ylabel('Aspect', fontsize=12, fontweight='bold')
-        ax.set_title('Top 10 Most Mentioned Aspects', fontsize=14, fontweight='bold')
-        ax.invert_yaxis()
-        ax.grid(axis='x', alpha=0.3)
-        
-        for i, v in enumerate(counts):
-            ax.text(v + 0.3, i, str(v), va='center', fontweight='bold')
-        
-        canvas = FigureCanvasTkAgg(fig, master=self.viz_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill='both', expand=True)
+        self.show_chart('aspect_frequency', "No aspects found. Please run aspect extraction first.")
     
     def plot_aspect_sentiment(self):
-        if not self.analysis_results:
-            messagebox.showwarning("Warning", "No analysis results to visualize")
-            return
-        
-        for widget in self.viz_frame.winfo_children():
-            widget.destroy()
-        
-        # Collect aspects with their sentiments
-        aspect_sentiments = {}
-        for r in self.analysis_results:
-            for aspect_data in r.get('aspects', []):
-                aspect = aspect_data.get('aspect', '')
-                sentiment = aspect_data.get('sentiment', 'neutral')
-                
-                if aspect not in aspect_sentiments:
-                    aspect_sentiments[aspect] = {'positive': 0, 'negative': 0, 'neutral': 0}
-                
-                aspect_sentiments[aspect][sentiment] = aspect_sentiments[aspect].get(sentiment, 0) + 1
-        
-        if not aspect_sentiments:
-            messagebox.showinfo("Info", "No aspects with sentiment found.")
-            return
-        
-        # Get top 10 most mentioned aspects
-        top_aspects = sorted(aspect_sentiments.items(), 
-                           key=lambda x: sum(x[1].values()), 
-                           reverse=True)[:10]
-        
-        aspects = [a[0] for a in top_aspects]
-        positives = [a[1].get('positive', 0) for a in top_aspects]
-        negatives = [a[1].get('negative', 0) for a in top_aspects]
-        neutrals = [a[1].get('neutral', 0) for a in top_aspects]
-        
-        fig, ax = plt.subplots(figsize=(12, 6))
-        x = range(len(aspects))
-        width = 0.25
-        
-        ax.bar([i - width for i in x], positives, width, label='Positive', color='#4CAF50')
-        ax.bar(x, negatives, width, label='Negative', color='#F44336')
-        ax.bar([i + width for i in x], neutrals, width, label='Neutral', color='#FFC107')
-        
-        ax.set_xlabel('Aspects', fontsize=12, fontweight='bold')
-        ax.set_ylabel('Frequency', fontsize=12, fontweight='bold')
-        ax.set_title('Aspect Sentiment Distribution', fontsize=14, fontweight='bold')
-        ax.set_xticks(x)
-        ax.set_xticklabels(aspects, rotation=45, ha='right')
-        ax.legend()
-        ax.grid(axis='y', alpha=0.3)
-        
-        plt.tight_layout()
-        
-        canvas = FigureCanvasTkAgg(fig, master=self.viz_frame)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill='both', expand=True)
+        self.show_chart('aspect_sentiment', "No aspects with sentiment found.")
     
     def generate_recommendations(self):
-        if not self.analysis_results:
+        if not self.engine.aggregates.total:
             messagebox.showwarning("Warning", "No analysis results available")
             return
         
-        # Analyze positive and negative aspects
-        positive_aspects = []
-        negative_aspects = []
-        
-        for r in self.analysis_results:
-            for aspect in r.get('aspects', []):
-                aspect_name = aspect.get('aspect', '')
-                if aspect.get('sentiment') == 'positive':
-                    positive_aspects.append(aspect_name)
-                elif aspect.get('sentiment') == 'negative':
-                    negative_aspects.append(aspect_name)
-        
-        pos_counts = Counter(positive_aspects)
-        neg_counts = Counter(negative_aspects)
-        
-        # Calculate overall sentiment
-        sentiments = [r['sentiment'] for r in self.analysis_results]
-        sentiment_counts = Counter(sentiments)
-        total = len(sentiments)
-        
-        recommendations = "=" * 60 + "\n"
-        recommendations += "APPLE VISION PRO - INSIGHTS AND RECOMMENDATIONS\n"
-        recommendations += "=" * 60 + "\n\n"
-        
-        recommendations += f"OVERALL SENTIMENT SUMMARY:\n"
-        recommendations += f"  Total Reviews: {total}\n"
-        recommendations += f"  Positive: {sentiment_counts.get('POSITIVE', 0)} ({sentiment_counts.get('POSITIVE', 0)/total*100:.1f}%)\n"
-        recommendations += f"  Negative: {sentiment_counts.get('NEGATIVE', 0)} ({sentiment_counts.get('NEGATIVE', 0)/total*100:.1f}%)\n"
-        recommendations += f"  Neutral: {sentiment_counts.get('NEUTRAL', 0)} ({sentiment_counts.get('NEUTRAL', 0)/total*100:.1f}%)\n\n"
-        
-        recommendations += "STRENGTHS (Most Appreciated Features):\n"
-        recommendations += "-" * 60 + "\n"
-        if pos_counts:
-            for i, (aspect, count) in enumerate(pos_counts.most_common(5), 1):
-                recommendations += f"  {i}. {aspect.upper()}: Mentioned positively {count} times\n"
-        else:
-            recommendations += "  No positive aspects identified\n"
-        
-        recommendations += "\nAREAS FOR IMPROVEMENT (Common Complaints):\n"
-        recommendations += "-" * 60 + "\n"
-        if neg_counts:
-            for i, (aspect, count) in enumerate(neg_counts.most_common(5), 1):
-                recommendations += f"  {i}. {aspect.upper()}: Mentioned negatively {count} times\n"
-        else:
-            recommendations += "  No negative aspects identified\n"
-        
-        recommendations += "\nACTIONABLE RECOMMENDATIONS:\n"
-        recommendations += "-" * 60 + "\n"
-        if neg_counts:
-            for i, (aspect, count) in enumerate(neg_counts.most_common(3), 1):
-                recommendations += f"  {i}. PRIORITY: Address {aspect} issues - mentioned {count} times\n"
-                recommendations += f"     This is a critical area affecting customer satisfaction\n\n"
-        else:
-            recommendations += "  Continue maintaining current product quality\n"
-        
-        recommendations += "\nSTRATEGIC INSIGHTS:\n"
-        recommendations += "-" * 60 + "\n"
-        if pos_counts:
-            top_strength = pos_counts.most_common(1)[0][0]
-            recommendations += f"  • Leverage {top_strength} as a key marketing point\n"
-        if neg_counts:
-            top_weakness = neg_counts.most_common(1)[0][0]
-            recommendations += f"  • Focus R&D efforts on improving {top_weakness}\n"
-        
-        recommendations += "\n" + "=" * 60 + "\n"
+        recommendations = build_recommendations(self.engine.aggregates)
         
         # Display in a new window
         rec_window = tk.Toplevel(self.root)
@@ -610,11 +756,31 @@ Top 5 Most Mentioned Aspects:
         rec_text.pack(padx=10, pady=10, fill='both', expand=True)
         rec_text.insert(1.0, recommendations)
         rec_text.config(state='disabled')
+        rec_text.bind('<Double-1>', self.recommendation_clicked)
+        ttk.Label(rec_window, text="Double-click a line naming an aspect to see its reviews").pack()
         
         # Add export button
         ttk.Button(rec_window, text="Export Recommendations", 
                   command=lambda: self.export_recommendations(recommendations)).pack(pady=5)
     
+    def recommendation_clicked(self, event):
+        """Show the reviews behind the double-clicked recommendations line: the aspect it names, with
+        the sentiment it was mentioned with"""
+        line = event.widget.get("current linestart", "current lineend").lower()
+        aggregates = self.engine.aggregates
+        named = [aspect for aspect, _ in aggregates.top_by_aspect_sentiment('positive', 5)
+                 + aggregates.top_by_aspect_sentiment('negative', 5)
+                 if re.search(rf"\b{re.escape(aspect.lower())}\b", line)]
+        if not named:
+            return
+        filters = {'aspect': max(named, key=len)}
+        if 'positively' in line or 'leverage' in line:
+            filters['aspect_sentiment'] = 'positive'
+        elif any(word in line for word in ('negatively', 'address', 'improving')):
+            filters['aspect_sentiment'] = 'negative'
+        self.show_filtered_results(filters)
+        return 'break'
+    
     def export_recommendations(self, recommendations):
         filename = filedialog.asksaveasfilename(
             defaultextension=".txt",
@@ -628,38 +794,59 @@ Top 5 Most Mentioned Aspects:
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to export: {str(e)}")
     
+    def export_in_background(self, export, message):
+        """Run an export on a worker thread; its progress shows in the progress bar"""
+        def work():
+            try:
+                count = export()
+            except Exception as e:
+                self.ui.call(messagebox.showerror, "Error", f"Failed to export: {str(e)}")
+                return
+            self.log_status(message.format(count=count))
+            self.ui.call(messagebox.showinfo, "Success", message.format(count=count))
+        
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        thread.start()
+    
     def export_results(self):
-        if not self.analysis_results:
+        if not self.engine.aggregates.total:
             messagebox.showwarning("Warning", "No results to export")
             return
         
-        filename = filedialog.asksaveasfilename(
-            defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
-        )
+        filetypes = [("JSON files", "*.json"), ("JSON Lines files", "*.jsonl")]
+        if parquet_available():
+            filetypes.append(("Parquet files", "*.parquet"))
+        filetypes += [("SQLite databases", "*.db"), ("All files", "*.*")]
+        filename = filedialog.asksaveasfilename(defaultextension=".json", filetypes=filetypes)
         
         if filename:
-            try:
-                with open(filename, 'w') as f:
-                    json.dump(self.analysis_results, f, indent=2)
-                messagebox.showinfo("Success", "Results exported successfully!")
-                self.log_status(f"Results exported to {filename}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to export: {str(e)}")
+            self.export_in_background(lambda: self.engine.export_results(filename),
+                                      f"{{count}} results exported to {filename}")
+    
+    def write_back_results(self):
+        if not self.engine.aggregates.total:
+            messagebox.showwarning("Warning", "No results to export")
+            return
+        if messagebox.askyesno("Write Back", "Write every result into the sentiment_results and "
+                                             "sentiment_results_aspects tables of the reviews database, "
+                                             "replacing them if they exist?"):
+            self.export_in_background(self.engine.write_back,
+                                      "{count} results written to sentiment_results in the reviews database")
+    
+    def set_progress(self, text, value):
+        """Safe to call from worker threads"""
+        self.ui.progress(self.progress_label, self.progress_bar, text, value)
     
     def log_status(self, message):
         from datetime import datetime
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.status_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.status_text.see(tk.END)
-        self.root.update_idletasks()
+        self.ui.log(self.status_text, f"[{timestamp}] {message}\n")
     
     def log_analysis(self, message):
         from datetime import datetime
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.analysis_output.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.analysis_output.see(tk.END)
-        self.root.update_idletasks()
+        self.ui.log(self.analysis_output, f"[{timestamp}] {message}\n")
 
 if __name__ == "__main__":
     root = tk.Tk()
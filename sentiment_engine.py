@@ -0,0 +1,927 @@
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+from request_scheduler import RequestScheduler, estimate_tokens
+from response_parsing import (parse_aspects_result, parse_fused_result, parse_sentiment_result,
+                              structured_response_format)
+from batch_classifier import BatchClassifier
+from result_cache import ResultCache, prompt_version, cache_path_for
+from results_store import ResultsStore, is_app_table, is_results_table, quote_identifier
+from result_aggregates import ResultAggregates
+from aspect_index import AspectIndex
+from local_classifier import CALIBRATION_AGREEMENT, LocalClassifier, calibrate_threshold, model_path_for
+from dedup import find_duplicates
+from call_metrics import CallMetrics
+from review_source import ReviewSource, ReviewStream, SourceSpec
+from prompts import DEFAULT_PROMPT_VERSION, get_template
+from model_backends import DEFAULT_MODEL
+from result_exporters import (export_format, with_progress, write_json, write_jsonl, write_parquet,
+                              write_sqlite)
+
+# Completed results are checkpointed to the store in one transaction per this many reviews,
+# or sooner once this many seconds have passed since the last checkpoint
+CHECKPOINT_ROWS = 50
+CHECKPOINT_SECONDS = 2.0
+
+# Reviews whose response could not be used are sent again this many more times at the end of a run,
+# then recorded as failed rather than given a default result
+FAILURE_RETRIES = 1
+
+TEMPERATURE = 0.3
+
+# local_threshold meaning the threshold calibrated when the local classifier was last trained
+CALIBRATED = 'calibrated'
+
+# Settings a resumed run takes from its run record, with the value for records that leave one out
+_RESUMED_SETTINGS = {
+    'incremental': True,
+    'local_threshold': None,
+    'dedup_threshold': None,
+    'prompt_version': DEFAULT_PROMPT_VERSION,
+    'structured_output': False,
+}
+
+
+def load_api_key():
+    """OPENAI_API_KEY from the environment, else from MasonsAPI_KEY.py; None if neither is set"""
+    key = os.environ.get('OPENAI_API_KEY')
+    if key:
+        return key
+    try:
+        import MasonsAPI_KEY
+        return MasonsAPI_KEY.OPENAI_API_KEY
+    except (ImportError, AttributeError):
+        return None
+
+
+def find_review_table(db_path, table_name=None):
+    """(table name, column names) of the named table, or else of the most likely review table in the database"""
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")]
+        if table_name is not None:
+            if table_name not in tables:
+                raise ValueError(f"No table named {table_name!r} in database")
+            tables = [table_name]
+            if is_app_table(table_name):
+                raise ValueError(f"{table_name!r} is one of the tables the app keeps its results in")
+        else:
+            tables = [name for name in tables if not is_app_table(name, tables)]
+        if not tables:
+            raise ValueError("No tables found in database")
+        table_name = tables[0]
+        for name in tables:
+            if 'review' in name.lower() or 'feedback' in name.lower():
+                table_name = name
+                break
+        columns = [col[1] for col in conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})")]
+        return table_name, columns
+    finally:
+        conn.close()
+
+
+def _percent(count, total):
+    return f"{count} ({count/total*100 if total else 0:.1f}%)"
+
+
+def build_summary(aggregates):
+    """Summary statistics text, read from the running aggregates"""
+    total = aggregates.total
+    if not total:
+        return "No reviews analyzed yet"
+    sentiment_counts = aggregates.sentiment_counts()
+
+    summary = f"""Total Reviews Analyzed: {total}
+
+Sentiment Distribution:
+  Positive: {_percent(sentiment_counts.get('POSITIVE', 0), total)}
+  Negative: {_percent(sentiment_counts.get('NEGATIVE', 0), total)}
+  Neutral: {_percent(sentiment_counts.get('NEUTRAL', 0), total)}
+
+Total Aspects Extracted: {aggregates.aspect_mentions}
+Unique Aspects: {aggregates.unique_aspects()}
+
+Top 5 Most Mentioned Aspects:
+"""
+    for aspect, count in aggregates.top_aspects(5):
+        summary += f"  {aspect}: {count} times\n"
+    return summary
+
+
+def build_recommendations(aggregates):
+    """Insights and recommendations report, read from the running aggregates"""
+    # Most mentioned positive and negative aspects
+    strengths = aggregates.top_by_aspect_sentiment('positive', 5)
+    weaknesses = aggregates.top_by_aspect_sentiment('negative', 5)
+
+    # Overall sentiment
+    sentiment_counts = aggregates.sentiment_counts()
+    total = aggregates.total
+
+    recommendations = "=" * 60 + "\n"
+    recommendations += "APPLE VISION PRO - INSIGHTS AND RECOMMENDATIONS\n"
+    recommendations += "=" * 60 + "\n\n"
+
+    recommendations += f"OVERALL SENTIMENT SUMMARY:\n"
+    recommendations += f"  Total Reviews: {total}\n"
+    recommendations += f"  Positive: {_percent(sentiment_counts.get('POSITIVE', 0), total)}\n"
+    recommendations += f"  Negative: {_percent(sentiment_counts.get('NEGATIVE', 0), total)}\n"
+    recommendations += f"  Neutral: {_percent(sentiment_counts.get('NEUTRAL', 0), total)}\n\n"
+
+    recommendations += "STRENGTHS (Most Appreciated Features):\n"
+    recommendations += "-" * 60 + "\n"
+    if strengths:
+        for i, (aspect, count) in enumerate(strengths, 1):
+            recommendations += f"  {i}. {aspect.upper()}: Mentioned positively {count} times\n"
+    else:
+        recommendations += "  No positive aspects identified\n"
+
+    recommendations += "\nAREAS FOR IMPROVEMENT (Common Complaints):\n"
+    recommendations += "-" * 60 + "\n"
+    if weaknesses:
+        for i, (aspect, count) in enumerate(weaknesses, 1):
+            recommendations += f"  {i}. {aspect.upper()}: Mentioned negatively {count} times\n"
+    else:
+        recommendations += "  No negative aspects identified\n"
+
+    recommendations += "\nACTIONABLE RECOMMENDATIONS:\n"
+    recommendations += "-" * 60 + "\n"
+    if weaknesses:
+        for i, (aspect, count) in enumerate(weaknesses[:3], 1):
+            recommendations += f"  {i}. PRIORITY: Address {aspect} issues - mentioned {count} times\n"
+            recommendations += f"     This is a critical area affecting customer satisfaction\n\n"
+    else:
+        recommendations += "  Continue maintaining current product quality\n"
+
+    recommendations += "\nSTRATEGIC INSIGHTS:\n"
+    recommendations += "-" * 60 + "\n"
+    if strengths:
+        recommendations += f"  • Leverage {strengths[0][0]} as a key marketing point\n"
+    if weaknesses:
+        recommendations += f"  • Focus R&D efforts on improving {weaknesses[0][0]}\n"
+
+    recommendations += "\n" + "=" * 60 + "\n"
+    return recommendations
+
+
+def _combine(first, second):
+    """Join two (join, condition) review filters into one"""
+    conditions = [f"({condition})" for condition in (first[1], second[1]) if condition]
+    return f"{first[0]} {second[0]}", " AND ".join(conditions)
+
+
+def _ignore(*args):
+    pass
+
+
+class CheckpointWriter:
+    """Buffers completed result rows and hands them to save() a batch at a time"""
+
+    def __init__(self, save, max_rows=CHECKPOINT_ROWS, max_seconds=CHECKPOINT_SECONDS):
+        self.save = save
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.rows = []
+        self.last_flush = time.monotonic()
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.max_rows or time.monotonic() - self.last_flush >= self.max_seconds:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.save(self.rows)
+            self.rows = []
+        self.last_flush = time.monotonic()
+
+
+class AnalysisEngine:
+    """Loads reviews, runs the analysis and stores results, without any UI.
+
+    Requests go to a model backend from model_backends. Front ends pass callbacks:
+    log_status(line) for setup messages, log_analysis(line) for per-review output and
+    on_progress(text, percent) for run progress. Callbacks may be called from the
+    thread running the analysis.
+    """
+
+    def __init__(self, backend=None, log_status=None, log_analysis=None, on_progress=None):
+        self.backend = backend
+        self.log_status = log_status or _ignore
+        self.log_analysis = log_analysis or _ignore
+        self.on_progress = on_progress or _ignore
+
+        # Data storage: reviews are streamed from self.source, never held in memory
+        self.source = None
+        self.review_count = 0
+        # Free-text aspect names are mapped to canonical aspects before they are stored or counted
+        self.aspect_index = AspectIndex()
+        # Running totals over every stored result; views read these instead of the results
+        self.aggregates = ResultAggregates(self.aspect_index)
+
+        # Concurrent, rate-limited request scheduling
+        self.scheduler = RequestScheduler()
+        # Per-call latency, token, cost, cache and parse failure instrumentation for the current run
+        self.call_stats = CallMetrics(backend.model if backend is not None else DEFAULT_MODEL)
+        # Ask for JSON matching a schema instead of describing the format in the prompt
+        self.structured_output = False
+        self.batch_size = 1
+        self.incremental = True
+
+        # Local sentiment pre-classifier; None threshold sends every review to the API
+        self.local_model = None
+        self.local_threshold = None
+        self.local_stats = {'local': 0, 'escalated': 0}
+
+        # Near-duplicate similarity threshold; None analyzes every review, otherwise one review per duplicate cluster
+        self.dedup_threshold = None
+
+        # Compiled prompt templates for single-review requests; see prompts.py
+        self.prompt_version = DEFAULT_PROMPT_VERSION
+
+        # Persistent result cache, opened next to the database when reviews are loaded
+        self.cache = None
+        # Stored analysis results, opened in the reviews database when reviews are loaded
+        self.store = None
+        # The run results are being saved under, while one is in progress
+        self.run_id = None
+        # In a shard worker, the run started by the parent process, which every shard saves under
+        self.shared_run_id = None
+
+    def configure(self, concurrency=8, requests_per_minute=3500, tokens_per_minute=90000,
+                  batch_size=1, incremental=True, local_threshold=None, dedup_threshold=None,
+                  prompt_version=DEFAULT_PROMPT_VERSION, structured_output=False, rate_limiter=None):
+        """Set request scheduling, batching, incremental mode, the local pre-classifier, deduplication,
+        prompt version and structured output for the next run.
+
+        local_threshold is the confidence the local classifier answers at, CALIBRATED for the threshold
+        found when it was last trained, or None to send every review to the API.
+        rate_limiter, if given, is used instead of the requests and tokens per minute budgets"""
+        get_template('sentiment', prompt_version)
+        self.scheduler = RequestScheduler(
+            concurrency=concurrency,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            limiter=rate_limiter
+        )
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.local_threshold = local_threshold
+        self.dedup_threshold = dedup_threshold
+        self.prompt_version = prompt_version
+        self.structured_output = structured_output
+
+    def use_backend(self, backend):
+        """Send requests to backend from the next one on, pricing calls at its model's rates"""
+        self.backend = backend
+        if backend.model != self.call_stats.model:
+            self.call_stats = CallMetrics(backend.model)
+
+    def template(self, kind):
+        return get_template(kind, self.prompt_version)
+
+    def open_database(self, db_path, use_cache=True, spec=None, create_indexes=False):
+        """Point the engine at a reviews database; returns (table name, column names).
+
+        spec, a SourceSpec, picks the table and columns and narrows the reviews analyzed.
+        Indexes the spec's columns would need are suggested in the status log, or created
+        with create_indexes=True"""
+        spec = spec or SourceSpec()
+        table_name, columns = find_review_table(db_path, spec.table)
+        # Unless the spec says otherwise, the review text is the last column
+        source = ReviewSource(db_path, table_name, spec.text_column or columns[-1], spec=spec)
+        source.validate()
+        missing = source.missing_indexes()
+        if missing and create_indexes:
+            start = time.perf_counter()
+            source.create_indexes(missing)
+            self.log_status(f"Created {len(missing)} indexes in {time.perf_counter() - start:.1f}s: "
+                            + "; ".join(missing))
+        elif missing:
+            self.log_status("Filtering or sampling would be faster with: " + "; ".join(missing))
+        self.open_source(source, use_cache)
+        return table_name, columns
+
+    def open_source(self, source, use_cache=True):
+        """Analyze the reviews of a ReviewSource, opening the cache, store and local classifier for its database"""
+        # Reviews are only counted here; analysis streams them in chunks
+        self.source = source
+        self.review_count = source.count()
+        if use_cache:
+            self.open_cache(source.db_path)
+        elif self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        self.open_store()
+        self.load_local_model()
+
+    def open_cache(self, db_path):
+        """Open the result cache stored next to the reviews database"""
+        path = cache_path_for(db_path)
+        if self.cache is not None:
+            if self.cache.path == path:
+                return
+            self.cache.close()
+        try:
+            self.cache = ResultCache(path)
+            self.log_status(f"Result cache: {path} ({self.cache.entry_count()} entries)")
+        except Exception as e:
+            self.cache = None
+            self.log_status(f"Result cache unavailable: {str(e)}")
+
+    def open_store(self):
+        """Open the results table inside the reviews database and total up any stored results"""
+        if self.store is not None:
+            self.store.close()
+        self.store = ResultsStore(self.source)
+        # A shard of a sharded run leaves this upkeep, and the runs, to the process running the whole table
+        whole_table = self.source.id_range is None
+        removed = 0
+        if whole_table:
+            removed = self.store.prune_deleted()
+            self.store.mark_abandoned_runs()
+        if removed is None:
+            self.log_status(f"None of the stored results belong to a review in table '{self.source.table_name}', "
+                            f"so they are kept; check that this is the reviews table")
+        self.aggregates = ResultAggregates.from_results(self.store.iter_results(), self.aspect_index)
+        self.log_status(f"Stored results: {self.aggregates.total} reviews already analyzed"
+                        + (f", {removed} removed for deleted reviews" if removed else ""))
+        run = self.store.unfinished_run() if whole_table else None
+        if run is not None:
+            self.log_status(f"Run {run['run_id']} ({run['kind']}) stopped after {run['completed']} of "
+                            f"{run['total']} reviews; resume it to analyze only the rest")
+
+    def load_local_model(self):
+        """Load the local classifier trained on this database's labels, or start from the seed lexicon"""
+        path = model_path_for(self.source.db_path)
+        self.local_model = LocalClassifier()
+        if os.path.exists(path):
+            try:
+                self.local_model = LocalClassifier.load(path)
+                self.log_status(f"Local classifier: trained on {self.local_model.trained_on} API labels")
+            except Exception as e:
+                self.log_status(f"Local classifier could not be loaded, using the seed lexicon: {str(e)}")
+
+    def train_local_model(self):
+        """Retrain the local classifier on every sentiment the API has labeled; returns (examples, training accuracy)"""
+        texts, labels = [], []
+        for result in self.store.iter_results_with_text():
+            # Duplicates carry their representative's label, which would otherwise be counted once per copy
+            if result['labeled_by'] == 'api' and result['cluster_id'] in (None, result['review_id']):
+                texts.append(result['review_text'])
+                labels.append(result['sentiment'])
+        model = LocalClassifier()
+        accuracy = model.train(texts, labels)
+        if accuracy is None:
+            return 0, None
+        model.threshold, coverage, agreement = calibrate_threshold(texts, labels)
+        model.save(model_path_for(self.source.db_path))
+        self.local_model = model
+        self.log_status(f"Local classifier trained on {len(texts)} API labels ({accuracy:.1%} training accuracy)")
+        if model.threshold is None:
+            self.log_status("No confidence threshold keeps held-out agreement with the API at "
+                            f"{CALIBRATION_AGREEMENT:.0%}; a calibrated run sends every review to the API")
+        else:
+            self.log_status(f"Calibrated threshold {model.threshold:.2f}: answers {coverage:.1%} of held-out "
+                            f"reviews locally, {agreement:.1%} of them as the API did")
+        return len(texts), accuracy
+
+    def local_cutoff(self):
+        """The confidence the local classifier answers at: local_threshold, or the model's calibrated
+        threshold when it is CALIBRATED; None when no review is answered locally"""
+        if self.local_threshold == CALIBRATED:
+            return self.local_model.threshold if self.local_model is not None else None
+        return self.local_threshold
+
+    def local_prefilter(self, reviews, on_result, threshold, chunk_size=256):
+        """Answer reviews the local classifier is at least threshold confident about and yield the rest for the API"""
+        reviews = iter(reviews)
+        while True:
+            chunk = list(itertools.islice(reviews, chunk_size))
+            if not chunk:
+                return
+            predictions = self.local_model.predict_batch([text for _, text in chunk])
+            for (review_id, review_text), (sentiment, confidence) in zip(chunk, predictions):
+                if confidence >= threshold:
+                    self.local_stats['local'] += 1
+                    on_result(review_id, review_text, (sentiment, round(confidence, 2)), 'local')
+                else:
+                    self.local_stats['escalated'] += 1
+                    yield review_id, review_text
+
+    def deduplicate(self):
+        """Group exact and near-duplicate reviews into clusters and copy stored results to the duplicates;
+        returns the number of duplicates found"""
+        start = time.perf_counter()
+        computed = []
+
+        # Signatures stored by earlier runs are reused; new ones are saved a chunk at a time
+        def reviews():
+            for chunk in self.source.iter_chunks():
+                stored = self.store.signatures(chunk)
+                texts = dict(chunk)
+                for review_id, text in chunk:
+                    yield review_id, text, stored.get(review_id)
+                self.store.save_signatures([(review_id, texts[review_id], signature)
+                                            for review_id, signature in computed])
+                computed.clear()
+
+        assignments, stats = find_duplicates(reviews(), self.dedup_threshold,
+                                             on_signature=lambda *signed: computed.append(signed))
+        self.store.replace_clusters(assignments)
+        self.log_analysis(f"Deduplication: {len(assignments)} of {stats['reviews']} reviews are duplicates "
+                          f"({stats['exact']} exact, {stats['near']} near) in {stats['clusters']} clusters, "
+                          f"found in {time.perf_counter() - start:.1f}s ({stats['signatures']} MinHash signatures "
+                          f"computed)")
+        # Duplicates of reviews analyzed before the clusters were built
+        self.fan_out()
+        return len(assignments)
+
+    def fan_out(self, cluster_ids=None):
+        """Copy representatives' stored results to the duplicates in their clusters and count them"""
+        for review_id, sentiment, confidence, aspects in self.store.fan_out(cluster_ids):
+            self.aggregates.update(review_id, sentiment, confidence, aspects)
+
+    def save_results(self, rows):
+        """Store result rows under the current run, copying them to any duplicates of the reviews"""
+        self.store.save_results(rows, self.run_id)
+        if self.dedup_threshold is not None:
+            self.fan_out([row[0] for row in rows])
+
+    def save_aspects(self, rows):
+        self.store.save_aspects(rows, self.run_id)
+        if self.dedup_threshold is not None:
+            self.fan_out([row[0] for row in rows])
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+    def reviews_to_analyze(self, need_aspects, resume=None):
+        """(stream of (review_id, text), count) to analyze: only new or changed reviews in incremental mode,
+        only one review per duplicate cluster when deduplicating, and only reviews an unfinished run
+        has not saved when resuming it"""
+        join, condition = "", ""
+        if self.dedup_threshold is not None:
+            self.deduplicate()
+            join, condition = self.store.representatives_filter()
+        if self.incremental:
+            # Reviews a run has saved are no longer pending, so resuming needs no extra filter
+            join, condition = _combine(self.store.pending_filter(need_aspects=need_aspects), (join, condition))
+            total = self.source.count(join, condition)
+            self.log_analysis(f"Incremental run: {total} of {self.review_count} reviews are new or changed")
+        elif resume is not None:
+            join, condition = _combine(self.store.run_filter(resume['run_id']), (join, condition))
+            total = self.source.count(join, condition)
+        else:
+            total = self.source.count(join, condition)
+        return ReviewStream(self.source, join=join, condition=condition), total
+
+    def begin_run(self, kind, total, resume=None, reset_metrics=True, **settings):
+        """Record the start of a run, or the continuation of an unfinished one; returns the reviews it already saved"""
+        if reset_metrics:
+            self.call_stats.reset()
+        if self.shared_run_id is not None:
+            self.run_id = self.shared_run_id
+            return 0
+        if resume is not None:
+            self.run_id = resume['run_id']
+            self.store.resume_run(self.run_id, resume['completed'] + total)
+            self.log_analysis(f"Resuming run {self.run_id}: {resume['completed']} reviews already saved, "
+                              f"{total} to go")
+            return resume['completed']
+        settings.update(incremental=self.incremental, local_threshold=self.local_threshold,
+                        dedup_threshold=self.dedup_threshold, prompt_version=self.prompt_version,
+                        structured_output=self.structured_output, source=vars(self.source.spec))
+        self.run_id = self.store.start_run(kind, total, settings)
+        return 0
+
+    def end_run(self, checkpoint, finished):
+        """Save the last buffered results and record whether the run completed"""
+        try:
+            checkpoint.flush()
+        finally:
+            # A shared run is finished by the process that started it, once every shard is done
+            if self.shared_run_id is None:
+                self.store.finish_run(self.run_id, 'complete' if finished else 'interrupted')
+            self.run_id = None
+
+    def unfinished_run(self):
+        return self.store.unfinished_run() if self.store is not None else None
+
+    def run_source(self, run):
+        """The open source narrowed to the filter and sample a run recorded, so resuming it reads the same reviews"""
+        stored = run['settings'].get('source')
+        source = self.source
+        if stored is None or stored == vars(source.spec):
+            return source
+        spec = SourceSpec(**stored)
+        if ((spec.table and spec.table.lower() != source.table_name.lower())
+                or (spec.id_column or 'rowid').lower() != source.id_column_name.lower()
+                or (spec.text_column and spec.text_column.lower() != source.text_column_name.lower())):
+            raise ValueError(f"Run {run['run_id']} read reviews from another table or columns; "
+                             f"open them as it did to resume it")
+        restored = ReviewSource(source.db_path, source.table_name, source.text_column_name, source.id_range, spec)
+        restored.validate()
+        return restored
+
+    def resume_run(self):
+        """Continue the most recent run if it did not complete, with its original settings;
+        returns the number of reviews analyzed"""
+        run = self.unfinished_run()
+        if run is None:
+            self.log_status("No unfinished run to resume")
+            return 0
+        settings = run['settings']
+        # The run's settings and reviews only apply while it is resumed; the configured ones come back afterwards
+        configured = {name: getattr(self, name) for name in _RESUMED_SETTINGS}
+        configured['source'] = self.source
+        self.source = self.run_source(run)
+        for name, default in _RESUMED_SETTINGS.items():
+            setattr(self, name, settings.get(name, default))
+        try:
+            if run['kind'] == 'fused':
+                return self.run_fused_analysis(resume=run)
+            if run['kind'] == 'aspects':
+                return self.run_aspect_extraction(resume=run)
+            completed = self.run_sentiment_analysis(resume=run)
+            if settings.get('then_aspects'):
+                completed += self.run_aspect_extraction(reset_metrics=False)
+            return completed
+        finally:
+            for name, value in configured.items():
+                setattr(self, name, value)
+
+    def cache_lookup(self, kind, prompt, review_text):
+        """Return (key, cached value); both are None when no cache is open"""
+        if self.cache is None:
+            return None, None
+        key = self.cache_lookup_key(prompt, review_text)
+        value = self.cache.get(key)
+        self.call_stats.record_cache(kind, value is not None)
+        return key, value
+
+    def cache_lookup_key(self, prompt, review_text):
+        if self.cache is None:
+            return None
+        return ResultCache.make_key(self.backend.cache_namespace, prompt_version(prompt), TEMPERATURE, review_text)
+
+    def cache_store(self, prompt, key, value):
+        if key is not None:
+            self.cache.put(key, prompt_version(prompt), value)
+
+    def request_completion(self, kind, messages, max_tokens, **options):
+        """Send one chat completion through the scheduler and record its queue wait, latency, retries and tokens"""
+        timing = {'latency': 0.0}
+
+        def request():
+            start = time.perf_counter()
+            try:
+                return self.backend.complete(messages, max_tokens=max_tokens, temperature=TEMPERATURE, **options)
+            finally:
+                timing['latency'] = time.perf_counter() - start
+
+        estimated = estimate_tokens(*(m["content"] for m in messages)) + max_tokens
+        scheduling = {}
+        try:
+            response = self.scheduler.call(request, estimated_tokens=estimated, stats=scheduling)
+        except Exception:
+            self.call_stats.record(kind, timing['latency'], error=True, **scheduling)
+            raise
+        usage = getattr(response, 'usage', None)
+        self.call_stats.record(kind, timing['latency'],
+                               prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                               completion_tokens=getattr(usage, 'completion_tokens', None),
+                               total_tokens=getattr(usage, 'total_tokens', None) or estimated,
+                               **scheduling)
+        return response.content.strip()
+
+    def response_options(self, kind):
+        """Extra request arguments for a single-review request of this kind"""
+        if self.structured_output:
+            return {"response_format": structured_response_format(kind)}
+        if kind == 'fused':
+            return {"response_format": {"type": "json_object"}}
+        return {}
+
+    def analyze_sentiment(self, review_text):
+        """Analyze sentiment of a single review using OpenAI API; None if no usable answer came back"""
+        template = self.template('sentiment')
+        key, cached = self.cache_lookup('sentiment', template.fingerprint, review_text)
+        if cached is not None:
+            return tuple(cached)
+        try:
+            messages, max_tokens = template.compile(review_text, self.structured_output)
+            result = self.request_completion('sentiment', messages, max_tokens=max_tokens,
+                                             **self.response_options('sentiment'))
+            outcome = parse_sentiment_result(result)
+            self.cache_store(template.fingerprint, key, list(outcome))
+            return outcome
+        except Exception as e:
+            if isinstance(e, ValueError):
+                self.call_stats.record_parse_failure('sentiment')
+            self.log_status(f"Error in sentiment analysis: {str(e)}")
+            return None
+
+    def extract_aspects(self, review_text):
+        """Extract specific aspects mentioned in the review; None if no usable answer came back"""
+        template = self.template('aspects')
+        key, cached = self.cache_lookup('aspects', template.fingerprint, review_text)
+        if cached is not None:
+            return cached
+        try:
+            messages, max_tokens = template.compile(review_text, self.structured_output)
+            result = self.request_completion('aspects', messages, max_tokens=max_tokens,
+                                             **self.response_options('aspects'))
+            aspects = parse_aspects_result(result)
+            self.cache_store(template.fingerprint, key, aspects)
+            return aspects
+        except Exception as e:
+            if isinstance(e, ValueError):
+                self.call_stats.record_parse_failure('aspects')
+            self.log_status(f"Error in aspect extraction: {str(e)}")
+            return None
+
+    def analyze_review(self, review_text):
+        """Get sentiment, confidence and aspects from one request, falling back to two passes if the JSON is invalid;
+        None if the request failed or either pass of the fallback failed too"""
+        template = self.template('fused')
+        key, cached = self.cache_lookup('fused', template.fingerprint, review_text)
+        if cached is not None:
+            return tuple(cached)
+        try:
+            messages, max_tokens = template.compile(review_text, self.structured_output)
+            result = self.request_completion('fused', messages, max_tokens=max_tokens,
+                                             **self.response_options('fused'))
+            outcome = parse_fused_result(result)
+            self.cache_store(template.fingerprint, key, list(outcome))
+            return outcome
+        except ValueError as e:
+            # Only an unusable reply is worth two more requests; a failed one is retried and recorded as failed
+            self.call_stats.record_parse_failure('fused')
+            self.log_status(f"Single-pass analysis failed, falling back to two requests: {str(e)}")
+            self.call_stats.record_fallback()
+            sentiment = self.analyze_sentiment(review_text)
+            aspects = self.extract_aspects(review_text) if sentiment is not None else None
+            if aspects is None:
+                return None
+            return sentiment + (aspects,)
+        except Exception as e:
+            self.log_status(f"Error in single-pass analysis: {str(e)}")
+            return None
+
+    def retry_failures(self, failed, analyze, on_result, kind):
+        """Send reviews that got no usable response again, FAILURE_RETRIES more times, passing recovered
+        results to on_result; records the rest as failed and returns how many there were"""
+        for _ in range(FAILURE_RETRIES):
+            if not failed:
+                break
+            self.log_analysis(f"Retrying {len(failed)} reviews that got no usable response")
+            retry, failed = failed, []
+            for _, ((review_id, review_text), outcome) in self.scheduler.run(
+                    lambda review: (review, analyze(review[1])), retry):
+                if outcome is None:
+                    failed.append((review_id, review_text))
+                else:
+                    on_result(review_id, review_text, outcome)
+        if failed:
+            self.store.mark_failed([review_id for review_id, _ in failed], kind, FAILURE_RETRIES + 1, self.run_id)
+            self.log_analysis(f"{len(failed)} reviews still failed and were marked as failed rather than saved; "
+                              f"the next incremental run tries them again")
+        return len(failed)
+
+    def analyze_stream(self, reviews, with_aspects, on_result):
+        """Analyze a stream of (review_id, text) one per request, or several per request when batching is on.
+
+        on_result(review_id, review_text, outcome, labeled_by='api') is called from this thread as each
+        review completes. Sentiment-only runs answer confident reviews with the local classifier first.
+        """
+        analyze = self.analyze_review if with_aspects else self.analyze_sentiment
+        if not with_aspects and self.local_threshold is not None and self.local_model is not None:
+            self.local_stats = {'local': 0, 'escalated': 0}
+            threshold = self.local_cutoff()
+            if threshold is None:
+                self.log_analysis("The local classifier has no calibrated threshold, so every review goes to the API; "
+                                  "train it from stored labels once there are enough to calibrate one")
+            else:
+                reviews = self.local_prefilter(reviews, on_result, threshold)
+        if self.batch_size <= 1:
+            for _, ((review_id, review_text), outcome) in self.scheduler.run(
+                    lambda review: (review, analyze(review[1])), reviews):
+                on_result(review_id, review_text, outcome)
+            return
+
+        classifier = BatchClassifier(
+            complete=lambda messages, max_tokens: self.request_completion(
+                'batch', messages, max_tokens, response_format={"type": "json_object"}),
+            fallback=analyze,
+            with_aspects=with_aspects,
+            max_batch_size=self.batch_size,
+            on_parsed=lambda text, outcome: self.cache_store(
+                classifier.prompt, self.cache_lookup_key(classifier.prompt, text), list(outcome)),
+            on_invalid=lambda count: self.call_stats.record_parse_failure('batch')
+        )
+        sent = [0, 0]
+
+        # Answer cached reviews straight away and only batch the rest
+        def uncached():
+            for review_id, review_text in reviews:
+                _, cached = self.cache_lookup('batch', classifier.prompt, review_text)
+                if cached is not None:
+                    on_result(review_id, review_text, tuple(cached))
+                else:
+                    sent[0] += 1
+                    yield review_id, review_text
+
+        def classify(batch):
+            return batch, classifier.classify_batch(batch)
+
+        for _, (batch, outcomes) in self.scheduler.run(classify, classifier.iter_batches(uncached())):
+            sent[1] += 1
+            for (review_id, review_text), outcome in zip(batch, outcomes):
+                on_result(review_id, review_text, outcome)
+
+        stats = classifier.stats
+        self.log_analysis(f"Sent {sent[0]} reviews in {sent[1]} batches "
+                          f"({stats['splits']} split, {stats['single_fallbacks']} retried one at a time)")
+
+    def two_pass_token_estimate(self, review_text):
+        """Estimated tokens the two-pass path would spend on one review"""
+        total = 0
+        for kind in ('sentiment', 'aspects'):
+            messages, max_tokens = self.template(kind).compile(review_text, self.structured_output)
+            total += estimate_tokens(*(m["content"] for m in messages)) + max_tokens
+        return total
+
+    def run_sentiment_analysis(self, resume=None, then_aspects=False):
+        """Classify sentiment for every review that needs it; returns the number analyzed"""
+        reviews, remaining = self.reviews_to_analyze(need_aspects=False, resume=resume)
+        done = self.begin_run('sentiment', remaining, resume, then_aspects=then_aspects)
+        total = done + remaining
+        completed = [done]
+        checkpoint = CheckpointWriter(self.save_results)
+        failed = []
+
+        def record(review_id, review_text, outcome, labeled_by='api'):
+            sentiment, confidence = outcome
+            self.log_analysis(f"Review {review_id}: {sentiment} (confidence: {confidence:.2f})"
+                              + (" [local]" if labeled_by == 'local' else ""))
+            self.aggregates.update(review_id, sentiment, confidence, None)
+            checkpoint.add((review_id, review_text, sentiment, confidence, None, labeled_by))
+
+        def on_result(review_id, review_text, outcome, labeled_by='api'):
+            completed[0] += 1
+            self.call_stats.add_reviews()
+            self.on_progress(f"Analyzing review {completed[0]}/{total}...", completed[0] / max(total, 1) * 100)
+            if outcome is None:
+                failed.append((review_id, review_text))
+            else:
+                record(review_id, review_text, outcome, labeled_by)
+
+        # Requests run concurrently; each result is checkpointed and its text released once it completes
+        finished = False
+        unresolved = 0
+        try:
+            self.analyze_stream(reviews, False, on_result)
+            unresolved = self.retry_failures(failed, self.analyze_sentiment, record, 'sentiment')
+            finished = True
+        finally:
+            self.end_run(checkpoint, finished)
+        if self.local_threshold is not None and self.local_cutoff() is not None:
+            self.log_analysis(f"Local classifier answered {self.local_stats['local']} reviews, "
+                              f"{self.local_stats['escalated']} sent to the API")
+
+        self.on_progress("Sentiment analysis complete!", 100)
+        return completed[0] - done - unresolved
+
+    def run_aspect_extraction(self, resume=None, reset_metrics=True):
+        """Extract aspects for analyzed reviews; returns the number processed.
+
+        reset_metrics=False keeps counting into the call metrics of the sentiment pass before it."""
+        join, condition = self.store.analyzed_filter(missing_aspects_only=self.incremental)
+        if resume is not None and not self.incremental:
+            join, condition = self.store.run_filter(resume['run_id'], (join, condition))
+        if self.dedup_threshold is not None:
+            join, condition = _combine((join, condition), self.store.representatives_filter())
+        remaining = self.source.count(join, condition)
+        if self.incremental:
+            self.log_analysis(f"Incremental run: {remaining} reviews need aspects")
+        done = self.begin_run('aspects', remaining, resume, reset_metrics)
+        total = done + remaining
+        completed = [done]
+        checkpoint = CheckpointWriter(self.save_aspects)
+        failed = []
+
+        def record(review_id, review_text, aspects):
+            aspects = self.aspect_index.normalize(aspects)
+            self.log_analysis(f"Review {review_id} aspects: {len(aspects)} found")
+            self.aggregates.set_aspects(review_id, aspects)
+            checkpoint.add((review_id, aspects))
+
+        finished = False
+        unresolved = 0
+        try:
+            for _, ((review_id, review_text), aspects) in self.scheduler.run(
+                    lambda review: (review, self.extract_aspects(review[1])),
+                    ReviewStream(self.source, join=join, condition=condition)):
+                completed[0] += 1
+                self.call_stats.add_reviews()
+                self.on_progress(f"Extracting aspects {completed[0]}/{total}...", completed[0] / max(total, 1) * 100)
+                if aspects is None:
+                    failed.append((review_id, review_text))
+                else:
+                    record(review_id, review_text, aspects)
+            unresolved = self.retry_failures(failed, self.extract_aspects, record, 'aspects')
+            finished = True
+        finally:
+            self.end_run(checkpoint, finished)
+
+        self.on_progress("Aspect extraction complete!", 100)
+        return completed[0] - done - unresolved
+
+    def run_fused_analysis(self, resume=None):
+        """Sentiment and aspects in one request per review; returns the number analyzed"""
+        reviews, remaining = self.reviews_to_analyze(need_aspects=True, resume=resume)
+        done = self.begin_run('fused', remaining, resume)
+        total = done + remaining
+        completed = [done]
+        checkpoint = CheckpointWriter(self.save_results)
+        two_pass_estimate = [0]
+        failed = []
+
+        def record(review_id, review_text, outcome, labeled_by='api'):
+            sentiment, confidence, aspects = outcome
+            aspects = self.aspect_index.normalize(aspects)
+            self.log_analysis(f"Review {review_id}: {sentiment} (confidence: {confidence:.2f}), {len(aspects)} aspects")
+            two_pass_estimate[0] += self.two_pass_token_estimate(review_text)
+            self.aggregates.update(review_id, sentiment, confidence, aspects)
+            checkpoint.add((review_id, review_text, sentiment, confidence, aspects, labeled_by))
+
+        def on_result(review_id, review_text, outcome, labeled_by='api'):
+            completed[0] += 1
+            self.call_stats.add_reviews()
+            self.on_progress(f"Analyzing review {completed[0]}/{total}...", completed[0] / max(total, 1) * 100)
+            if outcome is None:
+                failed.append((review_id, review_text))
+            else:
+                record(review_id, review_text, outcome, labeled_by)
+
+        finished = False
+        unresolved = 0
+        try:
+            self.analyze_stream(reviews, True, on_result)
+            unresolved = self.retry_failures(failed, self.analyze_review, record, 'fused')
+            finished = True
+        finally:
+            self.end_run(checkpoint, finished)
+
+        analyzed = completed[0] - done - unresolved
+        if analyzed:
+            self.log_analysis(self.call_stats.savings_report(two_pass_estimate[0] / analyzed))
+        self.on_progress("Full analysis complete!", 100)
+        return analyzed
+
+    def run_full_analysis(self, fused=True):
+        """Sentiment and aspects for every review, in one pass or two"""
+        self.log_analysis("Starting full analysis...")
+        if fused:
+            self.run_fused_analysis()
+        else:
+            self.run_sentiment_analysis(then_aspects=True)
+            self.run_aspect_extraction(reset_metrics=False)
+        self.log_analysis("Full analysis complete!")
+
+    def export_run_report(self, path):
+        """Write the last run's call metrics: a JSON summary, or one row per call for a .csv path"""
+        self.call_stats.write_report(path)
+
+    def export_results(self, path, table='sentiment_results'):
+        """Stream every stored result with its review text to path, in the format its extension selects:
+        .json, .jsonl, .parquet (needs pyarrow), else a table in a SQLite database. Returns the result count"""
+        kind = export_format(path)
+        results = with_progress(self.store.iter_results_with_text(raw_aspects=kind != 'parquet'),
+                                self.aggregates.total, self.on_progress)
+        if kind == 'json':
+            return write_json(results, path)
+        if kind == 'jsonl':
+            return write_jsonl(results, path)
+        if kind == 'parquet':
+            return write_parquet(results, path)
+        return write_sqlite(results, path, table)
+
+    def write_back(self, table='sentiment_results'):
+        """Write every stored result into a table inside the reviews database, without the review text,
+        with one row per aspect mention in {table}_aspects; returns the result count"""
+        names = (table, f"{table}_aspects")
+        if self.source.table_name.lower() in (name.lower() for name in names) or any(map(is_results_table, names)):
+            raise ValueError(f"cannot write results over the {table!r} table")
+        results = with_progress(self.store.iter_results_with_text(raw_aspects=True), self.aggregates.total,
+                                self.on_progress, label="Writing back")
+        return write_sqlite(results, self.source.db_path, table, with_text=False)
@@ -0,0 +1,197 @@
+import multiprocessing
+import queue
+import time
+
+from request_scheduler import RateLimiter
+from result_aggregates import ResultAggregates
+from review_source import ReviewSource
+from sentiment_engine import AnalysisEngine
+
+# Run kinds a sharded run can do; the two-pass aspect pass reads the sentiment pass's results,
+# so it is left to a single process
+SHARDED_KINDS = ('fused', 'sentiment')
+
+# Shard workers report progress and their partial aggregates at most this often
+PROGRESS_SECONDS = 1.0
+
+
+class _ShardReporter:
+    """A shard worker's engine callbacks, sending its log lines and throttled progress to the parent"""
+
+    def __init__(self, shard, messages, forward_analysis):
+        self.shard = shard
+        self.messages = messages
+        self.forward_analysis = forward_analysis
+        self.engine = None
+        self.last = 0.0
+
+    def log_status(self, line):
+        self.messages.put(('status', self.shard, line))
+
+    def log_analysis(self, line):
+        if self.forward_analysis:
+            self.messages.put(('analysis', self.shard, line))
+
+    def on_progress(self, text, percent):
+        now = time.monotonic()
+        if now - self.last >= PROGRESS_SECONDS:
+            self.last = now
+            self.messages.put(('progress', self.shard, self.engine.call_stats.reviews,
+                               self.engine.aggregates.snapshot()))
+
+
+def _run_shard(shard, id_range, config, messages):
+    """Worker process: analyze one shard's reviews with its own backend, result cache, results store
+    and SQLite connections, saving under the parent's run"""
+    reporter = _ShardReporter(shard, messages, config['forward_analysis'])
+    engine = None
+    try:
+        engine = AnalysisEngine(backend=config['backend_factory'](), log_status=reporter.log_status,
+                                log_analysis=reporter.log_analysis, on_progress=reporter.on_progress)
+        reporter.engine = engine
+        engine.configure(rate_limiter=config['rate_limiter'], **config['settings'])
+        engine.shared_run_id = config['run_id']
+        engine.open_source(ReviewSource(config['db_path'], config['table_name'], config['text_column'], id_range,
+                                        config['spec']), use_cache=config['use_cache'])
+        if config['kind'] == 'fused':
+            analyzed = engine.run_fused_analysis()
+        else:
+            analyzed = engine.run_sentiment_analysis()
+        messages.put(('done', shard, analyzed, engine.aggregates.snapshot(), engine.call_stats.state()))
+    except Exception as e:
+        messages.put(('error', shard, str(e)))
+    finally:
+        if engine is not None:
+            engine.close()
+
+
+class ShardedRunner:
+    """Runs one analysis across a pool of processes, each analyzing a range of review ids.
+
+    The reviews the engine would analyze are split by id into `shards` ranges of about
+    equal size. Each worker process builds its own backend by calling backend_factory,
+    which must be picklable (a functools.partial of a backend class, say), and opens its
+    own result cache, results store and SQLite connections on the engine's database.
+    Workers draw on one requests-per-minute and tokens-per-minute budget, held in shared
+    memory by a RateLimiter this process creates, and save under one run record this
+    process starts and finishes, so an interrupted sharded run can be resumed like any
+    other. While they run, workers stream their partial aggregates back; the engine's
+    aggregates become the merge of the shards', which is what the summary is read from.
+
+    Workers' per-review log lines are only sent back with forward_analysis=True. Deduplication
+    groups reviews across the whole table, so it cannot be used sharded.
+    """
+
+    def __init__(self, engine, backend_factory, shards, requests_per_minute=3500, tokens_per_minute=90000,
+                 forward_analysis=False):
+        self.engine = engine
+        self.backend_factory = backend_factory
+        self.shards = max(1, int(shards))
+        self.forward_analysis = forward_analysis
+        # Spawned rather than forked, so no worker inherits the parent's open SQLite connections
+        self.context = multiprocessing.get_context('spawn')
+        self.rate_limiter = RateLimiter.shared(self.context, requests_per_minute, tokens_per_minute)
+        # shard -> its latest aggregates snapshot
+        self.partials = {}
+
+    def merged_aggregates(self):
+        """The shards' latest partial aggregates merged into one ResultAggregates"""
+        aggregates = ResultAggregates(self.engine.aspect_index)
+        for snapshot in self.partials.values():
+            aggregates.merge(snapshot)
+        return aggregates
+
+    def run(self, kind='fused'):
+        """Analyze every review that needs it, shard by shard in parallel; returns the number analyzed"""
+        engine = self.engine
+        if kind not in SHARDED_KINDS:
+            raise ValueError(f"a sharded run can only be one of: {', '.join(SHARDED_KINDS)}")
+        if engine.dedup_threshold is not None:
+            raise ValueError("deduplication compares reviews across the whole table, so it cannot run sharded")
+
+        reviews, total = engine.reviews_to_analyze(need_aspects=kind == 'fused')
+        points = engine.source.split_points(self.shards, reviews.join, reviews.condition)
+        bounds = [None] + points + [None]
+        ranges = list(zip(bounds, bounds[1:]))
+        engine.begin_run(kind, total, shards=len(ranges))
+        engine.log_analysis(f"Sharded run: {total} reviews in {len(ranges)} shards")
+        config = {
+            'kind': kind,
+            'run_id': engine.run_id,
+            'backend_factory': self.backend_factory,
+            'rate_limiter': self.rate_limiter,
+            'db_path': engine.source.db_path,
+            'table_name': engine.source.table_name,
+            'text_column': engine.source.text_column_name,
+            'spec': engine.source.spec,
+            'use_cache': engine.cache is not None,
+            'forward_analysis': self.forward_analysis,
+            'settings': {
+                'concurrency': engine.scheduler.concurrency,
+                'batch_size': engine.batch_size,
+                'incremental': engine.incremental,
+                'local_threshold': engine.local_threshold,
+                'prompt_version': engine.prompt_version,
+                'structured_output': engine.structured_output
+            }
+        }
+        messages = self.context.Queue()
+        workers = [self.context.Process(target=_run_shard, args=(shard, id_range, config, messages), daemon=True)
+                   for shard, id_range in enumerate(ranges)]
+        for worker in workers:
+            worker.start()
+
+        self.partials = {}
+        progress = {}
+        analyzed = 0
+        finished = False
+        errors = {}
+        try:
+            reported = set()
+            while len(reported) < len(workers):
+                try:
+                    message = messages.get(timeout=PROGRESS_SECONDS)
+                except queue.Empty:
+                    # A worker that exited without reporting was killed or crashed
+                    for shard, worker in enumerate(workers):
+                        if shard not in reported and not worker.is_alive() and messages.empty():
+                            errors[shard] = f"exited with code {worker.exitcode}"
+                            reported.add(shard)
+                    continue
+                what, shard = message[:2]
+                if what == 'status':
+                    engine.log_status(f"[shard {shard}] {message[2]}")
+                elif what == 'analysis':
+                    engine.log_analysis(f"[shard {shard}] {message[2]}")
+                elif what == 'progress':
+                    progress[shard] = message[2]
+                    self.partials[shard] = message[3]
+                    if len(self.partials) == len(workers):
+                        engine.aggregates = self.merged_aggregates()
+                    done = sum(progress.values())
+                    engine.on_progress(f"Analyzing review {done}/{total} in {len(workers)} shards...",
+                                       done / max(total, 1) * 100)
+                elif what == 'done':
+                    analyzed += message[2]
+                    self.partials[shard] = message[3]
+                    engine.call_stats.merge(message[4])
+                    reported.add(shard)
+                else:
+                    errors[shard] = message[2]
+                    reported.add(shard)
+            for shard, error in sorted(errors.items()):
+                engine.log_status(f"Shard {shard} failed: {error}")
+            finished = not errors
+        finally:
+            for worker in workers:
+                worker.join(timeout=5)
+                if worker.is_alive():
+                    worker.terminate()
+            engine.store.finish_run(engine.run_id, 'complete' if finished else 'interrupted')
+            engine.run_id = None
+
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(workers)} shards failed; resume the run to finish it")
+        engine.aggregates = self.merged_aggregates()
+        engine.on_progress("Sharded analysis complete!", 100)
+        return analyzed
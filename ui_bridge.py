@@ -0,0 +1,67 @@
+import queue
+import time
+import tkinter as tk
+
+
+class UIBridge:
+    """Queue of UI updates posted by worker threads and applied on the Tk main loop.
+
+    Workers never touch widgets directly. Every interval_ms the main loop drains
+    the queue: log lines are joined into one insert per widget, only the latest
+    progress state is drawn, and queued calls run in the order they were posted.
+    """
+
+    def __init__(self, root, interval_ms=50, max_log_lines=5000, time_budget=0.05):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.max_log_lines = max_log_lines
+        self.time_budget = time_budget
+        self.events = queue.SimpleQueue()
+        self.root.after(self.interval_ms, self._drain)
+
+    def log(self, widget, line):
+        self.events.put(('log', widget, line))
+
+    def progress(self, label, bar, text, value):
+        self.events.put(('progress', label, bar, text, value))
+
+    def call(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on the main loop"""
+        self.events.put(('call', func, args, kwargs))
+
+    def _flush(self, logs, progress):
+        for widget, lines in logs.items():
+            widget.insert(tk.END, "".join(lines))
+            # Cap scrollback so long runs don't grow the text widget without bound
+            line_count = int(widget.index('end-1c').split('.')[0])
+            if line_count > self.max_log_lines:
+                widget.delete('1.0', f"{line_count - self.max_log_lines + 1}.0")
+            widget.see(tk.END)
+        for label, (bar, text, value) in progress.items():
+            label.config(text=text)
+            bar['value'] = value
+        logs.clear()
+        progress.clear()
+
+    def _drain(self):
+        logs = {}
+        progress = {}
+        deadline = time.perf_counter() + self.time_budget
+        try:
+            while time.perf_counter() < deadline:
+                try:
+                    event = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                kind = event[0]
+                if kind == 'log':
+                    logs.setdefault(event[1], []).append(event[2])
+                elif kind == 'progress':
+                    progress[event[1]] = event[2:]
+                else:
+                    # Apply earlier updates first so calls see the UI in posting order
+                    self._flush(logs, progress)
+                    event[1](*event[2], **event[3])
+            self._flush(logs, progress)
+        finally:
+            self.root.after(self.interval_ms, self._drain)